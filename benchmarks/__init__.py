@@ -0,0 +1,4 @@
+import os
+
+# benchmarks never open a window, so run them on the headless tcod backend
+os.environ.setdefault('MEDICALRL_HEADLESS', '1')
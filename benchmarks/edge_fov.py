@@ -0,0 +1,69 @@
+"""
+Microbenchmark for reads at the edges of a level.
+
+FOV near the map edge and checks like floors_in_or_by_rect read lots of
+positions outside the map. This times those reads and reports how much
+memory they allocate.
+
+Run from the repository root:
+
+    python -m benchmarks.edge_fov
+"""
+import time
+import tracemalloc
+from constants import FOV_RADIUS, MAP_WIDTH, MAP_HEIGHT
+import fov
+import mob  # imported before world to resolve the world -> mob cycle
+import world
+from util import Pos
+
+
+REPEATS = 20
+
+
+def open_level():
+    """A level that is all floor, so FOV reaches the map edges."""
+    level = world.Level(MAP_WIDTH, MAP_HEIGHT)
+    world.dig_rect(level, world.Rect(0, 0, MAP_WIDTH - 1, MAP_HEIGHT - 1))
+    return level
+
+
+def out_of_bounds_positions(level, distance):
+    positions = []
+    for x in range(-distance, level.width + distance):
+        for y in range(-distance, 0):
+            positions.append(Pos(x, y))
+            positions.append(Pos(x, level.height - 1 - y))
+    return positions
+
+
+def measure(name, func):
+    func()
+    start = time.perf_counter()
+    for i in range(REPEATS):
+        func()
+    elapsed = (time.perf_counter() - start) / REPEATS
+    tracemalloc.start()
+    result = func()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("{:<32} {:>9.3f} ms {:>10.1f} KiB peak".format(
+        name, elapsed * 1000, peak / 1024))
+    return result
+
+
+def main():
+    level = open_level()
+    positions = out_of_bounds_positions(level, FOV_RADIUS)
+    tiles = measure("out of bounds level[pos]",
+                    lambda: [level[pos] for pos in positions])
+    print("  {} reads, {} distinct tile objects".format(
+        len(tiles), len(set(map(id, tiles)))))
+    measure("out of bounds is_opaque",
+            lambda: [level.is_opaque(pos) for pos in positions])
+    measure("fov at map corner, radius {}".format(FOV_RADIUS),
+            lambda: set(fov.calculate_fov(Pos(2, 2), FOV_RADIUS, level)))
+
+
+if __name__ == '__main__':
+    main()
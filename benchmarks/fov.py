@@ -0,0 +1,55 @@
+"""
+Benchmark for FOV at FOV_RADIUS on a generated hospital, comparing the
+iterative FovMap engine with the recursive reference implementation.
+
+Run from the repository root:
+
+    python -m benchmarks.fov
+"""
+import rng
+import time
+from constants import FOV_RADIUS
+import fov
+import mob  # imported before world to resolve the world -> mob cycle
+import world
+
+
+SEED = 1
+POSITIONS = 50
+REPEATS = 5
+
+
+def time_per_call(func, positions):
+    for pos in positions:
+        func(pos)
+    start = time.perf_counter()
+    for i in range(REPEATS):
+        for pos in positions:
+            func(pos)
+    return (time.perf_counter() - start) / (REPEATS * len(positions))
+
+
+def main():
+    rng.seed(SEED)
+    level = world.generate_hospital()
+    positions = [world.get_random_passable_position(level)
+                 for i in range(POSITIONS)]
+    fov_map = fov.FovMap(level)
+
+    recursive = time_per_call(
+        lambda pos: set(fov.calculate_fov_recursive(pos, FOV_RADIUS, level)),
+        positions)
+    bitmap = time_per_call(
+        lambda pos: fov_map.compute(pos, FOV_RADIUS), positions)
+    listed = time_per_call(
+        lambda pos: fov.calculate_fov(pos, FOV_RADIUS, level), positions)
+
+    for name, seconds in (("recursive reference", recursive),
+                          ("FovMap.compute", bitmap),
+                          ("calculate_fov", listed)):
+        print("{:<20} {:>9.1f} us  {:>6.1f}x".format(
+            name, seconds * 1e6, recursive / seconds))
+
+
+if __name__ == '__main__':
+    main()
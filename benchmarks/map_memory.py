@@ -0,0 +1,77 @@
+"""
+Benchmark for the size of the player's memory of a fully explored hospital,
+comparing the old dict of per-position TileMemory objects with the glyph id
+arrays of ui.MapMemory.
+
+Run from the repository root:
+
+    python -m benchmarks.map_memory
+"""
+import rng
+import time
+import tracemalloc
+import mob  # imported before world to resolve the world -> mob cycle
+import ui
+from util import Pos
+import world
+
+
+SEED = 1
+
+
+class LegacyTileMemory(object):
+
+    def __init__(self, tile_name, mob=None, item=None):
+        self.tile_name = tile_name
+        self.mob = mob
+        self.item = item
+
+
+def legacy_memory(level, positions):
+    memory = {}
+    vision = set()
+    for pos in positions:
+        vision.add(pos)
+        memory[pos] = LegacyTileMemory(level[pos].name, level.get_mob(pos),
+                                       level.get_object(pos))
+    return memory, vision
+
+
+def map_memory(level, indices):
+    memory = ui.MapMemory(level.width, level.height)
+    memory.reveal(level, indices)
+    return memory
+
+
+def measure(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size, seconds
+
+
+def main():
+    rng.seed(SEED)
+    level = world.generate_hospital()
+    # positions are built outside the measurement; the legacy dict shares
+    # them as keys, MapMemory does not keep them at all
+    positions = [Pos(x, y)
+                 for x in range(level.width) for y in range(level.height)]
+    indices = [level.index(x, y) for x, y in positions]
+    ui.palette.tile_ids()
+
+    legacy, legacy_size, legacy_seconds = measure(legacy_memory, level,
+                                                  positions)
+    arrays, arrays_size, arrays_seconds = measure(map_memory, level, indices)
+    for name, size, seconds in (
+            ("dict of TileMemory", legacy_size, legacy_seconds),
+            ("MapMemory", arrays_size, arrays_seconds)):
+        print("{:<20} {:>9.1f} KiB  {:>5.1f}%  {:>8.2f} ms to fill".format(
+            name, size / 1024, 100 * size / legacy_size, seconds * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark for how mobs find their way, comparing Game.get_next_step with
+every group always sharing a flow field, as it first did, and with every mob
+planning its own route with A*.
+
+Times the calls to Game.get_next_step in two scenarios, with the player
+standing still and every door open: groups wandering between nearby cells,
+as they do on their own, and groups that are sent off to a cell far away
+every so often.
+
+Run from the repository root:
+
+    python -m benchmarks.mobs
+"""
+import contextlib
+import io
+import os
+import statistics
+
+os.environ.setdefault('MEDICALRL_HEADLESS', '1')
+
+import rng
+import simulate
+import world
+
+
+SEED = 1
+MOBS = 30
+TURNS = 1000
+REPEATS = 5
+# in the converging scenario, every LEG turns each group is sent to a cell
+# between NEAR and FAR steps away, within the reach of a flow field
+NEAR = 12
+FAR = 24
+LEG = 50
+
+
+class Wait(simulate.Policy):
+    def act(self, game):
+        pass
+
+
+def always_fields(game):
+    """Game.get_next_step before it left short hops to the route cache."""
+    def get_next_step(mob, level):
+        if mob.leader is not None or mob.followers:
+            field = game.flow_fields.get(level, mob.target)
+            if field.covers(mob.pos):
+                return field.next_step(mob.pos)
+        return game.routes.next_step(mob, level)
+    return get_next_step
+
+
+def routes_only(game):
+    return game.routes.next_step
+
+
+def current(game):
+    return game.get_next_step
+
+
+def open_doors(level):
+    for pos, obj in list(level.objects.items()):
+        if obj.interaction == world.Interactions.OPEN_DOOR:
+            level.objects[pos] = world.create_object(pos, 'open door')
+
+
+def send_groups_far(game):
+    level = game.player_level
+    for leader in list(level.mobs.values()):
+        if leader.leader is not None:
+            continue
+        target = leader.pos
+        while not NEAR <= max(abs(target.x - leader.pos.x),
+                              abs(target.y - leader.pos.y)) <= FAR:
+            target = world.get_random_passable_position(level)
+        for member in [leader] + leader.followers:
+            member.target = target
+
+
+def run(strategy, converging):
+    """
+    Returns the seconds spent finding the way, the flow fields computed and
+    the routes planned in a game played with strategy.
+    """
+    simulation = simulate.Simulation(Wait, SEED, MOBS)
+    game = simulation.game
+    game.get_next_step = simulation.timings.wrap('paths', strategy(game))
+    rng.seed(SEED)
+    open_doors(game.player_level)
+    for turn in range(0, TURNS, LEG):
+        if converging:
+            send_groups_far(game)
+        simulation.run(LEG)
+    simulation.close()
+    return (simulation.timings.seconds['paths'], game.flow_fields.computed,
+            game.routes.replans)
+
+
+def main():
+    strategies = (("always flow fields", always_fields),
+                  ("A* routes only", routes_only),
+                  ("current", current))
+    for scenario, converging in (("wandering", False), ("converging", True)):
+        print(scenario)
+        results = {name: [] for name, strategy in strategies}
+        # interleaved, so that a slow spell does not favour any of them
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(REPEATS):
+                for name, strategy in strategies:
+                    results[name].append(run(strategy, converging))
+        for name, strategy in strategies:
+            seconds = statistics.median(result[0] for result in results[name])
+            fields, plans = results[name][0][1:]
+            print("  {:<19} {:>8.1f} us/turn  {:>5} fields  {:>5} "
+                  "plans".format(name, seconds * 1e6 / TURNS, fields, plans))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark for path.get_path on random pairs of positions in generated
+hospitals, compared with the greedy best-first search it replaced.
+
+Run from the repository root:
+
+    python -m benchmarks.path
+"""
+import heapq
+import rng
+import time
+from constants import DIRECTIONS
+import mob  # imported before world to resolve the world -> mob cycle
+import path
+import world
+
+
+SEED = 1
+LEVELS = 3
+PAIRS = 100
+
+
+def legacy_get_path(from_pos, to_pos, level):
+    """path.get_path before it became A*."""
+    if level.is_blocked(to_pos) or from_pos == to_pos:
+        return []
+
+    def get_walkable_adjacent_tiles(source_pos):
+        adjacent = (source_pos + direction for direction in DIRECTIONS)
+        return (pos for pos in adjacent if pos not in found and
+                (pos == to_pos or not level.is_blocked(pos)))
+
+    def heuristic(pos):
+        return min(abs(pos.x - to_pos.x), abs(pos.y - to_pos.y))
+
+    class Node(object):
+        def __init__(self, pos, parent=None):
+            self.pos = pos
+            self.priority = heuristic(pos)
+            self.parent = parent
+
+        def get_path(self):
+            path = []
+            node = self
+            while node:
+                path.insert(0, node.pos)
+                node = node.parent
+            return path
+
+        def __lt__(self, other):
+            return self.priority < other.priority
+
+    found = set([from_pos])
+    starts = list(get_walkable_adjacent_tiles(from_pos))
+
+    if to_pos in starts:
+        return [to_pos]
+
+    queue = []
+    for pos in starts:
+        heapq.heappush(queue, Node(pos))
+
+    while queue:
+        node = heapq.heappop(queue)
+        for new_pos in get_walkable_adjacent_tiles(node.pos):
+            if new_pos in found:
+                continue
+            if new_pos == to_pos:
+                return Node(new_pos, node).get_path()
+            heapq.heappush(queue, Node(new_pos, node))
+            found.add(new_pos)
+    return []
+
+
+def run(get_path, cases):
+    start = time.perf_counter()
+    total_length = 0
+    for level, from_pos, to_pos in cases:
+        total_length += len(get_path(from_pos, to_pos, level))
+    return time.perf_counter() - start, total_length / len(cases)
+
+
+def main():
+    rng.seed(SEED)
+    cases = []
+    for i in range(LEVELS):
+        level = world.generate_hospital()
+        for j in range(PAIRS):
+            cases.append((level,
+                          world.get_random_passable_position(level),
+                          world.get_random_passable_position(level)))
+    run(path.get_path, cases[:10])
+
+    for name, get_path in (("legacy best-first", legacy_get_path),
+                           ("A*", path.get_path)):
+        seconds, length = run(get_path, cases)
+        print("{:<18} {:>8.3f} ms/path  {:>6.1f} steps/path".format(
+            name, seconds * 1000 / len(cases), length))
+
+
+if __name__ == '__main__':
+    main()
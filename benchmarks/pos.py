@@ -0,0 +1,87 @@
+"""
+Benchmark for set and dict heavy work with positions, modelled on
+Game.update_fov: every step builds the set of visible positions, diffs it
+against the previous one and updates a memory dict keyed by position.
+
+Compares util.Pos with the previous plain-object implementation.
+
+Run from the repository root:
+
+    python -m benchmarks.pos
+"""
+import time
+from util import Pos
+
+
+RADIUS = 10
+STEPS = 200
+REPEATS = 5
+
+
+class LegacyPos(object):
+    """util.Pos before it became a tuple subclass."""
+
+    def __init__(self, x_or_tuple, y=None):
+        if isinstance(x_or_tuple, LegacyPos):
+            self.x, self.y = x_or_tuple
+        elif isinstance(x_or_tuple, tuple):
+            self.x, self.y = x_or_tuple
+        else:
+            self.x = x_or_tuple
+            self.y = y
+
+    def __eq__(self, pos):
+        return self[:] == pos[:]
+
+    def __add__(self, pos):
+        return LegacyPos(self.x + pos.x, self.y + pos.y)
+
+    def __getitem__(self, i):
+        return (self.x, self.y)[i]
+
+    def __hash__(self):
+        return hash((self.x, self.y))
+
+
+def update_fov_workload(pos_class):
+    offsets = [pos_class(dx, dy)
+               for dx in range(-RADIUS, RADIUS + 1)
+               for dy in range(-RADIUS, RADIUS + 1)]
+    step = pos_class(1, 0)
+    pos = pos_class(50, 50)
+    memory = {}
+    in_sight = set()
+    for i in range(STEPS):
+        if i == STEPS // 2:
+            step = pos_class(0, 1)
+        pos = pos + step
+        new_fov = set(pos + offset for offset in offsets)
+        for hidden in in_sight.difference(new_fov):
+            memory[hidden] = False
+        for revealed in new_fov.difference(in_sight):
+            memory[revealed] = True
+        in_sight = new_fov
+        for offset in offsets:
+            if pos + offset not in memory:
+                raise AssertionError
+    return len(memory)
+
+
+def time_workload(pos_class):
+    update_fov_workload(pos_class)
+    start = time.perf_counter()
+    for i in range(REPEATS):
+        update_fov_workload(pos_class)
+    return (time.perf_counter() - start) / REPEATS
+
+
+def main():
+    legacy = time_workload(LegacyPos)
+    current = time_workload(Pos)
+    print("{:<12} {:>9.2f} ms".format("LegacyPos", legacy * 1000))
+    print("{:<12} {:>9.2f} ms".format("Pos", current * 1000))
+    print("speedup      {:>9.2f}x".format(legacy / current))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark for a full map window redraw over a fully remembered hospital,
+comparing a cell by cell redraw with the vectorized redraw_level,
+and of the incremental draw after a one-cell step of the view.
+Uses the headless tcod backend.
+
+Run from the repository root:
+
+    python -m benchmarks.render
+"""
+import rng
+import time
+import mob  # imported before world to resolve the world -> mob cycle
+import ui
+from util import Pos
+import world
+
+
+SEED = 1
+CENTERS = 20
+REPEATS = 5
+
+
+def draw_per_cell(window):
+    """
+    Redraws window from its layers one cell at a time, the way the map
+    window drew before redraw_level. Kept as the reference redraw_level is
+    checked and timed against.
+    """
+    layers = window.layers
+    window.clear()
+    for x in range(window.width):
+        for y in range(window.height):
+            window_pos = Pos(x, y)
+            map_pos = window.get_map_pos(window_pos)
+            if not layers.in_map(map_pos):
+                continue
+            map_x, map_y = map_pos
+            terrain = layers.terrain[map_y, map_x]
+            if not terrain:
+                continue
+            remembered = not layers.visible[map_y, map_x]
+            for glyph_id in (terrain, layers.objects[map_y, map_x],
+                             layers.mobs[map_y, map_x]):
+                if glyph_id:
+                    ui.palette.glyphs[glyph_id].draw(
+                        window.console, window_pos, remembered)
+
+
+def time_per_call(func, centers):
+    for pos in centers:
+        func(pos)
+    start = time.perf_counter()
+    for i in range(REPEATS):
+        for pos in centers:
+            func(pos)
+    return (time.perf_counter() - start) / (REPEATS * len(centers))
+
+
+def main():
+    rng.seed(SEED)
+    ui.init_tcod()
+    level = world.generate_hospital()
+    window = ui.MapWindow(0, 0, ui.SCREEN_WIDTH // 2, ui.SCREEN_HEIGHT - 1)
+    window.layers = ui.MapMemory(level.width, level.height)
+    indices = [level.index(x, y)
+               for x in range(level.width) for y in range(level.height)]
+    window.layers.reveal(level, indices)
+    window.layers.hide(level, indices)
+    centers = [world.get_random_passable_position(level)
+               for i in range(CENTERS)]
+
+    def per_cell(center):
+        window.center(center)
+        draw_per_cell(window)
+
+    def vectorized(center):
+        window.center(center)
+        window.redraw_level(window.layers)
+
+    def step(center):
+        # step right and back, so every draw scrolls by one cell
+        window.move(Pos(1, 0))
+        window.draw()
+        window.move(Pos(-1, 0))
+        window.draw()
+
+    reference = time_per_call(per_cell, centers)
+    vectorized = time_per_call(vectorized, centers)
+    stepped = time_per_call(step, centers) / 2
+    for name, seconds in (("per-cell redraw", reference),
+                          ("redraw_level", vectorized),
+                          ("draw after a step", stepped)):
+        print("{:<20} {:>9.1f} us  {:>6.1f}x".format(
+            name, seconds * 1e6, reference / seconds))
+
+
+if __name__ == '__main__':
+    main()
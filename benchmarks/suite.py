@@ -0,0 +1,243 @@
+"""
+The benchmark suite: times world generation, FOV, path finding, vitals
+ticks, the player's FOV update and map redraws, and prints the results as
+JSON, with the median and percentiles of each, so that two builds can be
+compared.
+
+Every benchmark seeds the random streams before it sets up, so a seed gives
+the same hospitals and positions whichever benchmarks run. Each one runs its
+cases once to warm up before it is timed.
+
+Run from the repository root:
+
+    python -m benchmarks > before.json
+    python -m benchmarks --compare before.json
+
+The other modules in benchmarks/ compare implementations against the ones
+they replaced; see their docstrings.
+"""
+import argparse
+from collections import OrderedDict
+import contextlib
+from functools import partial
+import json
+import platform
+import sys
+import time
+import numpy
+import fov
+import game
+import mob  # imported before world to resolve the world -> mob cycle
+import path
+import rng
+import ui
+import vitals
+import world
+
+
+SEED = 1
+REPEATS = 5
+WARMUP = 1
+POSITIONS = 50
+PERCENTILES = (5, 25, 75, 95, 99)
+
+# name: generator function that sets the benchmark up, see benchmark()
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    """
+    Registers a benchmark. The decorated generator function sets it up,
+    yields the cases to time as functions without arguments, and tears down
+    whatever it set up once they have run. Each call is timed on its own.
+
+    Cases that change what later ones run on can be yielded as a function
+    that builds them afresh; it is called, untimed, before every round.
+    """
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def random_positions(level, count=POSITIONS):
+    return [world.get_random_passable_position(level) for i in range(count)]
+
+
+@benchmark('worldgen')
+def worldgen():
+    yield [world.generate_hospital] * 20
+
+
+def fov_cases(radius):
+    level = world.generate_hospital()
+    yield [partial(fov.calculate_fov, pos, radius, level)
+           for pos in random_positions(level)]
+
+
+benchmark('fov_radius_5')(partial(fov_cases, 5))
+benchmark('fov_radius_40')(partial(fov_cases, 40))
+
+
+@benchmark('path')
+def get_path():
+    level = world.generate_hospital()
+    yield [partial(path.get_path, from_pos, to_pos, level)
+           for from_pos, to_pos in zip(random_positions(level, 100),
+                                       random_positions(level, 100))]
+
+
+@benchmark('body_on_tick')
+def body_on_tick(turns=100):
+    """
+    The first turns turns of a body with both preexisting conditions, for
+    each disease. Every round starts from new bodies.
+    """
+    def fresh_bodies():
+        cases = []
+        for disease in vitals.diseases:
+            body = vitals.Body({}, None)
+            body.on_game_start({
+                'ADDITIONAL_FATIGUE': [disease.additional_fatigue],
+                'PREEXISTING_CONDITIONS': {
+                    name: condition() for name, condition
+                    in vitals.preexisting_conditions.items()}})
+            body.sc('disease', type(disease)())
+            cases += [body.on_tick] * turns
+        return cases
+    yield fresh_bodies
+
+
+@benchmark('game_update_fov')
+def game_update_fov():
+    """The player walking between random positions, with every door open."""
+    play = game.Game(seed=rng.generation.randrange(2 ** 32), headless=True)
+    player = play.world.player
+    level = play.player_level
+    for pos, obj in list(level.objects.items()):
+        if obj.interaction == world.Interactions.OPEN_DOOR:
+            level.objects[pos] = world.create_object(pos, 'open door')
+    walk = [player.pos]
+    for to_pos in random_positions(level, 20):
+        walk += path.get_path(walk[-1], to_pos, level)
+
+    def step(pos):
+        player.pos = pos
+        play.update_fov()
+    yield [partial(step, pos) for pos in walk]
+    play.close()
+
+
+@benchmark('map_window_redraw_level')
+def redraw_level():
+    """A full redraw over a fully remembered hospital."""
+    ui.init_tcod()
+    level = world.generate_hospital()
+    window = ui.MapWindow(0, 0, ui.SCREEN_WIDTH // 2, ui.SCREEN_HEIGHT - 1)
+    window.layers = ui.MapMemory(level.width, level.height)
+    indices = [level.index(x, y)
+               for x in range(level.width) for y in range(level.height)]
+    window.layers.reveal(level, indices)
+    window.layers.hide(level, indices)
+
+    def redraw(center):
+        window.center(center)
+        window.redraw_level(window.layers)
+    yield [partial(redraw, pos) for pos in random_positions(level, 20)]
+
+
+def run(name, seed=SEED, repeats=REPEATS, warmup=WARMUP):
+    """Returns the seconds each call to the cases of benchmark name took."""
+    rng.seed(seed)
+    setup = BENCHMARKS[name]()
+    cases = next(setup)
+    make_cases = cases if callable(cases) else lambda: cases
+    for i in range(warmup):
+        for case in make_cases():
+            case()
+    clock = time.perf_counter
+    samples = []
+    for i in range(repeats):
+        for case in make_cases():
+            start = clock()
+            case()
+            samples.append(clock() - start)
+    next(setup, None)
+    return samples
+
+
+def summarize(samples):
+    """Statistics of samples, in microseconds."""
+    samples = numpy.array(samples) * 1e6
+    result = OrderedDict([('samples', len(samples)),
+                          ('median', numpy.median(samples)),
+                          ('mean', samples.mean()),
+                          ('min', samples.min()),
+                          ('max', samples.max())])
+    for percentile, value in zip(PERCENTILES,
+                                 numpy.percentile(samples, PERCENTILES)):
+        result['p{}'.format(percentile)] = value
+    return OrderedDict((key, value if key == 'samples'
+                        else round(float(value), 3))
+                       for key, value in result.items())
+
+
+def compare(results, baseline):
+    """Returns lines comparing the medians in results with baseline's."""
+    lines = ['{:<26} {:>11} {:>11} {:>7}'.format(
+        'benchmark', 'before us', 'after us', 'ratio')]
+    before = baseline['benchmarks']
+    for name, stats in results['benchmarks'].items():
+        if name not in before:
+            continue
+        lines.append('{:<26} {:>11.1f} {:>11.1f} {:>6.2f}x'.format(
+            name, before[name]['median'], stats['median'],
+            stats['median'] / before[name]['median']))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Times the game and prints the results as JSON.')
+    parser.add_argument('names', nargs='*', metavar='benchmark',
+                        help='benchmarks to run, all if none of: ' +
+                             ', '.join(BENCHMARKS))
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--repeats', type=int, default=REPEATS,
+                        help='times to run the cases of each benchmark')
+    parser.add_argument('--warmup', type=int, default=WARMUP,
+                        help='untimed runs of the cases before the timed ones')
+    parser.add_argument('--output', help='write the JSON here, not stdout')
+    parser.add_argument('--compare', metavar='JSON',
+                        help='print how the medians changed from an earlier '
+                             'run to stderr')
+    args = parser.parse_args(argv)
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: ' + name)
+
+    results = OrderedDict([
+        ('seed', args.seed), ('repeats', args.repeats),
+        ('warmup', args.warmup), ('unit', 'us'),
+        ('python', platform.python_version()),
+        ('benchmarks', OrderedDict())])
+    # the game prints as it goes, so keep that out of the JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        for name in args.names or BENCHMARKS:
+            results['benchmarks'][name] = summarize(
+                run(name, args.seed, args.repeats, args.warmup))
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print('\n'.join(compare(results, baseline)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
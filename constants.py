@@ -44,4 +44,15 @@ DIRECTIONS = set(DIRECTION_KEYS.values())
 
 FOV_RADIUS = 40
 
+# most cells a mob's path search may expand in one turn
+MAX_PATH_NODES = 1000
+
+# how far (in path cost, 10 per straight step) shared mob flow fields reach
+# at most
+FLOW_FIELD_MAX_COST = 300
+# mobs share a flow field only when at least this many of a group head for
+# the same target from at least this many steps away; shorter hops use A*
+FLOW_FIELD_MIN_MOBS = 3
+FLOW_FIELD_MIN_STEPS = 8
+
 MAX_INVENTORY_SIZE = 26
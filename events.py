@@ -1,6 +1,12 @@
+from collections import Counter, defaultdict
 from enum import Enum
+import os
+import time
 import tcod
 
+# set to get a report of event dispatch counts and timings at game over
+STATS_VARIABLE = 'MEDICALRL_EVENT_STATS'
+
 
 class EventType(Enum):
     SOUND = 1
@@ -13,6 +19,8 @@ class EventType(Enum):
     PLAYER_STATUS_UPDATE = 8
     REMOVAL = 9
     GAME_OVER = 10
+    TILES_REVEALED = 11
+    TILES_HIDDEN = 12
 
 
 class MoveInfo(object):
@@ -29,32 +37,268 @@ class Event(object):
         self.info = info
 
 
+# while events are queued, later events with the same key as a queued one
+# are dropped: a mob's moves merge into one from its first position to
+# wherever it is at delivery, and status updates into one
+COALESCE_KEYS = {
+    EventType.MOVE: lambda event: event.info.mob,
+    EventType.PLAYER_STATUS_UPDATE: lambda event: event.info,
+}
+
+
+class Subscription(object):
+    """
+    A callback registered with an EventHandler. Whoever subscribes owns the
+    subscription and closes it when done with it. Immediate callbacks keep
+    being called as events are sent while the handler queues events.
+    """
+
+    def __init__(self, handler, event_type, callback, priority,
+                 immediate=False):
+        self.handler = handler
+        self.event_type = event_type
+        self.callback = callback
+        self.priority = priority
+        self.immediate = immediate
+
+    @property
+    def active(self):
+        return self in self.handler.callbacks[self.event_type]
+
+    def close(self):
+        self.handler.remove_subscription(self)
+
+    def __repr__(self):
+        return '<Subscription {} -> {}>'.format(
+            self.event_type.name, getattr(self.callback, '__qualname__',
+                                          self.callback))
+
+
+class EventStats(object):
+    """
+    What an instrumented EventHandler dispatched: events of each type per
+    turn, time spent in each callback (including events it sent itself),
+    how deep sends nested and, when queued, how many events waited.
+    """
+
+    def __init__(self):
+        self.turns = [Counter()]
+        self.calls = Counter()
+        self.total_time = defaultdict(float)
+        self.max_time = defaultdict(float)
+        self.depth = 0
+        self.max_depth = 0
+        self.max_queued = 0
+        self.coalesced = 0
+        self.dumped = False
+
+    def end_turn(self):
+        self.turns.append(Counter())
+
+    def record(self, subscription, seconds):
+        key = (subscription.event_type.name,
+               getattr(subscription.callback, '__qualname__',
+                       repr(subscription.callback)))
+        self.calls[key] += 1
+        self.total_time[key] += seconds
+        if seconds > self.max_time[key]:
+            self.max_time[key] = seconds
+
+    def report(self):
+        turns = [turn for turn in self.turns if turn] or [Counter()]
+        totals = Counter()
+        for turn in turns:
+            totals.update(turn)
+        callbacks = Counter()
+        for (event_type, name), calls in self.calls.items():
+            callbacks[event_type] += calls
+
+        lines = ['Events over {} turns, sends nested up to {} deep, up to '
+                 '{} queued, {} coalesced'.format(
+                     len(turns), self.max_depth, self.max_queued,
+                     self.coalesced),
+                 '{:<22} {:>8} {:>9} {:>7} {:>8}'.format(
+                     'event', 'total', 'per turn', 'max', 'fan-out')]
+        for event_type, total in totals.most_common():
+            lines.append('{:<22} {:>8} {:>9.1f} {:>7} {:>8.1f}'.format(
+                event_type.name, total, total / len(turns),
+                max(turn[event_type] for turn in turns),
+                callbacks[event_type.name] / total))
+        lines.append('{:<54} {:>8} {:>9} {:>9}'.format(
+            'callback', 'calls', 'total ms', 'max ms'))
+        for key in sorted(self.total_time, key=self.total_time.get,
+                          reverse=True):
+            lines.append('{:<54} {:>8} {:>9.2f} {:>9.3f}'.format(
+                '{} {}'.format(*key), self.calls[key],
+                self.total_time[key] * 1e3, self.max_time[key] * 1e3))
+        return '\n'.join(lines)
+
+    def dump(self):
+        """Prints the report, once."""
+        if not self.dumped:
+            self.dumped = True
+            print(self.report())
+
+
 class EventHandler(object):
+    """
+    Sends events to the callbacks subscribed to their type, in order of
+    priority. Each game has its own handler; see use().
+
+    send and end_turn are swapped for their instrumented versions by
+    instrument(), so an uninstrumented handler pays nothing for it. Likewise
+    send is swapped for queue_event by start_queue().
+    """
 
     def __init__(self):
         self.callbacks = {event_type: [] for event_type in EventType}
         self.send = self.handle_event
+        self.stats = None
+        self.queue = None
+        self.coalesced = set()
+        if os.environ.get(STATS_VARIABLE):
+            self.instrument()
+
+    def instrument(self):
+        self.stats = EventStats()
+        if self.queue is None:
+            self.send = self.handle_event_instrumented
+        self.call = self.call_timed
+        self.end_turn = self.stats.end_turn
+
+    def start_queue(self):
+        """
+        Holds events back from callbacks that are not immediate until
+        flush(), coalescing them by COALESCE_KEYS.
+        """
+        if self.queue is None:
+            self.queue = []
+            self.send = self.queue_event
+
+    def stop_queue(self):
+        self.flush()
+        self.queue = None
+        self.send = self.handle_event if self.stats is None \
+            else self.handle_event_instrumented
 
-    def add_callback(self, event_type, callback, priority=1):
-        self.callbacks[event_type].append((callback, priority))
-        self.callbacks[event_type].sort(
-            key=lambda x: x[1])
+    def add_callback(self, event_type, callback, priority=1,
+                     immediate=False):
+        """Returns the Subscription, for the caller to close."""
+        subscription = Subscription(self, event_type, callback, priority,
+                                    immediate)
+        # lists are replaced rather than changed, so that callbacks can
+        # subscribe and unsubscribe while an event is being handled
+        self.callbacks[event_type] = sorted(
+            self.callbacks[event_type] + [subscription],
+            key=lambda x: x.priority)
+        return subscription
 
     def handle_event(self, event):
-        for (callback, priority) in self.callbacks[event.event_type]:
-            callback(event)
+        for subscription in self.callbacks[event.event_type]:
+            subscription.callback(event)
+
+    def handle_event_instrumented(self, event):
+        stats = self.stats
+        stats.turns[-1][event.event_type] += 1
+        stats.depth += 1
+        stats.max_depth = max(stats.max_depth, stats.depth)
+        for subscription in self.callbacks[event.event_type]:
+            self.call_timed(subscription, event)
+        stats.depth -= 1
+        if event.event_type == EventType.GAME_OVER:
+            stats.dump()
+
+    def call(self, subscription, event):
+        subscription.callback(event)
+
+    def call_timed(self, subscription, event):
+        start = time.perf_counter()
+        subscription.callback(event)
+        self.stats.record(subscription, time.perf_counter() - start)
+
+    def queue_event(self, event):
+        stats = self.stats
+        if stats is not None:
+            stats.turns[-1][event.event_type] += 1
+        for subscription in self.callbacks[event.event_type]:
+            if subscription.immediate:
+                self.call(subscription, event)
+
+        get_key = COALESCE_KEYS.get(event.event_type)
+        if get_key is not None:
+            key = (event.event_type, get_key(event))
+            if key in self.coalesced:
+                if stats is not None:
+                    stats.coalesced += 1
+                return
+            self.coalesced.add(key)
+        self.queue.append(event)
+        if stats is not None:
+            stats.max_queued = max(stats.max_queued, len(self.queue))
+
+    def flush(self):
+        """
+        Delivers the queued events to the callbacks that are not immediate,
+        along with whatever those send in turn.
+        """
+        while self.queue:
+            queue = self.queue
+            self.queue = []
+            self.coalesced = set()
+            for event in queue:
+                for subscription in self.callbacks[event.event_type]:
+                    if not subscription.immediate:
+                        self.call(subscription, event)
+                if self.stats is not None and \
+                        event.event_type == EventType.GAME_OVER:
+                    self.stats.dump()
+
+    def end_turn(self):
+        """Called by the game once all of a turn's events are sent."""
+        pass
 
     def do_move_event(self, mob, prev_pos):
         info = MoveInfo(mob, prev_pos)
-        self.handle_event(Event(EventType.MOVE, info))
+        self.send(Event(EventType.MOVE, info))
+
+    def remove_subscription(self, subscription):
+        callbacks = self.callbacks[subscription.event_type]
+        if subscription in callbacks:
+            self.callbacks[subscription.event_type] = [
+                other for other in callbacks if other is not subscription]
 
     def remove_callback(self, event_type, callback):
-        for i in range(len(self.callbacks[event_type])):
-            if self.callbacks[event_type][i][1] == callback:
-                self.callbacks[event_type].pop(i)
+        for subscription in self.callbacks[event_type]:
+            if subscription.callback == callback:
+                self.remove_subscription(subscription)
                 return True
         return False
 
+    def subscriptions(self):
+        return [subscription
+                for callbacks in self.callbacks.values()
+                for subscription in callbacks]
+
+    def close(self):
+        """
+        Drops every subscription and returns those that were still open,
+        which means their owners leaked them.
+        """
+        leaked = self.subscriptions()
+        self.callbacks = {event_type: [] for event_type in EventType}
+        return leaked
+
+
+def use(handler):
+    """
+    Makes handler the one events are sent to from now on and returns the
+    previous one. Modules look up events.events on every send for this.
+    """
+    global events
+    previous = events
+    events = handler
+    return previous
+
 
 def message(message, color=tcod.white):
     events.send(Event(EventType.MESSAGE, (message, color)))
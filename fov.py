@@ -1,3 +1,5 @@
+from array import array
+from bisect import bisect_left, bisect_right
 from util import Pos
 
 
@@ -13,10 +15,130 @@ QUAD_TRANSFORMATIONS = [
     [1, 0, 0, -1],
 ]
 
+# _left_slopes[dy] and _right_slopes[dy] hold the slopes of cells dx = 0..dy
+_left_slopes = [[]]
+_right_slopes = [[]]
+
+
+def get_slopes(dy):
+    while len(_left_slopes) <= dy:
+        y = len(_left_slopes)
+        _left_slopes.append([(dx - .5) / (y + .5) for dx in range(y + 1)])
+        _right_slopes.append([(dx + .5) / (y - .5) for dx in range(y + 1)])
+    return _left_slopes[dy], _right_slopes[dy]
+
+
+class FovMap(object):
+    """
+    Reusable visibility bitmap for a level.
+
+    After compute(), visible[level.index(x, y)] is 1 for every cell that
+    can be seen and cells holds the indices of those cells.
+    """
+
+    def __init__(self, level):
+        self.level = level
+        self.visible = bytearray(len(level.opaque_map))
+        self.cells = array('l')
+        # buffers for the previous FOV while update() diffs against it
+        self._previous_visible = bytearray(len(level.opaque_map))
+        self._previous_cells = array('l')
+
+    def clear(self):
+        visible = self.visible
+        for i in self.cells:
+            visible[i] = 0
+        del self.cells[:]
+
+    def positions(self):
+        pos_at = self.level.pos_at
+        return [pos_at(i) for i in self.cells]
+
+    def update(self, pos, radius):
+        """
+        Recomputes FOV from pos. Returns (revealed, hidden): arrays of the
+        indices of cells that became visible and that stopped being visible.
+        """
+        previous_visible, previous_cells = self.visible, self.cells
+        self.visible, self.cells = \
+            self._previous_visible, self._previous_cells
+        visible = self.compute(pos, radius)
+        revealed = array('l', [i for i in self.cells
+                               if not previous_visible[i]])
+        hidden = array('l', [i for i in previous_cells if not visible[i]])
+        for i in previous_cells:
+            previous_visible[i] = 0
+        del previous_cells[:]
+        self._previous_visible, self._previous_cells = \
+            previous_visible, previous_cells
+        return revealed, hidden
+
+    def compute(self, pos, radius):
+        """
+        Shadowcasts from pos and marks every cell within radius that can be
+        seen. Sees exactly the cells calculate_fov_recursive yields.
+        """
+        level = self.level
+        if radius > level.border:
+            raise ValueError("FOV radius is larger than the level border")
+        self.clear()
+        visible = self.visible
+        cells = self.cells
+        opaque = level.opaque_map
+        stride = level.stride
+        origin = level.index(pos[0], pos[1])
+        visible[origin] = 1
+        cells.append(origin)
+        get_slopes(radius)
+        for trans in QUAD_TRANSFORMATIONS:
+            # index offsets of one step along dx and dy in this octant
+            x_step = trans[0] * stride + trans[2]
+            y_step = trans[1] * stride + trans[3]
+            stack = [(1, 0, 1)]
+            while stack:
+                start_y, start_slope, end_slope = stack.pop()
+                if start_slope > end_slope:
+                    continue
+                prev_blocked = False
+                for y in range(start_y, radius + 1):
+                    left_slopes = _left_slopes[y]
+                    right_slopes = _right_slopes[y]
+                    # cells whose slopes overlap [start_slope, end_slope]
+                    first = bisect_left(right_slopes, start_slope)
+                    last = bisect_right(left_slopes, end_slope)
+                    row = origin + y * y_step
+                    for dx in range(first, last):
+                        i = row + dx * x_step
+                        if not visible[i]:
+                            visible[i] = 1
+                            cells.append(i)
+                        if opaque[i]:
+                            if not prev_blocked:
+                                # end of row of see-through tiles
+                                prev_blocked = True
+                                stack.append((y + 1, start_slope,
+                                              left_slopes[dx]))
+                            new_start = right_slopes[dx]
+                        elif prev_blocked:
+                            # end of series of walls
+                            prev_blocked = False
+                            start_slope = new_start
+                    if prev_blocked:
+                        break
+        return visible
+
 
 def calculate_fov(pos, radius, level):
     """Calculates FOV radiating from given position with given radius.
-    Yields positions that can be seen."""
+    Returns a list of positions that can be seen."""
+    fov_map = FovMap(level)
+    fov_map.compute(pos, radius)
+    return fov_map.positions()
+
+
+def calculate_fov_recursive(pos, radius, level):
+    """Reference implementation of calculate_fov.
+    Yields positions that can be seen, some of them more than once."""
     yield(pos)
     for quadrant in range(8):
         for seen_pos in cast_light(pos, 1, 0, 1, radius, quadrant, level):
@@ -1,28 +1,94 @@
-import random
 import tcod
 import ui
-from constants import FOV_RADIUS, MAX_INVENTORY_SIZE
+from constants import DEBUG, FLOW_FIELD_MAX_COST, FLOW_FIELD_MIN_MOBS, \
+    FLOW_FIELD_MIN_STEPS, FOV_RADIUS, MAX_INVENTORY_SIZE, MAX_PATH_NODES
 import events
 import fov
 from mob import MobState
 import path
+import rng
+from scheduler import Scheduler
 import world
 
+# chance per turn that an idle mob without a leader sets off again
+IDLE_WAKE_PROB = 0.1
+
 
 class Game(object):
     """Manages a single play of the game."""
     alive = True
 
-    def __init__(self):
+    def __init__(self, queue_events=False, seed=None, headless=False):
+        """
+        queue_events: hold events back from the UI until the end of each
+        step, see events.EventHandler.start_queue
+        seed: seed for every random stream, see rng.seed; a fresh one if None
+        headless: play without a UI, e.g. for simulate.py; messages, menus,
+        confirmations and popups go to the hooks below, which do nothing
+        unless overridden
+        """
+        self.seed = rng.seed(seed)
         self.accum = 1
-        self.ui = ui.UI()
+        # everything created from here on subscribes to this game's events
+        self.events = events.EventHandler()
+        self.previous_events = events.use(self.events)
+        self.flow_fields = path.FlowFields()
+        self.routes = path.RouteCache(max_nodes=MAX_PATH_NODES)
+        self.ui = None if headless else ui.UI()
         self.world = world.generate_world()
-        events.events.add_callback(
-            events.EventType.TILE_REVEALED, self.handle_tile_reveal)
+        if self.ui is not None:
+            self.ui.world = self.world
+        self.scheduler = Scheduler()
+        self.schedule_mobs(self.player_level)
+        self.subscription = self.events.add_callback(
+            events.EventType.TILES_REVEALED, self.handle_tiles_revealed,
+            immediate=True)
         self.update_fov()
         events.events.do_move_event(self.world.player, None)
         self.update_player_status()
-        self.ui.render()
+        self.render()
+        if queue_events:
+            self.events.start_queue()
+
+    def close(self):
+        """
+        Tears down the game's event handler and returns the subscriptions
+        that were left open.
+        """
+        self.subscription.close()
+        if self.ui is not None:
+            self.ui.close()
+        self.world.close()
+        if self.events.stats is not None:
+            # the player may have quit before the game was over
+            self.events.stats.dump()
+        leaked = self.events.close()
+        events.use(self.previous_events)
+        if leaked and DEBUG:
+            print("Leaked event subscriptions: {}".format(leaked))
+        return leaked
+
+    def render(self):
+        if self.ui is not None:
+            self.ui.render()
+
+    def message(self, text, color=tcod.white):
+        if self.ui is not None:
+            self.ui.messages_window.message(text, color)
+
+    def menu(self, header, options):
+        """Returns the index of the option picked, or None."""
+        if self.ui is None:
+            return None
+        index = ui.menu(header, options, 24)
+        return None if index == 'escape' else index
+
+    def confirm(self, question):
+        return self.ui is not None and ui.yes_no_menu(question) is True
+
+    def popup(self, text):
+        if self.ui is not None:
+            ui.text_popup(text)
 
     @property
     def player_level(self):
@@ -30,33 +96,54 @@ class Game(object):
 
     def update_fov(self):
         player = self.world.player
-        pos = self.world.player.pos
         level = self.world.levels[player.dlevel]
-        new_fov = set(fov.calculate_fov(pos, FOV_RADIUS, level))
-
-        for pos in player.tiles_in_sight.difference(new_fov):
-            tile_info = world.TileInfo(pos, level[pos.x, pos.y])
-            events.events.handle_event(
-                events.Event(
-                    events.EventType.TILE_HIDDEN, tile_info))
+        if player.fov_map is None or player.fov_map.level is not level:
+            player.fov_map = fov.FovMap(level)
+        revealed, hidden = player.fov_map.update(player.pos, FOV_RADIUS)
 
-        for pos in new_fov.difference(player.tiles_in_sight):
-            world.reveal_tile(level, pos)
-
-        player.tiles_in_sight = new_fov
+        if hidden:
+            events.events.send(events.Event(
+                events.EventType.TILES_HIDDEN, world.TilesInfo(level, hidden)))
+        if revealed:
+            events.events.send(events.Event(
+                events.EventType.TILES_REVEALED,
+                world.TilesInfo(level, revealed)))
 
     def update_mobs(self):
-        level = self.player_level
-        for mob in level.mobs.values():
-            if mob != self.world.player:
-                self.update_mob(mob, level)
-        for i in range(self.accum):
-            self.world.player.body.on_tick()
+        """
+        Runs every mob that is due before the player's next action, which
+        comes self.accum turns after this one.
+        """
+        player = self.world.player
+        self.scheduler.schedule(player, self.accum)
+        actor = self.scheduler.pop()
+        while actor is not player:
+            delay = self.update_mob(actor, self.world.levels[actor.dlevel])
+            if delay is not None:
+                self.scheduler.schedule(actor, delay)
+            actor = self.scheduler.pop()
+        player.body.advance(self.accum)
         if self.world.player.body.hs('sleeping'):
             del self.world.player.body.stats['sleeping']
         self.accum = 1
+        self.events.end_turn()
+
+    def schedule_mobs(self, level):
+        """Schedules every mob on level but the player."""
+        for mob in level.mobs.values():
+            if mob == self.world.player:
+                continue
+            if mob.state == MobState.IDLE and mob.leader is None:
+                # it would spend these turns rolling to set off
+                self.scheduler.schedule(mob, rng.ai.geometric(IDLE_WAKE_PROB))
+            else:
+                self.scheduler.schedule(mob)
 
     def update_mob(self, mob, level):
+        """
+        Returns the number of turns until mob acts again, or None if it
+        waits for its leader to wake it.
+        """
         if mob.state == MobState.WANDERING:
             if mob.target is None or \
                     mob.target == mob.pos:
@@ -66,24 +153,70 @@ class Game(object):
                     potential_targets = list(
                         pos for pos in fov.calculate_fov(mob.pos, 5, level)
                         if not level[pos].blocked)
-                    mob.target = random.choice(potential_targets)
-            wander_path = path.get_path(
-                mob.pos, mob.target, level)
-            if wander_path:
-                mob.move_to(wander_path[0])
+                    mob.target = rng.ai.choice(potential_targets)
+            next_pos = self.get_next_step(mob, level)
+            if next_pos is not None:
+                mob.move_to(next_pos)
                 if mob.pos.distance(mob.target) <= 1:
                     mob.state = MobState.IDLE
-        elif mob.state == MobState.IDLE:
-            if mob.leader is None:
-                if random.randint(1, 10) == 1:
-                    mob.state = MobState.WANDERING
+                    if mob.leader is None:
+                        # skip the turns spent rolling to set off again
+                        return rng.ai.geometric(IDLE_WAKE_PROB)
             else:
-                if mob.leader and mob.leader.state != MobState.IDLE:
-                    mob.state = mob.leader.state
+                # there is no way there, so pick another target next turn
+                mob.target = None
+            return 1
+        if mob.leader is None:
+            mob.state = MobState.WANDERING
+            for follower in mob.followers:
+                self.scheduler.wake(follower)
+            return 1
+        if mob.leader.state != MobState.IDLE:
+            mob.state = mob.leader.state
+            return 1
+        return None
 
-    def handle_tile_reveal(self, event):
-        level = self.world.levels[self.world.player.dlevel]
-        level[event.info.pos].explored = True
+    def get_next_step(self, mob, level):
+        """Returns where mob should step to get to its target, if anywhere."""
+        target = mob.target
+        if (mob.leader is not None or mob.followers) and \
+                max(abs(mob.pos.x - target.x),
+                    abs(mob.pos.y - target.y)) >= FLOW_FIELD_MIN_STEPS:
+            field = self.flow_fields.cached(level, target)
+            if field is None or not field.covers(mob.pos):
+                field = self.get_group_flow_field(mob, level)
+            if field is not None and field.covers(mob.pos):
+                return field.next_step(mob.pos)
+        return self.routes.next_step(mob, level)
+
+    def get_group_flow_field(self, mob, level):
+        """
+        Returns a flow field to mob's target if enough of its group has a long
+        way to go there, or None if A* is cheaper for the short hops left.
+        """
+        target = mob.target
+        leader = mob.leader or mob
+        if len(leader.followers) + 1 < FLOW_FIELD_MIN_MOBS:
+            return None
+        # twice the distance leaves room to go around walls; mobs too far
+        # for a field to reach plan their own routes
+        max_steps = FLOW_FIELD_MAX_COST // (2 * path.STRAIGHT_COST)
+        far = [steps for steps in (
+                   max(abs(member.pos.x - target.x),
+                       abs(member.pos.y - target.y))
+                   for member in [leader] + leader.followers
+                   if member.target == target)
+               if FLOW_FIELD_MIN_STEPS <= steps <= max_steps]
+        if len(far) < FLOW_FIELD_MIN_MOBS:
+            return None
+        # one search reaching the farthest of them serves them all
+        return self.flow_fields.get(level, target,
+                                    2 * path.STRAIGHT_COST * max(far))
+
+    def handle_tiles_revealed(self, event):
+        explored = event.info.level.explored
+        for i in event.info.indices:
+            explored[i] = True
 
     def update_player_status(self):
         events.events.send(events.Event(
@@ -104,73 +237,73 @@ class Game(object):
             action = True
         elif obj.interaction == world.Interactions.OPEN_CONTAINER:
             if not obj.contents:
-                self.ui.messages_window.message(
+                self.message(
                     "The " + obj.name + " is empty.")
                 return
             # let the player pick an item
-            index = ui.menu(obj.name,
-                            [item.name for item in obj.contents], 24)
-            if index is not None and index != 'escape':
+            index = self.menu(obj.name,
+                              [item.name for item in obj.contents])
+            if index is not None:
                 item = obj.contents.pop(index)
                 self.world.player.body.inventory.append(item)
-                self.ui.messages_window.message(
+                self.message(
                     "You take the " + item.name
                     + " out of the " + obj.name + ".")
                 if len(self.world.player.body.inventory) > MAX_INVENTORY_SIZE:
                     drop = self.world.player.body.inventory.pop(0)
-                    self.ui.messages_window.message(
+                    self.message(
                         "You drop your " + drop.name
                         + " into the " + obj.name + ".", tcod.purple)
                     obj.contents.append(drop)
 
                 action = True
         elif obj.interaction == world.Interactions.PREGNANCY_TEST:
-            self.ui.messages_window.message(
+            self.message(
                 "You perform a pregnancy test on yourself...")
-            if random.random() < 0.01:
-                self.ui.messages_window.message(
+            if rng.flavor.random() < 0.01:
+                self.message(
                     "You are pregnant!", tcod.pink)
             else:
-                self.ui.messages_window.message(
+                self.message(
                     "You are not pregnant.", tcod.pink)
             action = True
         elif obj.interaction == world.Interactions.EAT:
             action = True
         elif obj.interaction == world.Interactions.SLEEP:
-            if ui.yes_no_menu("Sleep in the bed?") is True:
+            if self.confirm("Sleep in the bed?"):
                 action = True
         elif obj.interaction == world.Interactions.INHALER:
-            self.ui.messages_window.message(
+            self.message(
                 "You take a puff from the " + obj.name + ".")
             action = True
         elif obj.interaction == world.Interactions.CURE_PNEUMONIA:
-            self.ui.messages_window.message(
+            self.message(
                 "You take some of the antibiotics pills.")
             action = True
         elif obj.interaction == world.Interactions.CURE_DENGUE:
-            self.ui.messages_window.message(
+            self.message(
                 "You drink the antiserum.")
             action = True
         elif obj.interaction == world.Interactions.CURE_SLEEPING_SICKNESS_1:
-            self.ui.messages_window.message(
+            self.message(
                 "You inject the pentamidine.")
             action = True
         elif obj.interaction == world.Interactions.CURE_SLEEPING_SICKNESS_2:
-            self.ui.messages_window.message(
+            self.message(
                 "You apply the eflornithine cream.")
             action = True
         elif obj.interaction == world.Interactions.CURE_TB:
-            self.ui.messages_window.message(
+            self.message(
                 "You inject the rifampicin.")
             action = True
         elif obj.interaction == world.Interactions.CURE_PERTUSSIS:
-            self.ui.messages_window.message(
+            self.message(
                 "You inject the erythromycin.")
             action = True
         elif obj.interaction == world.Interactions.READ:
-            self.ui.messages_window.message(
+            self.message(
                 "You read the " + obj.name + ".")
-            ui.text_popup(world.get_book_text(obj.name))
+            self.popup(world.get_book_text(obj.name))
             action = True
         if action:
             t = self.world.player.body.on_interact(obj)
@@ -199,7 +332,7 @@ class Game(object):
             old_room_id = self.player_level[old_pos].room_id
             new_room_id = self.player_level[new_pos].room_id
             if new_room_id != 0 and new_room_id != old_room_id:
-                self.ui.messages_window.message(
+                self.message(
                     "You enter a " + self.player_level.rooms[new_room_id] +
                     '.')
 
@@ -211,17 +344,46 @@ class Game(object):
             self.update_player_status()
             return True
 
-    def run(self, character_info={'ADDITONAL_FATIGUE': [],
-                                  'PREEXISTING_CONDITIONS': {}}):
+    def pick_up(self):
+        """Returns the object picked up from under the player, if any."""
+        player = self.world.player
+        obj = self.player_level.get_object(player.pos)
+        if obj is None or not obj.pickup:
+            self.message("There are no items here.")
+            return None
+        inventory = player.body.inventory
+        self.player_level.pop_object(player.pos)
+        inventory.append(obj)
+        self.message("You pick up the " + obj.name + '.')
+        if len(inventory) > MAX_INVENTORY_SIZE:
+            drop = inventory.pop(0)
+            self.message("You drop your " + drop.name + '.', tcod.purple)
+            self.player_level.objects[player.pos] = drop
+            drop.pos = player.pos
+            events.events.send(events.Event(events.EventType.BIRTH, drop))
+        return obj
+
+    def use_item(self, item):
+        """Returns whether using item from the inventory took a turn."""
+        turn_used = self.interact_with_object(item)
+        if turn_used and item.consumed_on_use:
+            self.world.player.body.inventory.remove(item)
+        return turn_used
+
+    def start(self, character_info):
         disease = character_info['DISEASE']
         character_info['ADDITIONAL_FATIGUE'].append(disease.additional_fatigue)
         self.world.player.body.on_game_start(character_info)
         self.world.player.body.sc("disease",
                                   disease,
                                   {})
+
+    def run(self, character_info={'ADDITONAL_FATIGUE': [],
+                                  'PREEXISTING_CONDITIONS': {}}):
+        self.start(character_info)
         ui.do_welcome()
         while self.alive and not tcod.console_is_window_closed():
             if self.ui.handle_input(self):
                 self.update_mobs()
-
-            self.ui.render()
+            self.events.flush()
+            self.render()
@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
+import argparse
 from game import Game
+import rng
 import ui
-from random import choice
 from vitals import diseases
 
 
-def main():
+def main(seed=None):
+    """
+    seed: if given, every game is played in the hospital of that seed
+    """
     ui.init_tcod()
     while True:
         ch = ui.handle_main_menu()
@@ -14,16 +18,22 @@ def main():
             if preexisting_conditions is None:
                 continue
 
-            game = Game()
+            game = Game(queue_events=True, seed=seed)
+            print("Seed: {}".format(game.seed))
             game.run(
                 character_info={'ADDITONAL_FATIGUE': [],
                                 'PREEXISTING_CONDITIONS': preexisting_conditions,
-                                'DISEASE': choice(diseases),
+                                'DISEASE': rng.generation.choice(diseases),
                                 'ADDITIONAL_FATIGUE': []
                                 })
+            game.close()
         else:
             break
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', type=int,
+                        help='seed for the hospital and everything random in '
+                             'the game, printed at the start of every game')
+    main(parser.parse_args().seed)
@@ -19,6 +19,7 @@ class Mob(object):
         state: MobState that indicates what the mob's current intention is
         target: pos the mob is trying to get to, if any
         leader: mob this mob is subordinate to
+        followers: mobs this mob is the leader of
         """
         self.pos = Pos(pos)
         self.dlevel = dlevel
@@ -26,6 +27,9 @@ class Mob(object):
         self.state = state
         self.target = None
         self.leader = leader
+        self.followers = []
+        if leader is not None:
+            leader.followers.append(self)
         self.hp = self.info['hp']
         events.events.do_move_event(self, None)
 
@@ -36,7 +40,7 @@ class Mob(object):
 
 
 class Player(Mob):
-    tiles_in_sight = set()
+    fov_map = None
 
     def __init__(self, pos, dlevel, info):
         super().__init__(pos, dlevel, info)
@@ -46,4 +50,9 @@ class Player(Mob):
         return True
 
     def can_see(self, pos):
-        return pos in self.tiles_in_sight
+        if self.fov_map is None:
+            return False
+        level = self.fov_map.level
+        x, y = pos
+        return level.in_border(x, y) and \
+            bool(self.fov_map.visible[level.index(x, y)])
@@ -1,53 +1,290 @@
+from collections import OrderedDict
 import heapq
-from constants import DIRECTIONS
+from array import array
+import weakref
+from constants import DIRECTIONS, FLOW_FIELD_MAX_COST
+from util import Pos
 
+# integer move costs, so diagonal moves cost roughly sqrt(2) straight moves
+STRAIGHT_COST = 10
+DIAGONAL_COST = 14
 
-def get_path(from_pos, to_pos, level):
-    if level.is_blocked(to_pos) or from_pos == to_pos:
+
+class PathFinder(object):
+    """
+    A* search over one level, using octile distance as the heuristic.
+
+    Costs, parents and the closed set are flat arrays indexed like the
+    level's arrays. They are reused between searches: a cell's entries only
+    count if its stamp matches the id of the current search.
+    """
+
+    def __init__(self, level):
+        self.level = level
+        size = len(level.blocked_map)
+        self.search_id = 0
+        self.reached = array('i', [0]) * size
+        self.closed = array('i', [0]) * size
+        self.cost = array('i', [0]) * size
+        self.parent = array('i', [0]) * size
+        self.moves = [(dx * level.stride + dy,
+                       DIAGONAL_COST if dx and dy else STRAIGHT_COST)
+                      for dx, dy in sorted(DIRECTIONS)]
+        self.nodes_expanded = 0
+
+    def find(self, from_pos, to_pos, max_nodes=None):
+        """
+        Returns the positions on a shortest path from from_pos to to_pos,
+        excluding from_pos, or [] if there is no path.
+        If max_nodes is given, gives up after expanding that many cells.
+        """
+        level = self.level
+        if level.is_blocked(to_pos) or from_pos == to_pos:
+            return []
+        self.search_id += 1
+        search_id = self.search_id
+        reached = self.reached
+        closed = self.closed
+        cost = self.cost
+        parent = self.parent
+        blocked = level.blocked_map
+        stride = level.stride
+        offset = level.offset
+        moves = self.moves
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+
+        target_x, target_y = to_pos
+        start = level.index(from_pos[0], from_pos[1])
+        target = level.index(target_x, target_y)
+        reached[start] = search_id
+        cost[start] = 0
+        parent[start] = -1
+        # entries are (estimated total cost, heuristic, index); ties go to
+        # the cell closest to the target, then to the lowest index
+        queue = [(0, 0, start)]
+        expanded = 0
+        while queue:
+            current = heappop(queue)[2]
+            if closed[current] == search_id:
+                continue
+            if current == target:
+                self.nodes_expanded = expanded
+                return self._build_path(target)
+            closed[current] = search_id
+            expanded += 1
+            if max_nodes is not None and expanded > max_nodes:
+                break
+            g = cost[current]
+            for step, step_cost in moves:
+                n = current + step
+                if closed[n] == search_id or \
+                        (blocked[n] and n != target):
+                    continue
+                new_cost = g + step_cost
+                if reached[n] == search_id and cost[n] <= new_cost:
+                    continue
+                reached[n] = search_id
+                cost[n] = new_cost
+                parent[n] = current
+                x, y = divmod(n - offset, stride)
+                dx = abs(x - target_x)
+                dy = abs(y - target_y)
+                if dx < dy:
+                    dx, dy = dy, dx
+                h = STRAIGHT_COST * dx + (DIAGONAL_COST - STRAIGHT_COST) * dy
+                heappush(queue, (new_cost + h, h, n))
+        self.nodes_expanded = expanded
         return []
 
-    def get_walkable_adjacent_tiles(source_pos):
-        adjacent = (source_pos + direction for direction in DIRECTIONS)
-        return (pos for pos in adjacent if pos not in found and
-                (pos == to_pos or not level.is_blocked(pos)))
-
-    def heuristic(pos):
-        return min(abs(pos.x - to_pos.x), abs(pos.y - to_pos.y))
-
-    class Node(object):
-        def __init__(self, pos, parent=None):
-            self.pos = pos
-            self.priority = heuristic(pos)
-            self.parent = parent
-
-        def get_path(self):
-            path = []
-            node = self
-            while node:
-                path.insert(0, node.pos)
-                node = node.parent
-            return path
-
-        def __lt__(self, other):
-            return self.priority < other.priority
-
-    found = set([from_pos])
-    starts = list(get_walkable_adjacent_tiles(from_pos))
-
-    if to_pos in starts:
-        return [to_pos]
-
-    queue = []
-    for pos in starts:
-        heapq.heappush(queue, Node(pos))
-
-    while queue:
-        node = heapq.heappop(queue)
-        for new_pos in get_walkable_adjacent_tiles(node.pos):
-            if new_pos in found:
+    def _build_path(self, target):
+        path = []
+        parent = self.parent
+        pos_at = self.level.pos_at
+        i = target
+        while parent[i] != -1:
+            path.append(pos_at(i))
+            i = parent[i]
+        path.reverse()
+        return path
+
+
+def get_path_finder(level):
+    path_finder = level.path_finder
+    if path_finder is None:
+        path_finder = level.path_finder = PathFinder(level)
+    return path_finder
+
+
+def get_path(from_pos, to_pos, level, max_nodes=None):
+    """
+    Returns a shortest path from from_pos to to_pos as a list of positions,
+    not including from_pos. Returns [] if there is no path or if it takes
+    more than max_nodes expanded cells to find one.
+    """
+    return get_path_finder(level).find(from_pos, to_pos, max_nodes)
+
+
+class FlowField(object):
+    """
+    Dijkstra map of the cost to reach target from every cell within
+    max_cost of it. Mobs are ignored, so the field only goes stale when
+    the level's terrain changes.
+    """
+
+    def __init__(self, level, target, max_cost):
+        self.level = level
+        self.target = Pos(target)
+        self.max_cost = max_cost
+        self.version = level.terrain_version
+        self.moves = get_path_finder(level).moves
+        self.costs = self._compute()
+
+    def _compute(self):
+        level = self.level
+        blocked = level.terrain_blocked_map
+        max_cost = self.max_cost
+        moves = self.moves
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+        start = level.index(self.target[0], self.target[1])
+        costs = {start: 0}
+        queue = [(0, start)]
+        while queue:
+            cost, current = heappop(queue)
+            if cost > costs[current]:
                 continue
-            if new_pos == to_pos:
-                return Node(new_pos, node).get_path()
-            heapq.heappush(queue, Node(new_pos, node))
-            found.add(new_pos)
-    return []
+            for step, step_cost in moves:
+                n = current + step
+                new_cost = cost + step_cost
+                if blocked[n] or new_cost > max_cost or \
+                        costs.get(n, new_cost + 1) <= new_cost:
+                    continue
+                costs[n] = new_cost
+                heappush(queue, (new_cost, n))
+        return costs
+
+    def is_stale(self):
+        return self.version != self.level.terrain_version
+
+    def covers(self, pos):
+        return self.level.index(pos[0], pos[1]) in self.costs
+
+    def next_step(self, pos):
+        """
+        Returns the free neighbouring position that gets closest to the
+        target from pos, or None if every way closer is blocked.
+        pos must be covered by the field.
+        """
+        level = self.level
+        costs = self.costs
+        blocked = level.blocked_map
+        current = level.index(pos[0], pos[1])
+        best_cost = costs[current]
+        best = None
+        for step, step_cost in self.moves:
+            n = current + step
+            cost = costs.get(n)
+            if cost is not None and cost < best_cost and not blocked[n]:
+                best_cost = cost
+                best = n
+        return level.pos_at(best) if best is not None else None
+
+
+class FlowFields(object):
+    """
+    Flow fields shared by every mob heading to the same target, keyed by
+    (level, target). Keeps the most recently used fields and recomputes a
+    field when its level's terrain has changed.
+    """
+
+    def __init__(self, max_cost=FLOW_FIELD_MAX_COST, max_fields=64):
+        self.max_cost = max_cost
+        self.max_fields = max_fields
+        self.fields = OrderedDict()
+        self.computed = 0
+
+    def cached(self, level, target):
+        """Returns the field for target if there is an up to date one."""
+        key = (level, target)
+        field = self.fields.get(key)
+        if field is None or field.is_stale():
+            return None
+        self.fields.move_to_end(key)
+        return field
+
+    def get(self, level, target, max_cost=None):
+        """
+        Returns the field for target reaching at least max_cost, or as far as
+        the cache's max_cost if that is lower or max_cost is None.
+        """
+        max_cost = self.max_cost if max_cost is None \
+            else min(max_cost, self.max_cost)
+        key = (level, target)
+        field = self.fields.get(key)
+        if field is None or field.is_stale() or field.max_cost < max_cost:
+            field = self.fields[key] = FlowField(level, target, max_cost)
+            self.computed += 1
+            if len(self.fields) > self.max_fields:
+                self.fields.popitem(last=False)
+        self.fields.move_to_end(key)
+        return field
+
+
+class Route(object):
+
+    def __init__(self, target, steps, terrain_version):
+        self.target = target
+        # remaining positions, last one first so the next step can be popped
+        self.steps = steps[::-1]
+        self.failed = not steps
+        self.terrain_version = terrain_version
+
+
+class RouteCache(object):
+    """
+    Remembers the rest of each mob's route to its target. Each turn only
+    the next step is checked; the mob only searches again when that step
+    is blocked or its target has changed. A search that finds no route is
+    remembered too, until the level's terrain changes.
+
+    hits counts steps taken from a cached route, replans searches that found
+    a route, failures searches that found none and failure_hits the times a
+    remembered failure was answered without searching.
+    """
+
+    def __init__(self, max_nodes=None):
+        self.max_nodes = max_nodes
+        self.routes = weakref.WeakKeyDictionary()
+        self.hits = 0
+        self.replans = 0
+        self.failures = 0
+        self.failure_hits = 0
+
+    def next_step(self, mob, level):
+        """
+        Returns the position mob should move to next on its way to
+        mob.target, or None if there is no way there. Assumes the mob then
+        moves there.
+        """
+        route = self.routes.get(mob)
+        if route is not None and route.target == mob.target:
+            if route.steps:
+                step = route.steps[-1]
+                if max(abs(step[0] - mob.pos[0]),
+                       abs(step[1] - mob.pos[1])) == 1 \
+                        and not level.is_blocked(step):
+                    self.hits += 1
+                    return route.steps.pop()
+            elif route.failed and \
+                    route.terrain_version == level.terrain_version:
+                self.failure_hits += 1
+                return None
+        route = self.routes[mob] = Route(
+            mob.target, get_path(mob.pos, mob.target, level, self.max_nodes),
+            level.terrain_version)
+        if route.failed:
+            self.failures += 1
+            return None
+        self.replans += 1
+        return route.steps.pop()
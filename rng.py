@@ -0,0 +1,67 @@
+"""
+Seeded random number streams, one for each part of the game, so that a seed
+reproduces a run: the same hospital, and the same turns for the same input.
+
+Each stream draws independently, so e.g. mob AI taking more or fewer random
+numbers does not change what the body rolls. Modules use the stream objects
+below, which seed() reseeds in place.
+"""
+import math
+import random
+
+
+class Stream(random.Random):
+
+    def geometric(self, prob):
+        """Number of trials up to and including the first success."""
+        if prob >= 1:
+            return 1
+        return int(math.log(1 - self.random()) / math.log(1 - prob)) + 1
+
+    def binomial(self, trials, prob):
+        """Number of successes in trials independent trials."""
+        if trials <= 0 or prob <= 0:
+            return 0
+        if prob >= 1:
+            return trials
+        variance = trials * prob * (1 - prob)
+        if variance > 25:
+            # normal approximation, good enough at this size
+            count = int(round(self.gauss(trials * prob, math.sqrt(variance))))
+            return min(max(count, 0), trials)
+        # skip over the failures between successes
+        count = 0
+        trial = self.geometric(prob)
+        while trial <= trials:
+            count += 1
+            trial += self.geometric(prob)
+        return count
+
+
+# the hospital, its contents and the player's disease
+generation = Stream()
+# mob decisions
+ai = Stream()
+# vitals and conditions
+body = Stream()
+# rolls that only change what the player is told
+flavor = Stream()
+
+STREAMS = {'generation': generation, 'ai': ai, 'body': body,
+           'flavor': flavor}
+
+
+def seed(value=None):
+    """
+    Seeds every stream from value, or from a fresh random seed if value is
+    None, and returns the seed used.
+    """
+    if value is None:
+        value = random.SystemRandom().randrange(2 ** 32)
+    # generation takes the seed as is, so seeds give the same hospitals as
+    # they did with the global random module
+    generation.seed(value)
+    for name, stream in STREAMS.items():
+        if stream is not generation:
+            stream.seed('{}:{}'.format(value, name))
+    return value
@@ -0,0 +1,53 @@
+import heapq
+from itertools import count
+
+
+class Scheduler(object):
+    """
+    Actors ordered by the game time of their next action.
+
+    Actors due at the same time act in the order they were scheduled.
+    Rescheduling an actor replaces its earlier entry; the stale heap entry
+    is skipped when it comes up.
+    """
+
+    def __init__(self):
+        self.time = 0
+        self.queue = []
+        self.entries = {}
+        self.counter = count()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, actor):
+        return actor in self.entries
+
+    def schedule(self, actor, delay=0):
+        """Makes actor act delay turns from now."""
+        entry = next(self.counter)
+        self.entries[actor] = entry
+        heapq.heappush(self.queue, (self.time + delay, entry, actor))
+
+    def wake(self, actor):
+        """Makes actor act now, unless it is already scheduled."""
+        if actor not in self.entries:
+            self.schedule(actor)
+
+    def remove(self, actor):
+        self.entries.pop(actor, None)
+
+    def pop(self):
+        """
+        Returns the next actor to act and advances the clock to its time,
+        or returns None if nobody is scheduled.
+        """
+        queue = self.queue
+        entries = self.entries
+        while queue:
+            time, entry, actor = heapq.heappop(queue)
+            if entries.get(actor) == entry:
+                del entries[actor]
+                self.time = time
+                return actor
+        return None
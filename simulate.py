@@ -0,0 +1,385 @@
+"""
+Plays a game without a UI, with the player's actions picked by a policy,
+as fast as it will run. Reports turns per second and how the time splits
+between the player's field of view, mob updates, the player's vitals, event
+callbacks and the player's own actions.
+
+Run from the repository root:
+
+    python simulate.py --policy explore --turns 5000 --seed 1
+
+data.json has no mobs, so --mobs N spawns N stand-ins, in groups, to give
+the mob updates something to do.
+"""
+import argparse
+from collections import Counter, defaultdict, deque
+import os
+import random
+import time
+
+os.environ.setdefault('MEDICALRL_HEADLESS', '1')
+
+from constants import DIRECTIONS
+import events
+import fov
+from game import Game
+from mob import Mob
+import rng
+import vitals
+import world
+from world import Interactions
+
+
+# what cures each disease
+CURES = {
+    vitals.Pneumonia: (Interactions.CURE_PNEUMONIA,),
+    vitals.Dengue: (Interactions.CURE_DENGUE,),
+    vitals.SleepingSickness: (Interactions.CURE_SLEEPING_SICKNESS_1,
+                              Interactions.CURE_SLEEPING_SICKNESS_2),
+    vitals.TB: (Interactions.CURE_TB,),
+    vitals.Pertussis: (Interactions.CURE_PERTUSSIS,),
+}
+
+# spawned by --mobs
+MOB = {'name': 'orderly', 'char': 'o', 'fg_color': 'white', 'hp': 10}
+GROUP_SIZE = 3
+
+
+class Timings(object):
+    """
+    Seconds spent in each section, where a section is a function wrapped by
+    wrap(). Time a section spends in other wrapped functions counts towards
+    those instead, so the sections add up to no more than the total.
+    """
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = Counter()
+        self.inner = []
+
+    def wrap(self, section, func):
+        seconds = self.seconds
+        calls = self.calls
+        inner = self.inner
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = clock()
+            inner.append(0.0)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                seconds[section] += elapsed - inner.pop()
+                calls[section] += 1
+                if inner:
+                    inner[-1] += elapsed
+        return timed
+
+
+class Policy(object):
+    """
+    Picks the player's actions, and answers the menus and questions that
+    come up along the way. Draws from its own random stream, so that a
+    policy does not change what the game's streams roll.
+    """
+
+    def __init__(self, seed=None):
+        self.random = random.Random(seed)
+
+    def act(self, game):
+        """
+        Takes the player's action. If it does not take a turn the player is
+        taken to have waited.
+        """
+        raise NotImplementedError
+
+    def choose(self, header, options):
+        """Returns the index of the option picked, or None."""
+        return None
+
+    def confirm(self, question):
+        return False
+
+
+class RandomWalk(Policy):
+    """Steps in a random direction, bumping into whatever is there."""
+
+    directions = sorted(DIRECTIONS)
+
+    def act(self, game):
+        game.attempt_player_move(self.random.choice(self.directions))
+
+    def choose(self, header, options):
+        index = self.random.randrange(len(options) + 1)
+        return index if index < len(options) else None
+
+    def confirm(self, question):
+        return self.random.random() < 0.5
+
+
+class Explore(RandomWalk):
+    """
+    Walks to the nearest cell the player has not seen, opening doors on the
+    way. Walks at random once there is nothing left to see.
+    """
+
+    def __init__(self, seed=None):
+        super().__init__(seed)
+        self.route = deque()
+
+    def goals(self, game, level):
+        """Returns whether the cell at an index is worth walking to."""
+        explored = level.explored
+        return lambda i: not explored[i]
+
+    def act(self, game):
+        player = game.world.player
+        if not self.route:
+            level = game.player_level
+            self.route = deque(find_route(level, player.pos,
+                                          self.goals(game, level)))
+            if not self.route:
+                return super().act(game)
+        step = self.route[0]
+        if not game.attempt_player_move(step - player.pos):
+            # something is in the way, look again next turn
+            self.route.clear()
+        elif player.pos == step:
+            self.route.popleft()
+
+
+class GoToCure(Explore):
+    """
+    Walks straight to the cure for the player's disease, picks it up and
+    takes it. Explores while there is no cure on the level.
+    """
+
+    def goals(self, game, level):
+        cures = CURES[type(game.world.player.body.conditions['disease'])]
+        found = {level.index(x, y) for (x, y), obj in level.objects.items()
+                 if obj.interaction in cures}
+        if not found:
+            return super().goals(game, level)
+        return found.__contains__
+
+    def act(self, game):
+        player = game.world.player
+        cures = CURES[type(player.body.conditions['disease'])]
+        obj = game.player_level.get_object(player.pos)
+        if obj is not None and obj.interaction in cures:
+            self.route.clear()
+            item = game.pick_up()
+            if item is not None:
+                game.use_item(item)
+        else:
+            super().act(game)
+
+
+POLICIES = {'random': RandomWalk, 'explore': Explore, 'cure': GoToCure}
+
+
+def find_route(level, start, is_goal):
+    """
+    Returns the positions on a shortest walk from start to the nearest cell
+    for which is_goal(index) is true, excluding start, or [] if there is
+    none. The walk ignores mobs and goes through closed doors.
+    """
+    blocked = bytearray(level.terrain_blocked_map)
+    for (x, y), obj in level.objects.items():
+        if obj.interaction == Interactions.OPEN_DOOR:
+            blocked[level.index(x, y)] = False
+    steps = [dx * level.stride + dy for dx, dy in sorted(DIRECTIONS)]
+    first = level.index(start[0], start[1])
+    parent = {first: None}
+    frontier = [first]
+    while frontier:
+        next_frontier = []
+        for i in frontier:
+            if i != first and is_goal(i):
+                route = []
+                while i != first:
+                    route.append(level.pos_at(i))
+                    i = parent[i]
+                route.reverse()
+                return route
+            for step in steps:
+                n = i + step
+                if not blocked[n] and n not in parent:
+                    parent[n] = i
+                    next_frontier.append(n)
+        frontier = next_frontier
+    return []
+
+
+class SimulatedGame(Game):
+    """A Game without a UI, that leaves every choice to a policy."""
+
+    policy = Policy()
+
+    def __init__(self, seed=None, verbose=False):
+        self.verbose = verbose
+        self.messages = 0
+        super().__init__(seed=seed, headless=True)
+
+    def message(self, text, color=None):
+        self.messages += 1
+        if self.verbose:
+            print(text)
+
+    def menu(self, header, options):
+        return self.policy.choose(header, options)
+
+    def confirm(self, question):
+        return self.policy.confirm(question)
+
+
+class Simulation(object):
+    """
+    A SimulatedGame, set up like main.main sets up a game, with the parts
+    that make up a turn wrapped in self.timings.
+
+    policy: Policy subclass, seeded from the game's seed
+    """
+
+    def __init__(self, policy, seed=None, mobs=0, verbose=False):
+        self.game = game = SimulatedGame(seed, verbose)
+        self.policy = game.policy = policy('{}:policy'.format(game.seed))
+        self.disease = rng.generation.choice(vitals.diseases)
+        game.start({'ADDITIONAL_FATIGUE': [], 'PREEXISTING_CONDITIONS': {},
+                    'DISEASE': self.disease})
+        spawn_mobs(game, mobs)
+        self.over = False
+        self.subscriptions = [
+            game.events.add_callback(events.EventType.GAME_OVER,
+                                     self.handle_game_over),
+            game.events.add_callback(events.EventType.MESSAGE,
+                                     self.handle_message)]
+
+        self.timings = timings = Timings()
+        body = game.world.player.body
+        game.update_fov = timings.wrap('fov', game.update_fov)
+        game.update_mob = timings.wrap('mobs', game.update_mob)
+        body.advance = timings.wrap('vitals', body.advance)
+        game.events.send = timings.wrap('events', game.events.send)
+        self.act = timings.wrap('player', self.policy.act)
+        self.turns = 0
+        self.actions = 0
+        self.seconds = 0.0
+
+    def handle_game_over(self, event):
+        self.over = True
+
+    def handle_message(self, event):
+        self.game.message(*event.info)
+
+    def run(self, turns):
+        """Plays until turns more turns have passed or the game is over."""
+        game = self.game
+        body = game.world.player.body
+        act = self.act
+        update_mobs = game.update_mobs
+        first_turn = body.turn_number
+        last_turn = first_turn + turns
+        start = time.perf_counter()
+        while not self.over and body.turn_number < last_turn:
+            act(game)
+            update_mobs()
+            self.actions += 1
+        self.seconds += time.perf_counter() - start
+        self.turns += body.turn_number - first_turn
+
+    def close(self):
+        for subscription in self.subscriptions:
+            subscription.close()
+        return self.game.close()
+
+    def outcome(self):
+        body = self.game.world.player.body
+        if not body.alive:
+            return 'dead'
+        if self.game.world.player.body.conditions['disease'].over:
+            return 'cured'
+        return 'game over' if self.over else 'playing'
+
+    def report(self):
+        seconds = self.seconds or float('inf')
+        turns = self.turns or 1
+        lines = ['{} turns in {} actions, {:.2f} s, {:.0f} turns/s, {} '
+                 'messages; {} at turn {}'.format(
+                     self.turns, self.actions, self.seconds,
+                     self.turns / seconds, self.game.messages,
+                     self.outcome(),
+                     self.game.world.player.body.turn_number),
+                 '{:<8} {:>9} {:>7} {:>9} {:>8}'.format(
+                     'section', 'seconds', 'share', 'us/turn', 'calls')]
+        sections = dict(self.timings.seconds)
+        sections['other'] = self.seconds - sum(sections.values())
+        calls = self.timings.calls
+        for section in ('fov', 'mobs', 'vitals', 'events', 'player',
+                        'other'):
+            lines.append('{:<8} {:>9.3f} {:>6.1f}% {:>9.1f} {:>8}'.format(
+                section, sections.get(section, 0.0),
+                100 * sections.get(section, 0.0) / seconds,
+                sections.get(section, 0.0) * 1e6 / turns,
+                calls[section] if section in calls else ''))
+        routes = self.game.routes
+        lines.append('routes: {} hits, {} replans, {} failed plans, {} '
+                     'remembered failures; {} flow fields'.format(
+                         routes.hits, routes.replans, routes.failures,
+                         routes.failure_hits,
+                         self.game.flow_fields.computed))
+        return '\n'.join(lines)
+
+
+def spawn_mobs(game, count):
+    """
+    Spawns count mobs on the player's level in groups of GROUP_SIZE, each
+    group around its leader the way world.populate_level places them.
+    """
+    level = game.player_level
+    dlevel = game.world.player.dlevel
+    spawned = []
+    while len(spawned) < count:
+        leader_pos = world.get_random_passable_position(level)
+        leader = level.mobs[leader_pos] = Mob(leader_pos, dlevel, MOB)
+        spawned.append(leader)
+        tiles_in_sight = [pos for pos in fov.calculate_fov(leader_pos, 5,
+                                                           level)
+                          if not level.is_blocked(pos)]
+        for i in range(min(GROUP_SIZE - 1, count - len(spawned),
+                           len(tiles_in_sight))):
+            pos = rng.generation.choice(tiles_in_sight)
+            tiles_in_sight.remove(pos)
+            level.mobs[pos] = Mob(pos, dlevel, MOB, leader=leader)
+            spawned.append(level.mobs[pos])
+    for new_mob in spawned:
+        game.scheduler.schedule(new_mob)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--policy', choices=sorted(POLICIES),
+                        default='explore')
+    parser.add_argument('--turns', type=int, default=5000,
+                        help='stop after this many game turns')
+    parser.add_argument('--seed', type=int,
+                        help='seed for the game and the policy')
+    parser.add_argument('--mobs', type=int, default=0,
+                        help='mobs to spawn on the level')
+    parser.add_argument('--verbose', action='store_true',
+                        help='print the messages the player would see')
+    args = parser.parse_args()
+
+    simulation = Simulation(POLICIES[args.policy], args.seed, args.mobs,
+                            args.verbose)
+    print("Seed: {}, {}, {} policy".format(
+        simulation.game.seed, type(simulation.disease).__name__,
+        args.policy))
+    simulation.run(args.turns)
+    print(simulation.report())
+    simulation.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -25,6 +25,7 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
+import os
 import sys
 import ctypes
 import struct
@@ -43,7 +44,12 @@ LINUX = False
 MAC = False
 MINGW = False
 MSVC = False
-if sys.platform.find('linux') != -1:
+HEADLESS = False
+if os.environ.get('MEDICALRL_HEADLESS'):
+    # pure-Python stand-in for the native library, for machines without SDL
+    import tcod_headless as _lib
+    HEADLESS = True
+elif sys.platform.find('linux') != -1:
     try:
         _lib = ctypes.cdll['./libtcod.so']
     except OSError:
@@ -414,85 +420,78 @@ class Key(Structure):
 class ConsoleBuffer:
     # simple console that allows direct (fast) access to cells. simplifies
     # use of the "fill" functions.
+    #
+    # the planes are contiguous C int NumPy arrays indexed [y, x], in the
+    # row-major order the fill functions expect. libtcod reads them through
+    # pointers taken once at construction, so write into them in place
+    # (buffer.char[y, x] = ..., buffer.fore[:, y0:y1] = ...) rather than
+    # rebinding the attributes.
 
     def __init__(self, width, height, back_r=0, back_g=0, back_b=0, fore_r=0, fore_g=0, fore_b=0, char=' '):
         # initialize with given width and height. values to fill the buffer
         # are optional, defaults to black with no characters.
-        n = width * height
+        if not numpy_available:
+            raise ImportError('ConsoleBuffer needs NumPy.')
         self.width = width
         self.height = height
+        self.planes = numpy.empty((7, height, width), dtype=numpy.intc)
+        self._bind_planes()
         self.clear(back_r, back_g, back_b, fore_r, fore_g, fore_b, char)
 
+    def _bind_planes(self):
+        # views into self.planes: back is (r, g, b), fore is (r, g, b)
+        self.back = self.planes[0:3]
+        self.fore = self.planes[3:6]
+        (self.back_r, self.back_g, self.back_b,
+         self.fore_r, self.fore_g, self.fore_b, self.char) = self.planes
+        self._pointers = [plane.ctypes.data_as(POINTER(c_int))
+                          for plane in self.planes]
+
     def clear(self, back_r=0, back_g=0, back_b=0, fore_r=0, fore_g=0, fore_b=0, char=' '):
         # clears the console. values to fill it with are optional, defaults
         # to black with no characters.
-        n = self.width * self.height
-        self.back_r = [back_r] * n
-        self.back_g = [back_g] * n
-        self.back_b = [back_b] * n
-        self.fore_r = [fore_r] * n
-        self.fore_g = [fore_g] * n
-        self.fore_b = [fore_b] * n
-        self.char = [ord(char)] * n
+        for plane, value in zip(self.planes, (back_r, back_g, back_b,
+                                              fore_r, fore_g, fore_b,
+                                              ord(char))):
+            plane.fill(value)
 
     def copy(self):
         # returns a copy of this ConsoleBuffer.
-        other = ConsoleBuffer(0, 0)
+        other = ConsoleBuffer.__new__(ConsoleBuffer)
         other.width = self.width
         other.height = self.height
-        other.back_r = list(self.back_r)  # make explicit copies of all lists
-        other.back_g = list(self.back_g)
-        other.back_b = list(self.back_b)
-        other.fore_r = list(self.fore_r)
-        other.fore_g = list(self.fore_g)
-        other.fore_b = list(self.fore_b)
-        other.char = list(self.char)
+        other.planes = self.planes.copy()
+        other._bind_planes()
         return other
 
     def set_fore(self, x, y, r, g, b, char):
         # set the character and foreground color of one cell.
-        i = self.width * y + x
-        self.fore_r[i] = r
-        self.fore_g[i] = g
-        self.fore_b[i] = b
-        self.char[i] = ord(char)
+        self.fore[:, y, x] = r, g, b
+        self.char[y, x] = ord(char)
 
     def set_back(self, x, y, r, g, b):
         # set the background color of one cell.
-        i = self.width * y + x
-        self.back_r[i] = r
-        self.back_g[i] = g
-        self.back_b[i] = b
+        self.back[:, y, x] = r, g, b
 
     def set(self, x, y, back_r, back_g, back_b, fore_r, fore_g, fore_b, char):
         # set the background color, foreground color and character of one cell.
-        i = self.width * y + x
-        self.back_r[i] = back_r
-        self.back_g[i] = back_g
-        self.back_b[i] = back_b
-        self.fore_r[i] = fore_r
-        self.fore_g[i] = fore_g
-        self.fore_b[i] = fore_b
-        self.char[i] = ord(char)
+        self.planes[:, y, x] = (back_r, back_g, back_b,
+                                fore_r, fore_g, fore_b, ord(char))
 
     def blit(self, dest, fill_fore=True, fill_back=True):
-        # use libtcod's "fill" functions to write the buffer to a console.
+        # use libtcod's "fill" functions to write the whole buffer to a
+        # console of the same size, straight from the planes' memory.
         if (console_get_width(dest) != self.width or
                 console_get_height(dest) != self.height):
             raise ValueError(
                 'ConsoleBuffer.blit: Destination console has an incorrect size.')
 
-        s = struct.Struct('%di' % len(self.back_r))
-
         if fill_back:
-            _lib.TCOD_console_fill_background(dest, (c_int * len(self.back_r))(*self.back_r), (
-                c_int * len(self.back_g))(*self.back_g), (c_int * len(self.back_b))(*self.back_b))
+            _lib.TCOD_console_fill_background(dest, *self._pointers[0:3])
 
         if fill_fore:
-            _lib.TCOD_console_fill_foreground(dest, (c_int * len(self.fore_r))(*self.fore_r), (
-                c_int * len(self.fore_g))(*self.fore_g), (c_int * len(self.fore_b))(*self.fore_b))
-            _lib.TCOD_console_fill_char(
-                dest, (c_int * len(self.char))(*self.char))
+            _lib.TCOD_console_fill_foreground(dest, *self._pointers[3:6])
+            _lib.TCOD_console_fill_char(dest, self._pointers[6])
 
 _lib.TCOD_console_credits_render.restype = c_bool
 _lib.TCOD_console_is_fullscreen.restype = c_bool
@@ -1006,10 +1005,11 @@ def console_fill_foreground(con, r, g, b):
 
     if (numpy_available and isinstance(r, numpy.ndarray) and
             isinstance(g, numpy.ndarray) and isinstance(b, numpy.ndarray)):
-        # numpy arrays, use numpy's ctypes functions
-        r = numpy.ascontiguousarray(r, dtype=numpy.int_)
-        g = numpy.ascontiguousarray(g, dtype=numpy.int_)
-        b = numpy.ascontiguousarray(b, dtype=numpy.int_)
+        # numpy arrays, use numpy's ctypes functions. contiguous C int
+        # arrays are passed by pointer without a copy
+        r = numpy.ascontiguousarray(r, dtype=numpy.intc)
+        g = numpy.ascontiguousarray(g, dtype=numpy.intc)
+        b = numpy.ascontiguousarray(b, dtype=numpy.intc)
         cr = r.ctypes.data_as(POINTER(c_int))
         cg = g.ctypes.data_as(POINTER(c_int))
         cb = b.ctypes.data_as(POINTER(c_int))
@@ -1028,10 +1028,11 @@ def console_fill_background(con, r, g, b):
 
     if (numpy_available and isinstance(r, numpy.ndarray) and
             isinstance(g, numpy.ndarray) and isinstance(b, numpy.ndarray)):
-        # numpy arrays, use numpy's ctypes functions
-        r = numpy.ascontiguousarray(r, dtype=numpy.int_)
-        g = numpy.ascontiguousarray(g, dtype=numpy.int_)
-        b = numpy.ascontiguousarray(b, dtype=numpy.int_)
+        # numpy arrays, use numpy's ctypes functions. contiguous C int
+        # arrays are passed by pointer without a copy
+        r = numpy.ascontiguousarray(r, dtype=numpy.intc)
+        g = numpy.ascontiguousarray(g, dtype=numpy.intc)
+        b = numpy.ascontiguousarray(b, dtype=numpy.intc)
         cr = r.ctypes.data_as(POINTER(c_int))
         cg = g.ctypes.data_as(POINTER(c_int))
         cb = b.ctypes.data_as(POINTER(c_int))
@@ -1046,8 +1047,9 @@ def console_fill_background(con, r, g, b):
 
 def console_fill_char(con, arr):
     if (numpy_available and isinstance(arr, numpy.ndarray)):
-        # numpy arrays, use numpy's ctypes functions
-        arr = numpy.ascontiguousarray(arr, dtype=numpy.int_)
+        # numpy arrays, use numpy's ctypes functions. contiguous C int
+        # arrays are passed by pointer without a copy
+        arr = numpy.ascontiguousarray(arr, dtype=numpy.intc)
         carr = arr.ctypes.data_as(POINTER(c_int))
     else:
         # otherwise convert using the struct module
@@ -0,0 +1,633 @@
+"""Pure-Python stand-in for the parts of libtcod the game uses.
+
+tcod.py binds its wrapper functions to this module instead of the native
+library when the MEDICALRL_HEADLESS environment variable is set, so the game,
+tests and benchmarks can run on machines without SDL or a display.
+
+Consoles keep their characters and colors in numpy planes indexed [y, x].
+Input comes from a scripted queue filled with push_key/push_char/push_text;
+once the queue runs dry the window reports itself closed, which ends the
+menu and game loops the same way closing a real window does.
+"""
+from collections import deque
+import ctypes
+import time
+from textwrap import wrap
+
+import numpy
+
+
+# values mirrored from tcod.py, which imports this module before defining them
+BKGND_NONE = 0
+BKGND_SET = 1
+BKGND_MULTIPLY = 2
+BKGND_LIGHTEN = 3
+BKGND_DARKEN = 4
+BKGND_ADD = 8
+BKGND_ALPH = 12
+BKGND_DEFAULT = 13
+LEFT = 0
+RIGHT = 1
+CENTER = 2
+KEY_CHAR = 65
+EVENT_NONE = 0
+EVENT_KEY_PRESS = 1
+EVENT_KEY_RELEASE = 2
+EVENT_KEY = EVENT_KEY_PRESS | EVENT_KEY_RELEASE
+
+
+class Console(object):
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.ch = numpy.full((height, width), ord(' '), dtype=numpy.intc)
+        self.fg = numpy.full((height, width, 3), 255, dtype=numpy.uint8)
+        self.bg = numpy.zeros((height, width, 3), dtype=numpy.uint8)
+        self.default_fg = (255, 255, 255)
+        self.default_bg = (0, 0, 0)
+        self.bkgnd_flag = BKGND_NONE
+        self.alignment = LEFT
+        self.key_color = None
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def clear(self):
+        self.ch[...] = ord(' ')
+        self.fg[...] = self.default_fg
+        self.bg[...] = self.default_bg
+
+    def set_back(self, x, y, col, flag):
+        if flag == BKGND_DEFAULT:
+            flag = self.bkgnd_flag
+        mode = flag & 0xff
+        if mode == BKGND_NONE:
+            return
+        old = self.bg[y, x].tolist()
+        if mode == BKGND_MULTIPLY:
+            new = [o * c // 255 for o, c in zip(old, col)]
+        elif mode == BKGND_LIGHTEN:
+            new = [max(o, c) for o, c in zip(old, col)]
+        elif mode == BKGND_DARKEN:
+            new = [min(o, c) for o, c in zip(old, col)]
+        elif mode == BKGND_ADD:
+            new = [min(255, o + c) for o, c in zip(old, col)]
+        elif mode == BKGND_ALPH:
+            alpha = (flag >> 8) / 255
+            new = [int(o + (c - o) * alpha) for o, c in zip(old, col)]
+        else:
+            # the remaining blend modes are approximated by a plain set
+            new = col
+        self.bg[y, x] = new
+
+    def text_lines(self, text, width):
+        lines = []
+        for paragraph in text.split('\n'):
+            lines.extend(wrap(paragraph, width) or [''])
+        return lines
+
+    def print_line(self, x, y, line, flag, alignment):
+        if alignment == RIGHT:
+            x -= len(line) - 1
+        elif alignment == CENTER:
+            x -= len(line) // 2
+        if not 0 <= y < self.height:
+            return
+        for i, char in enumerate(line):
+            cx = x + i
+            if 0 <= cx < self.width:
+                self.ch[y, cx] = ord(char)
+                self.fg[y, cx] = self.default_fg
+                self.set_back(cx, y, self.default_bg, flag)
+
+    def print_rect(self, x, y, w, h, text, flag, alignment, draw=True):
+        if w == 0:
+            w = self.width - x
+        if h == 0:
+            h = self.height - y
+        lines = self.text_lines(text, w)[:h]
+        if draw:
+            for i, line in enumerate(lines):
+                if alignment == RIGHT:
+                    lx = x + w - 1
+                elif alignment == CENTER:
+                    lx = x + w // 2
+                else:
+                    lx = x
+                self.print_line(lx, y + i, line, flag, alignment)
+        return len(lines)
+
+
+class Image(object):
+
+    def __init__(self, width, height, filename=None):
+        self.width = width
+        self.height = height
+        self.filename = filename
+
+
+class _State(object):
+
+    def __init__(self):
+        self.consoles = {}
+        self.images = {}
+        self.next_handle = 1
+        self.root = None
+        self.fullscreen = False
+        self.window_closed = False
+        self.events = deque()
+        self.fps = 0
+        self.frames = 0
+        self.start = time.perf_counter()
+        self.last_flush = self.start
+        self.last_frame_length = 0.0
+
+
+_state = _State()
+
+
+def reset():
+    """Forget every console, image and queued event and reopen the window."""
+    global _state
+    _state = _State()
+
+
+def get_console(con=0):
+    """Returns the Console behind a handle; 0 or None is the root console."""
+    con = _unwrap(con)
+    if not con:
+        if _state.root is None:
+            raise RuntimeError('The root console has not been initialized.')
+        return _state.root
+    return _state.consoles[con]
+
+
+def push_key(vk, c=0, pressed=True, shift=False, lalt=False, lctrl=False):
+    """Queues a key event for sys_check_for_event/sys_wait_for_event."""
+    _state.window_closed = False
+    _state.events.append((EVENT_KEY_PRESS if pressed else EVENT_KEY_RELEASE,
+                          dict(vk=vk, c=c, pressed=pressed, shift=shift,
+                               lalt=lalt, lctrl=lctrl, ralt=False,
+                               rctrl=False)))
+
+
+def push_char(char):
+    push_key(KEY_CHAR, ord(char))
+
+
+def push_text(text):
+    for char in text:
+        push_char(char)
+
+
+def close_window():
+    _state.window_closed = True
+
+
+def pending_events():
+    return len(_state.events)
+
+
+def frame_count():
+    return _state.frames
+
+
+def _unwrap(arg):
+    """Strips the ctypes wrappers tcod.py puts around arguments."""
+    if isinstance(arg, (ctypes._SimpleCData, ctypes.c_char_p)):
+        return arg.value
+    obj = getattr(arg, '_obj', None)
+    if obj is not None:
+        return obj
+    return arg
+
+
+def _text(fmt):
+    fmt = _unwrap(fmt)
+    if isinstance(fmt, bytes):
+        return fmt.decode('latin-1')
+    return fmt
+
+
+def _rgb(col):
+    return (col.r, col.g, col.b)
+
+
+def _color(rgb):
+    from tcod import Color
+    return Color(*(int(v) for v in rgb))
+
+
+def _clamp(v):
+    return max(0, min(255, int(v)))
+
+
+def _add_handle(table, obj):
+    handle = _state.next_handle
+    _state.next_handle += 1
+    table[handle] = obj
+    return handle
+
+
+def _int_plane(carr, n):
+    if isinstance(carr, (bytes, bytearray)):
+        return numpy.frombuffer(carr, dtype=numpy.intc, count=n)
+    if isinstance(carr, ctypes.Array):
+        return numpy.ctypeslib.as_array(carr)[:n]
+    return numpy.ctypeslib.as_array(carr, shape=(n,))
+
+
+def _unsupported(name):
+    def unsupported(*args):
+        raise NotImplementedError(name + ' is not available headless.')
+    unsupported.__name__ = name
+    return unsupported
+
+
+# tcod.py sets the return types of these when it is imported, so they have to
+# exist, but the game never calls them
+for _name in (
+        'TCOD_bsp_contains', 'TCOD_bsp_father', 'TCOD_bsp_find_node',
+        'TCOD_bsp_is_leaf', 'TCOD_bsp_left', 'TCOD_bsp_new_with_size',
+        'TCOD_bsp_right', 'TCOD_console_get_fading_color',
+        'TCOD_console_is_key_pressed', 'TCOD_dijkstra_get_distance',
+        'TCOD_dijkstra_is_empty', 'TCOD_dijkstra_path_set',
+        'TCOD_dijkstra_path_walk', 'TCOD_heightmap_get_value',
+        'TCOD_heightmap_has_land_on_border', 'TCOD_heightmap_new',
+        'TCOD_image_get_mipmap_pixel', 'TCOD_image_get_pixel',
+        'TCOD_image_is_pixel_transparent', 'TCOD_line', 'TCOD_line_step',
+        'TCOD_line_step_mt', 'TCOD_map_is_in_fov', 'TCOD_map_is_transparent',
+        'TCOD_map_is_walkable', 'TCOD_namegen_generate',
+        'TCOD_namegen_generate_custom', 'TCOD_noise_get', 'TCOD_noise_get_ex',
+        'TCOD_noise_get_fbm', 'TCOD_noise_get_fbm_ex',
+        'TCOD_noise_get_turbulence', 'TCOD_noise_get_turbulence_ex',
+        'TCOD_parser_get_bool_property', 'TCOD_parser_get_color_property',
+        'TCOD_parser_get_float_property', 'TCOD_parser_get_string_property',
+        'TCOD_path_compute', 'TCOD_path_is_empty', 'TCOD_path_walk',
+        'TCOD_random_get_double', 'TCOD_random_get_float',
+        'TCOD_struct_get_name', 'TCOD_struct_is_mandatory'):
+    globals()[_name] = _unsupported(_name)
+del _name
+
+
+# color module
+
+def TCOD_color_equals(c1, c2):
+    return _rgb(c1) == _rgb(c2)
+
+
+def TCOD_color_add(c1, c2):
+    return _color(_clamp(a + b) for a, b in zip(_rgb(c1), _rgb(c2)))
+
+
+def TCOD_color_subtract(c1, c2):
+    return _color(_clamp(a - b) for a, b in zip(_rgb(c1), _rgb(c2)))
+
+
+def TCOD_color_multiply(c1, c2):
+    return _color(a * b // 255 for a, b in zip(_rgb(c1), _rgb(c2)))
+
+
+def TCOD_color_multiply_scalar(c, value):
+    value = _unwrap(value)
+    return _color(_clamp(a * value) for a in _rgb(c))
+
+
+def TCOD_color_lerp(c1, c2, coef):
+    coef = _unwrap(coef)
+    return _color(a + (b - a) * coef for a, b in zip(_rgb(c1), _rgb(c2)))
+
+
+# console module
+
+def TCOD_console_init_root(w, h, title, fullscreen, renderer):
+    _state.root = Console(w, h)
+    _state.fullscreen = bool(_unwrap(fullscreen))
+
+
+def TCOD_console_set_custom_font(font_file, flags, nb_char_horiz,
+                                 nb_char_vertic):
+    pass
+
+
+def TCOD_console_set_window_title(title):
+    pass
+
+
+def TCOD_console_is_fullscreen():
+    return _state.fullscreen
+
+
+def TCOD_console_set_fullscreen(fullscreen):
+    _state.fullscreen = bool(_unwrap(fullscreen))
+
+
+def TCOD_console_is_window_closed():
+    return _state.window_closed
+
+
+def TCOD_console_flush():
+    now = time.perf_counter()
+    _state.last_frame_length = now - _state.last_flush
+    _state.last_flush = now
+    _state.frames += 1
+
+
+def TCOD_console_new(w, h):
+    return _add_handle(_state.consoles, Console(w, h))
+
+
+def TCOD_console_delete(con):
+    con = _unwrap(con)
+    if con:
+        del _state.consoles[con]
+    else:
+        _state.root = None
+
+
+def TCOD_console_get_width(con):
+    return get_console(con).width
+
+
+def TCOD_console_get_height(con):
+    return get_console(con).height
+
+
+def TCOD_console_set_default_foreground(con, col):
+    get_console(con).default_fg = _rgb(col)
+
+
+def TCOD_console_set_default_background(con, col):
+    get_console(con).default_bg = _rgb(col)
+
+
+def TCOD_console_get_default_foreground(con):
+    return _color(get_console(con).default_fg)
+
+
+def TCOD_console_get_default_background(con):
+    return _color(get_console(con).default_bg)
+
+
+def TCOD_console_set_background_flag(con, flag):
+    get_console(con).bkgnd_flag = _unwrap(flag)
+
+
+def TCOD_console_get_background_flag(con):
+    return get_console(con).bkgnd_flag
+
+
+def TCOD_console_set_alignment(con, alignment):
+    get_console(con).alignment = _unwrap(alignment)
+
+
+def TCOD_console_get_alignment(con):
+    return get_console(con).alignment
+
+
+def TCOD_console_set_key_color(con, col):
+    get_console(con).key_color = _rgb(col)
+
+
+def TCOD_console_clear(con):
+    get_console(con).clear()
+
+
+def TCOD_console_put_char(con, x, y, c, flag):
+    console = get_console(con)
+    if console.in_bounds(x, y):
+        console.ch[y, x] = c
+        console.fg[y, x] = console.default_fg
+        console.set_back(x, y, console.default_bg, flag)
+
+
+def TCOD_console_put_char_ex(con, x, y, c, fore, back):
+    console = get_console(con)
+    if console.in_bounds(x, y):
+        console.ch[y, x] = c
+        console.fg[y, x] = _rgb(fore)
+        console.bg[y, x] = _rgb(back)
+
+
+def TCOD_console_set_char(con, x, y, c):
+    console = get_console(con)
+    if console.in_bounds(x, y):
+        console.ch[y, x] = c
+
+
+def TCOD_console_set_char_foreground(con, x, y, col):
+    console = get_console(con)
+    if console.in_bounds(x, y):
+        console.fg[y, x] = _rgb(col)
+
+
+def TCOD_console_set_char_background(con, x, y, col, flag):
+    console = get_console(con)
+    if console.in_bounds(x, y):
+        console.set_back(x, y, _rgb(col), flag)
+
+
+def TCOD_console_get_char(con, x, y):
+    return int(get_console(con).ch[y, x])
+
+
+def TCOD_console_get_char_foreground(con, x, y):
+    return _color(get_console(con).fg[y, x])
+
+
+def TCOD_console_get_char_background(con, x, y):
+    return _color(get_console(con).bg[y, x])
+
+
+def TCOD_console_print(con, x, y, fmt):
+    console = get_console(con)
+    TCOD_console_print_ex(con, x, y, console.bkgnd_flag, console.alignment,
+                          fmt)
+
+
+def TCOD_console_print_ex(con, x, y, flag, alignment, fmt):
+    console = get_console(con)
+    for i, line in enumerate(_text(fmt).split('\n')):
+        console.print_line(x, y + i, line, flag, alignment)
+
+
+def TCOD_console_print_rect(con, x, y, w, h, fmt):
+    console = get_console(con)
+    return console.print_rect(x, y, w, h, _text(fmt), console.bkgnd_flag,
+                              console.alignment)
+
+
+def TCOD_console_print_rect_ex(con, x, y, w, h, flag, alignment, fmt):
+    return get_console(con).print_rect(x, y, w, h, _text(fmt), flag,
+                                       alignment)
+
+
+def TCOD_console_get_height_rect(con, x, y, w, h, fmt):
+    console = get_console(con)
+    return console.print_rect(x, y, w, h, _text(fmt), BKGND_NONE, LEFT,
+                              draw=False)
+
+
+TCOD_console_print_utf = TCOD_console_print
+TCOD_console_print_ex_utf = TCOD_console_print_ex
+TCOD_console_print_rect_utf = TCOD_console_print_rect
+TCOD_console_print_rect_ex_utf = TCOD_console_print_rect_ex
+TCOD_console_get_height_rect_utf = TCOD_console_get_height_rect
+
+
+def TCOD_console_rect(con, x, y, w, h, clear, flag):
+    console = get_console(con)
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + w, console.width), min(y + h, console.height)
+    for cy in range(y0, y1):
+        for cx in range(x0, x1):
+            console.set_back(cx, cy, console.default_bg, flag)
+    if _unwrap(clear):
+        console.ch[y0:y1, x0:x1] = ord(' ')
+
+
+def TCOD_console_blit(src, x, y, w, h, dst, xdst, ydst, ffade, bfade):
+    src = get_console(src)
+    dst = get_console(dst)
+    if w == 0:
+        w = src.width
+    if h == 0:
+        h = src.height
+    # clip the source rectangle against both consoles
+    if x < 0:
+        w, xdst, x = w + x, xdst - x, 0
+    if y < 0:
+        h, ydst, y = h + y, ydst - y, 0
+    if xdst < 0:
+        w, x, xdst = w + xdst, x - xdst, 0
+    if ydst < 0:
+        h, y, ydst = h + ydst, y - ydst, 0
+    w = min(w, src.width - x, dst.width - xdst)
+    h = min(h, src.height - y, dst.height - ydst)
+    if w <= 0 or h <= 0:
+        return
+    ffade, bfade = _unwrap(ffade), _unwrap(bfade)
+    source = numpy.s_[y:y + h, x:x + w]
+    dest = numpy.s_[ydst:ydst + h, xdst:xdst + w]
+    mask = numpy.ones((h, w), dtype=bool)
+    if src.key_color is not None:
+        mask = (src.bg[source] != src.key_color).any(axis=2)
+    if bfade == 1.0:
+        bg = src.bg[source]
+    else:
+        bg = dst.bg[dest] + (src.bg[source] - dst.bg[dest].astype(float)) \
+            * bfade
+    if ffade == 1.0:
+        fg = src.fg[source]
+    else:
+        fg = dst.fg[dest] + (src.fg[source] - dst.fg[dest].astype(float)) \
+            * ffade
+    dst.bg[dest][mask] = bg[mask]
+    dst.fg[dest][mask] = fg[mask]
+    dst.ch[dest][mask] = src.ch[source][mask]
+
+
+def TCOD_console_fill_foreground(con, r, g, b):
+    console = get_console(con)
+    n = console.width * console.height
+    for i, plane in enumerate((r, g, b)):
+        console.fg[..., i] = _int_plane(plane, n).reshape(console.ch.shape)
+
+
+def TCOD_console_fill_background(con, r, g, b):
+    console = get_console(con)
+    n = console.width * console.height
+    for i, plane in enumerate((r, g, b)):
+        console.bg[..., i] = _int_plane(plane, n).reshape(console.ch.shape)
+
+
+def TCOD_console_fill_char(con, arr):
+    console = get_console(con)
+    console.ch[...] = _int_plane(arr, console.width * console.height) \
+        .reshape(console.ch.shape)
+
+
+def TCOD_console_credits_render(x, y, alpha):
+    return True
+
+
+# system module
+
+def TCOD_sys_set_fps(fps):
+    _state.fps = fps
+
+
+def TCOD_sys_get_fps():
+    return _state.fps
+
+
+def TCOD_sys_get_last_frame_length():
+    return _state.last_frame_length
+
+
+def TCOD_sys_elapsed_milli():
+    return int((time.perf_counter() - _state.start) * 1000)
+
+
+def TCOD_sys_elapsed_seconds():
+    return time.perf_counter() - _state.start
+
+
+def TCOD_sys_sleep_milli(val):
+    pass
+
+
+def TCOD_sys_set_renderer(renderer):
+    pass
+
+
+def TCOD_sys_check_for_event(mask, key, mouse):
+    mask = _unwrap(mask)
+    key = _unwrap(key)
+    key.vk = key.c = 0
+    key.pressed = key.lalt = key.lctrl = key.ralt = key.rctrl = \
+        key.shift = False
+    while _state.events:
+        event, fields = _state.events.popleft()
+        if event & mask:
+            for field, value in fields.items():
+                setattr(key, field, value)
+            return event
+    # nothing left to feed the game, so behave like the window was closed
+    _state.window_closed = True
+    return EVENT_NONE
+
+
+def TCOD_sys_wait_for_event(mask, key, mouse, flush):
+    return TCOD_sys_check_for_event(mask, key, mouse)
+
+
+def TCOD_mouse_show_cursor(visible):
+    pass
+
+
+def TCOD_mouse_is_cursor_visible():
+    return False
+
+
+def TCOD_mouse_move(x, y):
+    pass
+
+
+# image module
+
+def TCOD_image_new(width, height):
+    return _add_handle(_state.images, Image(width, height))
+
+
+def TCOD_image_load(filename):
+    return _add_handle(_state.images, Image(0, 0, _unwrap(filename)))
+
+
+def TCOD_image_delete(image):
+    del _state.images[_unwrap(image)]
+
+
+def TCOD_image_blit_2x(image, console, dx, dy, sx, sy, w, h):
+    pass
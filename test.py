@@ -1,7 +1,32 @@
+import gc
+import os
+import random
 import unittest
-from mob import Mob
+import weakref
+
+os.environ.setdefault('MEDICALRL_HEADLESS', '1')
+
+import numpy
+from benchmarks import render, suite
+import events
+import fov
+import game
+import path
+import rng
+import simulate
+import tcod
+import tcod_headless
+import ui
+from mob import Mob, MobState
+from scheduler import Scheduler
 from util import Pos
-from world import mobinfo, Level, World
+import vitals
+import world
+from world import HOSPITAL_WALL, Level, World, Rect, create_object, dig, \
+    dig_rect, generate_hospital, undig
+
+# data.json ships without any mobs, so tests bring their own
+ORC = {'name': 'orc', 'char': 'o', 'fg_color': 'green', 'hp': 10}
 
 
 class TestPos(unittest.TestCase):
@@ -49,6 +74,23 @@ class TestPos(unittest.TestCase):
         self.assertEquals(y, 2)
         self.assertEquals(Pos(1, 2), (1, 2))
 
+    def test_hash(self):
+        self.assertEqual(hash(Pos(3, 4)), hash((3, 4)))
+        self.assertIn((3, 4), {Pos(3, 4)})
+        self.assertEqual({(3, 4): 'a'}[Pos(3, 4)], 'a')
+        self.assertIn(Pos(-3, 4000), {(-3, 4000)})
+
+    def test_interned(self):
+        self.assertIs(Pos(5, 6), Pos(5, 6))
+        self.assertIs(Pos((5, 6)), Pos(2, 3) + Pos(3, 3))
+        self.assertEqual(Pos(-5, 100000), Pos(-5, 100000))
+
+    def test_immutable(self):
+        pos = Pos(1, 2)
+        with self.assertRaises(AttributeError):
+            pos.x = 5
+        self.assertEqual(pos, Pos(1, 2))
+
 
 class WorldTest(unittest.TestCase):
     def test_out_of_bounds(self):
@@ -58,25 +100,900 @@ class WorldTest(unittest.TestCase):
         self.assertNotIn((-1, -1), level)
         self.assertIn((50, 50), level)
 
-        self.assertEquals(level[(-1, -1)].name, 'stone wall')
+        self.assertEquals(level[(-1, -1)].name, 'hospital wall')
         self.assertTrue(level[(-1, -1)].blocked)
         self.assertTrue(level[(-1, -1)].opaque)
         self.assertFalse(level[(-1, -1)].explored)
 
-        self.assertEquals(level[(101, 101)].name, 'stone wall')
+        self.assertEquals(level[(101, 101)].name, 'hospital wall')
         self.assertTrue(level[(101, 101)].blocked)
         self.assertTrue(level[(101, 101)].opaque)
         self.assertFalse(level[(101, 101)].explored)
 
+        # far past the padded border, where there is nothing to index
+        for pos in ((-1000, 50), (50, 1000), (10 ** 6, -10 ** 6)):
+            self.assertTrue(level.is_blocked(pos))
+            self.assertTrue(level.is_opaque(pos))
+            self.assertEqual(level.get_tile_type(*pos), HOSPITAL_WALL)
+
+        # every out of bounds read shares one immutable tile
+        self.assertIs(level[(-1, -1)], level[(500, 3)])
+        with self.assertRaises(AttributeError):
+            level[(-1, -1)].explored = True
+
+        # the padded border reads as wall without bounds checks
+        self.assertTrue(level.is_blocked((-1, 50)))
+        self.assertTrue(level.is_opaque((100 + level.border - 1, 50)))
+
+    def test_reveal_tile(self):
+        play = game.Game(seed=1, headless=True)
+        level = play.player_level
+        pos = next(Pos(x, y) for x in range(level.width)
+                   for y in range(level.height) if not level[x, y].explored)
+        world.reveal_tile(level, pos)
+        self.assertTrue(level[pos].explored)
+        play.close()
+
+    def test_tiles(self):
+        level = Level(10, 10)
+        self.assertEqual(level[5, 5].name, 'hospital wall')
+        self.assertTrue(level[5, 5].blocked)
+
+        dig(level, 5, 5, room_id=2)
+        self.assertEqual(level[5, 5].name, 'tile floor')
+        self.assertFalse(level[5, 5].blocked)
+        self.assertFalse(level[5, 5].opaque)
+        self.assertEqual(level[5, 5].room_id, 2)
+
+        level[5, 5].explored = True
+        self.assertTrue(level[5, 5].explored)
+        self.assertFalse(level[5, 6].explored)
+
+        undig(level, 5, 5)
+        self.assertEqual(level[5, 5].name, 'hospital wall')
+        self.assertTrue(level[5, 5].opaque)
+
+    def test_blocked_and_opaque_maps(self):
+        level = Level(10, 10)
+        dig_rect(level, Rect(1, 1, 8, 8))
+        pos = Pos(3, 3)
+        self.assertFalse(level.is_blocked(pos))
+        self.assertTrue(level.is_blocked((0, 0)))
+        self.assertTrue(level.is_opaque((-1, 5)))
+
+        level.objects[pos] = create_object(pos, 'closed door')
+        self.assertTrue(level.is_blocked(pos))
+        self.assertTrue(level.is_opaque(pos))
+        level.objects[pos] = create_object(pos, 'open door')
+        self.assertFalse(level.is_blocked(pos))
+        self.assertFalse(level.is_opaque(pos))
+        level.pop_object(pos)
+        self.assertFalse(level.get_object(pos))
+
+        level.mobs[pos] = object()
+        self.assertTrue(level.is_blocked(pos))
+        self.assertFalse(level.is_opaque(pos))
+        level.move_mob(pos, Pos(4, 4))
+        self.assertFalse(level.is_blocked(pos))
+        self.assertTrue(level.is_blocked((4, 4)))
+
+        undig(level, 5, 5)
+        self.assertTrue(level.is_blocked((5, 5)))
+        self.assertTrue(level.is_opaque((5, 5)))
+
     def test_mobs(self):
         level = Level(25, 25)
         level.up_stairs_pos = Pos(1, 1)
         world = World([level])
 
-        mob = level.mobs[2, 2] = Mob(Pos(2, 2), 0, mobinfo['orc'])
+        mob = level.mobs[2, 2] = Mob(Pos(2, 2), 0, ORC)
         mob.move_to(Pos(3, 3))
         self.assertNotIn((2, 2), level.mobs)
         self.assertEquals(mob, level.mobs.get((3, 3)))
 
         self.assertEquals(level.mobs.get(world.levels[0].up_stairs_pos),
                           world.player)
+
+
+class FovTest(unittest.TestCase):
+    def assert_same_fov(self, level, positions, radii):
+        fov_map = fov.FovMap(level)
+        for pos in positions:
+            for radius in radii:
+                fov_map.compute(pos, radius)
+                self.assertEqual(
+                    set(fov_map.positions()),
+                    set(fov.calculate_fov_recursive(pos, radius, level)))
+
+    def test_matches_recursive_fov_in_hospital(self):
+        rng.seed(1)
+        level = generate_hospital()
+        floors = [Pos(x, y) for x in range(level.width)
+                  for y in range(level.height) if not level[x, y].blocked]
+        positions = random.sample(floors, 30) + [Pos(0, 0)]
+        self.assert_same_fov(level, positions, (1, 5, 40))
+
+    def test_matches_recursive_fov_near_edges(self):
+        random.seed(2)
+        level = Level(30, 30)
+        dig_rect(level, Rect(0, 0, 29, 29))
+        for i in range(60):
+            undig(level, random.randrange(30), random.randrange(30))
+        positions = [Pos(x, y) for x in range(0, 30, 4)
+                     for y in range(0, 30, 4)]
+        self.assert_same_fov(level, positions, (3, 40))
+
+    def test_reuse(self):
+        level = Level(10, 10)
+        dig_rect(level, Rect(1, 1, 8, 8))
+        fov_map = fov.FovMap(level)
+        fov_map.compute(Pos(2, 2), 2)
+        self.assertTrue(fov_map.visible[level.index(4, 4)])
+        fov_map.compute(Pos(7, 7), 1)
+        self.assertFalse(fov_map.visible[level.index(4, 4)])
+        self.assertEqual(len(fov_map.cells), 9)
+
+    def test_update_diff(self):
+        level = Level(20, 10)
+        dig_rect(level, Rect(1, 1, 18, 8))
+        fov_map = fov.FovMap(level)
+        revealed, hidden = fov_map.update(Pos(3, 3), 2)
+        self.assertEqual(len(revealed), 25)
+        self.assertEqual(len(hidden), 0)
+
+        old = set(fov.calculate_fov(Pos(3, 3), 2, level))
+        new = set(fov.calculate_fov(Pos(4, 3), 2, level))
+        revealed, hidden = fov_map.update(Pos(4, 3), 2)
+        self.assertEqual(set(map(level.pos_at, revealed)), new - old)
+        self.assertEqual(set(map(level.pos_at, hidden)), old - new)
+        self.assertEqual(set(fov_map.positions()), new)
+
+        revealed, hidden = fov_map.update(Pos(4, 3), 2)
+        self.assertEqual((len(revealed), len(hidden)), (0, 0))
+
+
+class PathTest(unittest.TestCase):
+    def setUp(self):
+        self.level = Level(20, 20)
+        dig_rect(self.level, Rect(1, 1, 18, 18))
+        # a wall across the room with a gap at the bottom
+        for y in range(1, 17):
+            undig(self.level, 10, y)
+
+    def test_adjacent(self):
+        self.assertEqual(path.get_path(Pos(2, 2), Pos(3, 3), self.level),
+                         [Pos(3, 3)])
+        self.assertEqual(path.get_path(Pos(2, 2), Pos(2, 2), self.level), [])
+
+    def test_shortest_path(self):
+        route = path.get_path(Pos(2, 2), Pos(8, 2), self.level)
+        self.assertEqual(len(route), 6)
+        self.assertEqual(route[-1], Pos(8, 2))
+
+        route = path.get_path(Pos(9, 2), Pos(11, 2), self.level)
+        # around the wall: down to the gap and back up
+        self.assertEqual(len(route), 2 * 15)
+        for a, b in zip([Pos(9, 2)] + route, route):
+            self.assertEqual(max(abs(a.x - b.x), abs(a.y - b.y)), 1)
+            self.assertFalse(self.level.is_blocked(b))
+
+    def test_unreachable(self):
+        self.assertEqual(path.get_path(Pos(2, 2), Pos(10, 5), self.level), [])
+        undig(self.level, 10, 17)
+        undig(self.level, 10, 18)
+        self.assertEqual(path.get_path(Pos(2, 2), Pos(15, 5), self.level), [])
+
+    def test_node_budget(self):
+        self.assertEqual(
+            path.get_path(Pos(9, 2), Pos(11, 2), self.level, max_nodes=20),
+            [])
+        self.assertTrue(
+            path.get_path(Pos(9, 2), Pos(11, 2), self.level, max_nodes=1000))
+
+    def test_level_collected(self):
+        level = Level(5, 5)
+        dig_rect(level, Rect(1, 1, 3, 3))
+        self.assertTrue(path.get_path(Pos(1, 1), Pos(3, 3), level))
+        ref = weakref.ref(level)
+        del level
+        gc.collect()
+        self.assertIsNone(ref())
+
+    def test_flow_field(self):
+        flow_fields = path.FlowFields(max_cost=1000)
+        field = flow_fields.get(self.level, Pos(11, 2))
+        self.assertIs(flow_fields.get(self.level, (11, 2)), field)
+
+        pos = Pos(9, 2)
+        steps = 0
+        while pos != Pos(11, 2):
+            pos = field.next_step(pos)
+            steps += 1
+        self.assertEqual(steps, 2 * 15)
+
+        # mobs in the way are stepped around, not through
+        self.level.mobs[Pos(9, 3)] = object()
+        self.assertNotEqual(field.next_step(Pos(8, 2)), Pos(9, 3))
+
+    def test_flow_field_invalidation(self):
+        flow_fields = path.FlowFields(max_cost=1000)
+        field = flow_fields.get(self.level, Pos(11, 2))
+        self.level.mobs[Pos(5, 5)] = object()
+        self.assertIs(flow_fields.get(self.level, Pos(11, 2)), field)
+
+        self.level.objects[Pos(10, 17)] = create_object(Pos(10, 17), 'bed')
+        self.level.objects[Pos(10, 18)] = create_object(Pos(10, 18), 'bed')
+        field = flow_fields.get(self.level, Pos(11, 2))
+        self.assertEqual(flow_fields.computed, 2)
+        self.assertFalse(field.covers(Pos(9, 2)))
+
+    def test_flow_field_reach(self):
+        flow_fields = path.FlowFields(max_cost=1000)
+        field = flow_fields.get(self.level, Pos(11, 2), 100)
+        self.assertFalse(field.covers(Pos(9, 2)))
+        self.assertIs(flow_fields.get(self.level, Pos(11, 2), 50), field)
+        self.assertIs(flow_fields.cached(self.level, Pos(11, 2)), field)
+        # asking for more reach builds a bigger field
+        field = flow_fields.get(self.level, Pos(11, 2), 400)
+        self.assertTrue(field.covers(Pos(9, 2)))
+        self.assertEqual(flow_fields.computed, 2)
+        self.assertIsNone(flow_fields.cached(self.level, Pos(2, 2)))
+
+    def test_group_next_step(self):
+        play = game.Game.__new__(game.Game)
+        play.routes = path.RouteCache()
+        play.flow_fields = path.FlowFields()
+        leader = Mob(Pos(9, 2), 0, {'name': 'orc', 'hp': 1})
+        group = [leader] + [Mob(pos, 0, {'name': 'orc', 'hp': 1},
+                                leader=leader)
+                            for pos in (Pos(9, 3), Pos(8, 2))]
+
+        # a short hop is left to A*
+        for member in group:
+            member.target = Pos(5, 5)
+            play.get_next_step(member, self.level)
+        self.assertEqual((play.flow_fields.computed, play.routes.replans),
+                         (0, 3))
+
+        # a long way is shared
+        for member in group:
+            member.target = Pos(11, 16)
+        for member in group:
+            self.assertEqual(play.get_next_step(member, self.level),
+                             path.get_path(member.pos, Pos(11, 16),
+                                           self.level)[0])
+        self.assertEqual((play.flow_fields.computed, play.routes.replans),
+                         (1, 3))
+
+    def test_route_cache(self):
+        routes = path.RouteCache()
+        mob = Mob(Pos(2, 2), 0, {'name': 'orc', 'hp': 1})
+        mob.target = Pos(8, 2)
+        mob.move_to(routes.next_step(mob, self.level))
+        self.assertEqual((routes.hits, routes.replans), (0, 1))
+        mob.move_to(routes.next_step(mob, self.level))
+        self.assertEqual((routes.hits, routes.replans), (1, 1))
+
+        # blocking the next step makes the mob plan around it
+        blocker = routes.routes[mob].steps[-1]
+        self.level.mobs[blocker] = object()
+        step = routes.next_step(mob, self.level)
+        self.assertNotEqual(step, blocker)
+        self.assertEqual(routes.replans, 2)
+        mob.move_to(step)
+
+        # so does a new target
+        mob.target = Pos(2, 2)
+        mob.move_to(routes.next_step(mob, self.level))
+        self.assertEqual(routes.replans, 3)
+        while mob.pos != mob.target:
+            mob.move_to(routes.next_step(mob, self.level))
+        self.assertEqual(routes.replans, 3)
+
+    def test_route_cache_failures(self):
+        # close the gap, so nothing gets past the wall
+        undig(self.level, 10, 17)
+        undig(self.level, 10, 18)
+        routes = path.RouteCache()
+        mob = Mob(Pos(2, 2), 0, {'name': 'orc', 'hp': 1})
+        mob.target = Pos(11, 2)
+        for i in range(3):
+            self.assertIsNone(routes.next_step(mob, self.level))
+        self.assertEqual((routes.replans, routes.failures,
+                          routes.failure_hits), (0, 1, 2))
+
+        # until the terrain changes
+        dig(self.level, 10, 18)
+        self.assertIsNotNone(routes.next_step(mob, self.level))
+        self.assertEqual((routes.replans, routes.failures), (1, 1))
+
+        # the game gives up on a target it cannot get to
+        undig(self.level, 10, 18)
+        play = game.Game.__new__(game.Game)
+        play.routes = routes
+        play.flow_fields = path.FlowFields()
+        self.assertEqual(play.update_mob(mob, self.level), 1)
+        self.assertIsNone(mob.target)
+
+
+@unittest.skipUnless(tcod.HEADLESS, 'needs the headless tcod backend')
+class HeadlessTest(unittest.TestCase):
+    def setUp(self):
+        tcod_headless.reset()
+        tcod.console_init_root(20, 10, b'test')
+
+    def test_print_and_blit(self):
+        con = tcod.console_new(5, 2)
+        tcod.console_set_default_foreground(con, tcod.red)
+        tcod.console_print(con, 1, 1, 'abc')
+        tcod.console_set_char_background(con, 0, 0, tcod.blue)
+        tcod.console_blit(con, 0, 0, 5, 2, 0, 10, 5)
+        self.assertEqual(chr(tcod.console_get_char(0, 12, 6)), 'b')
+        self.assertEqual(tcod.console_get_char_foreground(0, 12, 6),
+                         tcod.red)
+        self.assertEqual(tcod.console_get_char_background(0, 10, 5),
+                         tcod.blue)
+        self.assertEqual(tcod.console_get_height_rect(
+            0, 0, 0, 6, 0, 'one two three'), 3)
+
+    def test_blit_fade(self):
+        con = tcod.console_new(1, 1)
+        tcod.console_set_char_foreground(con, 0, 0, tcod.Color(200, 0, 0))
+        tcod.console_set_char_background(con, 0, 0, tcod.Color(0, 0, 200))
+        tcod.console_set_char_foreground(0, 0, 0, tcod.Color(0, 100, 0))
+        tcod.console_set_char_background(0, 0, 0, tcod.Color(0, 0, 0))
+        tcod.console_blit(con, 0, 0, 1, 1, 0, 0, 0, 0.5, 0.5)
+        self.assertEqual(tcod.console_get_char_foreground(0, 0, 0),
+                         tcod.Color(100, 50, 0))
+        self.assertEqual(tcod.console_get_char_background(0, 0, 0),
+                         tcod.Color(0, 0, 100))
+
+    def test_missing_function(self):
+        with self.assertRaises(AttributeError):
+            tcod_headless.TCOD_console_no_such_function
+
+    def test_scripted_input(self):
+        key = tcod.Key()
+        mouse = tcod.Mouse()
+        tcod_headless.push_char('g')
+        tcod_headless.push_key(tcod.KEY_ESCAPE)
+        tcod.sys_check_for_event(tcod.EVENT_KEY_PRESS, key, mouse)
+        self.assertEqual(chr(key.c), 'g')
+        tcod.sys_wait_for_event(tcod.EVENT_KEY_PRESS, key, mouse, True)
+        self.assertEqual(key.vk, tcod.KEY_ESCAPE)
+        self.assertFalse(tcod.console_is_window_closed())
+        # running out of input closes the window
+        tcod.sys_check_for_event(tcod.EVENT_KEY_PRESS, key, mouse)
+        self.assertEqual(key.vk, tcod.KEY_NONE)
+        self.assertTrue(tcod.console_is_window_closed())
+
+    def test_console_buffer(self):
+        con = tcod.console_new(4, 3)
+        buffer = tcod.ConsoleBuffer(4, 3, back_b=80, char='.')
+        buffer.set(1, 2, 1, 2, 3, 4, 5, 6, '@')
+        buffer.fore[:, 0] = [[10], [20], [30]]
+        buffer.blit(con)
+        self.assertEqual(chr(tcod.console_get_char(con, 1, 2)), '@')
+        self.assertEqual(chr(tcod.console_get_char(con, 3, 1)), '.')
+        self.assertEqual(tcod.console_get_char_background(con, 1, 2),
+                         tcod.Color(1, 2, 3))
+        self.assertEqual(tcod.console_get_char_background(con, 0, 0),
+                         tcod.Color(0, 0, 80))
+        self.assertEqual(tcod.console_get_char_foreground(con, 3, 0),
+                         tcod.Color(10, 20, 30))
+
+        # copies own their planes
+        other = buffer.copy()
+        other.set_fore(1, 2, 0, 0, 0, '#')
+        self.assertEqual(chr(buffer.char[2, 1]), '@')
+        other.blit(con, fill_back=False)
+        self.assertEqual(chr(tcod.console_get_char(con, 1, 2)), '#')
+        self.assertEqual(tcod.console_get_char_background(con, 1, 2),
+                         tcod.Color(1, 2, 3))
+
+        # arrays of any integer type are converted to C ints
+        tcod.console_fill_char(con, numpy.full(12, ord('x'),
+                                               dtype=numpy.int64))
+        self.assertEqual(chr(tcod.console_get_char(con, 3, 2)), 'x')
+
+
+@unittest.skipUnless(tcod.HEADLESS, 'needs the headless tcod backend')
+class RenderTest(unittest.TestCase):
+    def setUp(self):
+        tcod_headless.reset()
+        tcod.console_init_root(20, 10, b'test')
+        rand = random.Random(5)
+        tiles = ['hospital wall', 'tile floor', 'water', 'grass']
+        items = [name for name in world.data['objects'] if name != 'default']
+        get_id = ui.palette.get_id
+        self.layers = ui.MapMemory(30, 20)
+        self.positions = []
+        for x in range(30):
+            for y in range(20):
+                if rand.random() < 0.2:
+                    continue
+                self.positions.append(Pos(x, y))
+                self.layers.terrain[y, x] = get_id(rand.choice(tiles))
+                if rand.random() < 0.2:
+                    self.layers.objects[y, x] = get_id(rand.choice(items))
+                if rand.random() < 0.1:
+                    self.layers.mobs[y, x] = get_id('player')
+                self.layers.visible[y, x] = rand.random() < 0.5
+
+    def assert_same_console(self, con, other):
+        con = tcod_headless.get_console(con)
+        other = tcod_headless.get_console(other)
+        self.assertTrue((con.ch == other.ch).all())
+        self.assertTrue((con.fg == other.fg).all())
+        self.assertTrue((con.bg == other.bg).all())
+
+    def test_redraw_level(self):
+        window = ui.MapWindow(0, 0, 16, 12)
+        reference = ui.MapWindow(0, 0, 16, 12)
+        reference.layers = self.layers
+        for center in [Pos(15, 10), Pos(0, 0), Pos(29, 19), Pos(40, 3)]:
+            window.center(center)
+            window.redraw_level(self.layers)
+            reference.center(center)
+            render.draw_per_cell(reference)
+            self.assert_same_console(window.console, reference.console)
+
+    def test_incremental_draw(self):
+        rand = random.Random(7)
+        window = ui.MapWindow(0, 0, 16, 12)
+        reference = ui.MapWindow(0, 0, 16, 12)
+        window.center(Pos(15, 10))
+        window.redraw_level(self.layers)
+        self.assertEqual(window.cells_repainted, 16 * 12)
+
+        window.move(Pos(1, 0))
+        window.draw()
+        self.assertEqual(window.cells_repainted, 12)
+        window.draw()
+        self.assertEqual(window.cells_repainted, 0)
+
+        for i in range(40):
+            window.move(Pos(rand.randint(-2, 2), rand.randint(-2, 2)))
+            for pos in rand.sample(self.positions, 5):
+                self.layers.visible[pos.y, pos.x] ^= True
+                window.mark_dirty(pos)
+            window.draw()
+            reference.center(window.center_pos)
+            reference.redraw_level(self.layers)
+            self.assert_same_console(window.console, reference.console)
+
+    def test_drawable_shades(self):
+        drawable = ui.Drawable('x', tcod.Color(200, 100, 51),
+                               tcod.Color(10, 20, 30), light_levels=(.25, 1))
+        self.assertEqual(drawable.memory_fg, tcod.Color(100, 50, 25))
+        self.assertEqual(drawable.memory_bg, tcod.Color(5, 10, 15))
+        self.assertEqual(drawable.light_levels[0][0], tcod.Color(50, 25, 12))
+        self.assertIsNone(ui.Drawable('y', tcod.white).memory_bg)
+
+        con = tcod.console_new(2, 1)
+        drawable.draw(con, Pos(0, 0), memory=True)
+        drawable.draw(con, Pos(1, 0), light=0)
+        self.assertEqual(tcod.console_get_char_foreground(con, 0, 0),
+                         tcod.Color(100, 50, 25))
+        self.assertEqual(tcod.console_get_char_background(con, 1, 0),
+                         tcod.Color(2, 5, 7))
+
+    def test_map_memory(self):
+        ui.drawables.setdefault('orc', ui.create_drawable_from_json(ORC))
+        level = Level(12, 12)
+        dig_rect(level, Rect(1, 1, 8, 8))
+        level.objects[Pos(3, 3)] = create_object(Pos(3, 3), 'bed')
+        level.mobs[Pos(4, 4)] = Mob(Pos(4, 4), 0, ORC)
+        memory = ui.MapMemory(level.width, level.height)
+        indices = [level.index(x, y) for x in range(-2, 6) for y in range(6)]
+        x, y = memory.reveal(level, indices)
+        self.assertEqual(len(x), 6 * 6)
+        self.assertIsNone(memory.recall(level, Pos(7, 7)))
+
+        tile = memory.recall(level, Pos(3, 3))
+        self.assertEqual((tile.tile_name, tile.item_name, tile.mob_name),
+                         ('tile floor', 'bed', None))
+        self.assertTrue(tile.visible)
+        self.assertEqual(tile.item, level.objects[Pos(3, 3)])
+        self.assertEqual(memory.recall(level, Pos(0, 2)).tile_name,
+                         'hospital wall')
+
+        memory.hide(level, indices[:-1])
+        tile = memory.recall(level, Pos(4, 4))
+        self.assertEqual(tile.mob_name, 'orc')
+        self.assertFalse(tile.visible)
+        self.assertIsNone(tile.mob)
+        self.assertTrue(memory.is_visible(Pos(5, 5)))
+
+        # a few cells are looked up one by one, off the map ones dropped
+        memory = ui.MapMemory(level.width, level.height)
+        for i in range(3):
+            level.objects[Pos(6, i)] = create_object(Pos(6, i), 'bed')
+        x, y = memory.reveal(level, [level.index(3, 3), level.index(4, 4),
+                                     level.index(-1, 0)])
+        self.assertEqual(sorted(zip(x.tolist(), y.tolist())),
+                         [(3, 3), (4, 4)])
+        self.assertEqual(memory.recall(level, Pos(3, 3)).item_name, 'bed')
+        self.assertEqual(memory.recall(level, Pos(4, 4)).mob_name, 'orc')
+        self.assertIsNone(memory.recall(level, Pos(6, 0)))
+
+    def test_messages(self):
+        window = ui.MessagesWindow(0, 0, 8, 3)
+        window.message('one two three four')
+        window.message('five', tcod.red)
+        self.assertEqual([line for line, color in window.message_lines],
+                         ['three', 'four', 'five'])
+        self.assertEqual(len(window.history), 2)
+
+        # drawing waits for draw, and only happens when something changed
+        self.assertEqual(tcod.console_get_char(window.console, 0, 0),
+                         ord(' '))
+        window.draw()
+        self.assertFalse(window.dirty)
+        self.assertEqual(tcod.console_get_char(window.console, 0, 2),
+                         ord('f'))
+        self.assertEqual(tcod.console_get_char_foreground(
+            window.console, 0, 2), tcod.red)
+
+    def test_status_bar(self):
+        class Body(object):
+            visible = ['nutrition', 'fatigue']
+            stats = {'nutrition': 10.001, 'fatigue': 3}
+
+            def gs(self, stat):
+                return self.stats[stat]
+
+            def is_critical(self, stat):
+                return stat == 'fatigue' and self.stats[stat] > 5
+
+        player = Mob(Pos(0, 0), 0, ORC)
+        player.body = Body()
+        bar = ui.StatusBar(0, 0, 40, 1)
+        for i in range(3):
+            bar.update_player(player)
+        self.assertEqual(bar.redraws, 0)
+        bar.draw()
+        self.assertEqual(bar.redraws, 1)
+        self.assertEqual(bar.statuses, [('fatigue', '3', False),
+                                        ('nutrition', '10.0', False)])
+
+        # unchanged after rounding, so nothing is printed again
+        player.body.stats['nutrition'] = 10.002
+        bar.update_player(player)
+        bar.draw()
+        self.assertEqual(bar.redraws, 1)
+
+        player.body.stats['fatigue'] = 6
+        bar.update_player(player)
+        bar.draw()
+        self.assertEqual(bar.redraws, 2)
+        self.assertEqual(tcod.console_get_char_foreground(
+            bar.console, len('fatigue: '), 0), tcod.red)
+
+
+class EventsTest(unittest.TestCase):
+    def test_subscriptions(self):
+        handler = events.EventHandler()
+        received = []
+        first = handler.add_callback(events.EventType.MESSAGE,
+                                     lambda event: received.append(1),
+                                     priority=2)
+
+        def second(event):
+            received.append(2)
+            # unsubscribing while the event is handled skips nobody
+            first.close()
+
+        handler.add_callback(events.EventType.MESSAGE, second)
+        handler.send(events.Event(events.EventType.MESSAGE, None))
+        self.assertEqual(received, [2, 1])
+        self.assertFalse(first.active)
+        self.assertTrue(handler.remove_callback(events.EventType.MESSAGE,
+                                                second))
+        self.assertFalse(handler.remove_callback(events.EventType.MESSAGE,
+                                                 second))
+        self.assertEqual(handler.close(), [])
+
+    def test_instrumentation(self):
+        handler = events.EventHandler()
+        self.assertEqual(handler.send, handler.handle_event)
+        handler.instrument()
+
+        def nested(event):
+            handler.send(events.Event(events.EventType.MESSAGE, None))
+
+        handler.add_callback(events.EventType.SOUND, nested)
+        handler.add_callback(events.EventType.MESSAGE, lambda event: None)
+        handler.send(events.Event(events.EventType.SOUND, None))
+        handler.end_turn()
+        handler.send(events.Event(events.EventType.MESSAGE, None))
+        stats = handler.stats
+        self.assertEqual(stats.turns, [
+            {events.EventType.SOUND: 1, events.EventType.MESSAGE: 1},
+            {events.EventType.MESSAGE: 1}])
+        self.assertEqual(stats.max_depth, 2)
+        self.assertEqual(stats.calls[
+            'SOUND', 'EventsTest.test_instrumentation.<locals>.nested'], 1)
+        self.assertIn('MESSAGE', stats.report())
+
+    def test_queue(self):
+        handler = events.EventHandler()
+        immediate = []
+        delivered = []
+        handler.add_callback(events.EventType.MOVE,
+                             lambda event: immediate.append(event.info),
+                             immediate=True)
+        handler.add_callback(events.EventType.MOVE,
+                             lambda event: delivered.append(event.info))
+        handler.add_callback(events.EventType.PLAYER_STATUS_UPDATE,
+                             lambda event: delivered.append(event.info))
+
+        def echo(event):
+            delivered.append(event.info)
+            if event.info == 'ping':
+                handler.send(events.Event(events.EventType.MESSAGE, 'pong'))
+
+        handler.add_callback(events.EventType.MESSAGE, echo)
+        handler.start_queue()
+        orc, goblin = object(), object()
+        handler.do_move_event(orc, Pos(1, 1))
+        handler.do_move_event(goblin, Pos(5, 5))
+        handler.do_move_event(orc, Pos(2, 2))
+        for i in range(3):
+            handler.send(events.Event(
+                events.EventType.PLAYER_STATUS_UPDATE, 'player'))
+        handler.send(events.Event(events.EventType.MESSAGE, 'ping'))
+        handler.send(events.Event(events.EventType.MESSAGE, 'ping'))
+        self.assertEqual(len(immediate), 3)
+        self.assertEqual(delivered, [])
+
+        handler.flush()
+        # the orc's moves merged into one from where it first was
+        self.assertEqual([info.prev_pos for info in delivered[:2]],
+                         [Pos(1, 1), Pos(5, 5)])
+        self.assertEqual(delivered[2:],
+                         ['player', 'ping', 'ping', 'pong', 'pong'])
+
+        handler.stop_queue()
+        handler.do_move_event(orc, Pos(3, 3))
+        self.assertEqual(len(delivered), 8)
+
+    def test_game_teardown(self):
+        ui.init_tcod()
+        default = events.events
+        play = game.Game(seed=1)
+        self.assertIs(events.events, play.events)
+        self.assertNotEqual(play.events.subscriptions(), [])
+        self.assertEqual(play.close(), [])
+        self.assertIs(events.events, default)
+
+        # anything its owner does not close is reported
+        play = game.Game()
+        events.events.add_callback(events.EventType.MOVE, print)
+        self.assertEqual(len(play.close()), 1)
+
+
+class SchedulerTest(unittest.TestCase):
+    def test_order(self):
+        scheduler = Scheduler()
+        scheduler.schedule('a', 2)
+        scheduler.schedule('b', 1)
+        scheduler.schedule('c', 1)
+        self.assertEqual(scheduler.pop(), 'b')
+        self.assertEqual(scheduler.time, 1)
+        # rescheduling replaces the earlier entry
+        scheduler.schedule('b', 5)
+        scheduler.schedule('c', 3)
+        scheduler.wake('a')
+        self.assertEqual(len(scheduler), 3)
+        self.assertEqual([scheduler.pop() for i in range(3)], ['a', 'c', 'b'])
+        self.assertEqual(scheduler.time, 6)
+        scheduler.schedule('a')
+        scheduler.remove('a')
+        self.assertIsNone(scheduler.pop())
+
+    def test_idle_followers_wait_for_leader(self):
+        level = Level(20, 20)
+        dig_rect(level, Rect(1, 1, 18, 18))
+        leader = level.mobs[2, 2] = Mob(Pos(2, 2), 0, ORC,
+                                        state=MobState.IDLE)
+        follower = level.mobs[3, 3] = Mob(Pos(3, 3), 0, ORC,
+                                          state=MobState.IDLE, leader=leader)
+        play = game.Game.__new__(game.Game)
+        play.scheduler = Scheduler()
+        self.assertIsNone(play.update_mob(follower, level))
+        self.assertNotIn(follower, play.scheduler)
+
+        self.assertEqual(play.update_mob(leader, level), 1)
+        self.assertEqual(leader.state, MobState.WANDERING)
+        self.assertEqual(play.scheduler.pop(), follower)
+        self.assertEqual(play.update_mob(follower, level), 1)
+        self.assertEqual(follower.state, MobState.WANDERING)
+
+
+    def test_idle_leaders_start_asleep(self):
+        level = Level(20, 20)
+        dig_rect(level, Rect(1, 1, 18, 18))
+        leader = level.mobs[2, 2] = Mob(Pos(2, 2), 0, ORC,
+                                        state=MobState.IDLE)
+        follower = level.mobs[3, 3] = Mob(Pos(3, 3), 0, ORC,
+                                          state=MobState.IDLE, leader=leader)
+        wanderer = level.mobs[5, 5] = Mob(Pos(5, 5), 0, ORC)
+        play = game.Game.__new__(game.Game)
+        play.world = World.__new__(World)
+        play.world.player = None
+        play.scheduler = Scheduler()
+        rng.seed(1)
+        play.schedule_mobs(level)
+        rng.seed(1)
+        delay = rng.ai.geometric(game.IDLE_WAKE_PROB)
+        self.assertGreater(delay, 0)
+
+        self.assertEqual({play.scheduler.pop(), play.scheduler.pop()},
+                         {follower, wanderer})
+        self.assertEqual(play.scheduler.time, 0)
+        self.assertEqual(play.scheduler.pop(), leader)
+        self.assertEqual(play.scheduler.time, delay)
+
+
+class RngTest(unittest.TestCase):
+    def test_streams_are_independent(self):
+        rng.seed(1)
+        roll = rng.body.random()
+        rng.seed(1)
+        for i in range(10):
+            rng.ai.random()
+        self.assertEqual(rng.body.random(), roll)
+        self.assertNotEqual(rng.ai.random(), roll)
+
+    def test_seed_reproduces_game(self):
+        def play(seed):
+            ui.init_tcod()
+            play = game.Game(seed=seed)
+            body = play.world.player.body
+            body.on_game_start({'ADDITIONAL_FATIGUE': [10],
+                                'PREEXISTING_CONDITIONS': {}})
+            body.sc('disease', vitals.Dengue())
+            for i in range(10):
+                play.attempt_player_move(Pos(1, 0))
+                play.accum = 30
+                play.update_mobs()
+            play.close()
+            return (bytes(play.player_level.tile_type), play.world.player.pos,
+                    sorted(body.stats.items()), sorted(body.conditions))
+
+        self.assertEqual(play(3), play(3))
+        self.assertNotEqual(play(3)[0], play(4)[0])
+
+
+class VitalsTest(unittest.TestCase):
+    def body(self, disease=None, sleeping=False):
+        body = vitals.Body({}, None)
+        body.on_game_start({'ADDITIONAL_FATIGUE': [10],
+                            'PREEXISTING_CONDITIONS': {}})
+        if disease is not None:
+            body.sc('disease', disease())
+        if sleeping:
+            body.ss('sleeping', True)
+        return body
+
+    def test_advance_sleeping(self):
+        rng.seed(1)
+        body = self.body(sleeping=True)
+        fatigue = body.gs('fatigue')
+        body.advance(500)
+        self.assertEqual(body.turn_number, 500)
+        self.assertEqual(body.gs('nutrition'), 1400)
+        self.assertEqual(body.gs('fatigue'), fatigue)
+        self.assertAlmostEqual(body.gs('blood_sugar'),
+                               body.blood_sugar_target()[0], delta=1)
+
+    def test_advance_covers_every_turn(self):
+        def advanced(steady_turns, n_turns, fast_forward):
+            body = self.body()
+            body.steady_turns = lambda: steady_turns
+            if fast_forward:
+                body.advance(n_turns)
+            else:
+                for turn in range(n_turns):
+                    body.step()
+            return body
+
+        rng.seed(3)
+        # stepping, stretches that end one turn short, and steady
+        for steady_turns in (0, 1, 4, float('inf')):
+            for n_turns in (1, 2, 3, 5, 9, 40):
+                body = advanced(steady_turns, n_turns, True)
+                stepped = advanced(steady_turns, n_turns, False)
+                self.assertEqual(body.turn_number, n_turns)
+                self.assertEqual(body.turn_number, stepped.turn_number)
+                self.assertEqual(body.gs('nutrition'),
+                                 stepped.gs('nutrition'))
+                self.assertAlmostEqual(body.gs('fatigue'),
+                                       stepped.gs('fatigue'))
+
+    def test_advance_matches_ticks(self):
+        def sample(fast_forward):
+            stats = []
+            for i in range(300):
+                body = self.body(vitals.Dengue)
+                if fast_forward:
+                    body.advance(100)
+                else:
+                    for turn in range(100):
+                        body.on_tick()
+                stats.append([body.gs('fatigue'), body.gs('nutrition'),
+                              body.gs('blood_sugar')])
+            stats = numpy.array(stats)
+            return stats.mean(axis=0), stats.std(axis=0) / len(stats) ** .5
+
+        rng.seed(2)
+        ticks_mean, ticks_error = sample(False)
+        advance_mean, advance_error = sample(True)
+        # fatigue, nutrition and blood sugar agree within a few standard
+        # errors
+        self.assertTrue(numpy.all(abs(ticks_mean - advance_mean) <
+                                  4 * numpy.hypot(ticks_error, advance_error)))
+
+
+class SimulateTest(unittest.TestCase):
+    def play(self, policy, turns=200):
+        simulation = simulate.Simulation(policy, seed=5, mobs=3)
+        simulation.run(turns)
+        self.assertEqual(simulation.close(), [])
+        return simulation
+
+    def test_headless_game(self):
+        play = game.Game(seed=5, headless=True)
+        self.assertIsNone(play.ui)
+        self.assertIsNone(play.menu('cabinet', ['apple']))
+        self.assertFalse(play.confirm('Sleep in the bed?'))
+        play.message('Nobody sees this.')
+        self.assertEqual(play.close(), [])
+
+    def test_policies(self):
+        for policy in simulate.POLICIES.values():
+            simulation = self.play(policy)
+            self.assertTrue(simulation.turns >= 200 or simulation.over)
+            self.assertEqual(simulation.timings.calls['player'],
+                             simulation.actions)
+            self.assertGreater(simulation.timings.calls['mobs'], 0)
+
+    def test_seed_reproduces_run(self):
+        def run():
+            simulation = self.play(simulate.Explore)
+            level = simulation.game.player_level
+            return (simulation.game.world.player.pos, bytes(level.explored),
+                    sorted(mob.pos for mob in level.mobs.values()))
+
+        self.assertEqual(run(), run())
+
+    def test_find_route(self):
+        level = Level(10, 10)
+        dig_rect(level, Rect(1, 1, 8, 8))
+        # a wall down the middle, with a closed door in it
+        for y in range(2, 9):
+            undig(level, 5, y)
+        level.objects[Pos(5, 1)] = create_object(Pos(5, 1), 'closed door')
+        route = simulate.find_route(level, Pos(1, 7),
+                                    lambda i: i == level.index(6, 7))
+        self.assertEqual(len(route), 12)
+        self.assertEqual(route[5], Pos(5, 1))
+        self.assertEqual(route[-1], Pos(6, 7))
+        self.assertEqual(simulate.find_route(level, Pos(1, 1),
+                                             lambda i: False), [])
+
+
+class BenchmarkSuiteTest(unittest.TestCase):
+    def test_every_benchmark_runs(self):
+        for name in suite.BENCHMARKS:
+            samples = suite.run(name, repeats=1, warmup=0)
+            self.assertGreater(len(samples), 0, name)
+
+    def test_summarize(self):
+        stats = suite.summarize([i * 1e-6 for i in range(1, 102)])
+        self.assertEqual(stats['samples'], 101)
+        self.assertEqual(stats['median'], 51)
+        self.assertEqual(stats['p5'], 6)
+        self.assertEqual(stats['p99'], 100)
+        self.assertEqual((stats['min'], stats['max']), (1, 101))
@@ -1,7 +1,11 @@
+from collections import deque
 from enum import Enum
+from functools import lru_cache
+from weakref import WeakKeyDictionary
+import numpy
 import tcod
 from constants import SCREEN_WIDTH, SCREEN_HEIGHT, DIRECTION_KEYS, DEBUG, \
-    GAME_NAME, MAX_INVENTORY_SIZE
+    GAME_NAME, MAP_WIDTH, MAP_HEIGHT
 import events
 from mob import MobState
 from util import Pos
@@ -29,29 +33,248 @@ def init_tcod():
 
 
 class Drawable(object):
-    """Thing that can be drawn with libtcod."""
+    """
+    Thing that can be drawn with libtcod.
+
+    The colors for every way it can be drawn are worked out up front: lit,
+    remembered (at REMEMBERED_BRIGHTNESS), and optionally one pair per entry
+    of light_levels, a sequence of brightness factors indexed by light level.
+    """
+    REMEMBERED_BRIGHTNESS = .5
 
-    def __init__(self, char, fg, bg=None):
+    def __init__(self, char, fg, bg=None, light_levels=()):
         self.char = char
         self.fg = fg
         self.bg = bg
+        self.memory_fg, self.memory_bg = \
+            self.shade(self.REMEMBERED_BRIGHTNESS)
+        self.light_levels = tuple(self.shade(brightness)
+                                  for brightness in light_levels)
+
+    def shade(self, brightness):
+        return (self.fg * brightness,
+                self.bg * brightness if self.bg else None)
 
-    def draw(self, con, pos, memory=False):
+    def draw(self, con, pos, memory=False, light=None):
         if memory:
-            draw_cell(con, pos, self.char, self.fg * .5,
-                      self.bg * .5 if self.bg else None)
+            draw_cell(con, pos, self.char, self.memory_fg, self.memory_bg)
+        elif light is not None:
+            fg, bg = self.light_levels[light]
+            draw_cell(con, pos, self.char, fg, bg)
         else:
             draw_cell(con, pos, self.char, self.fg, self.bg)
 
 
 class TileMemory(object):
+    """
+    What the player knows about one position: the names of the tile, object
+    and mob remembered there and, while it is in sight, the live mob and
+    object.
+    """
 
-    def __init__(self, tile_name, mob=None, item=None):
+    def __init__(self, tile_name, item_name=None, mob_name=None,
+                 visible=False, mob=None, item=None):
         self.tile_name = tile_name
+        self.item_name = item_name
+        self.mob_name = mob_name
+        self.visible = visible
         self.mob = mob
         self.item = item
 
 
+class Palette(object):
+    """
+    Numbers drawables with glyph ids and keeps their chars and colors in NumPy
+    arrays, so a whole plane of glyph ids can be looked up at once. Glyph 0 is
+    an empty cell. The color arrays hold every glyph twice, lit and then
+    remembered: id + size looks up the remembered colors of glyph id.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.names = [None]
+        self.glyphs = [Drawable(' ', tcod.white)]
+        self.build()
+
+    def get_id(self, name):
+        glyph_id = self.ids.get(name)
+        if glyph_id is None:
+            glyph_id = self.ids[name] = len(self.glyphs)
+            self.names.append(name)
+            self.glyphs.append(drawables[name])
+            self.build()
+        return glyph_id
+
+    def tile_ids(self):
+        """Returns an array mapping world tile type ids to glyph ids."""
+        if len(self._tile_ids) != len(world.tile_types):
+            self._tile_ids = numpy.array(
+                [self.get_id(tile.name) for tile in world.tile_types],
+                dtype=numpy.uint16)
+        return self._tile_ids
+
+    _tile_ids = ()
+
+    def build(self):
+        self.size = len(self.glyphs)
+        self.chars = numpy.array([ord(d.char) for d in self.glyphs],
+                                 dtype=numpy.intc)
+        self.has_bg = numpy.array([bool(d.bg) for d in self.glyphs])
+        self.fg = self.color_plane(
+            [d.fg for d in self.glyphs] +
+            [d.memory_fg for d in self.glyphs])
+        self.bg = self.color_plane(
+            [d.bg for d in self.glyphs] +
+            [d.memory_bg for d in self.glyphs])
+
+    def color_plane(self, colors):
+        return numpy.array([tuple(c) if c else (0, 0, 0) for c in colors],
+                           dtype=numpy.intc).T.copy()
+
+    def compose(self, terrain, objects, mobs, visible):
+        """
+        Returns the chars and the (r, g, b) fg and bg planes for same-shaped
+        arrays of remembered glyph ids and visibility.
+        """
+        # mobs are drawn over objects over terrain; the background comes
+        # from the topmost glyph that has one
+        top = numpy.where(mobs, mobs, numpy.where(objects, objects, terrain))
+        back = numpy.where(self.has_bg.take(mobs), mobs,
+                           numpy.where(self.has_bg.take(objects), objects,
+                                       terrain))
+        # remembered but unseen cells use the remembered colors
+        shade = ((terrain != 0) & ~visible) * numpy.uint16(self.size)
+        return (self.chars.take(top),
+                self.fg.take(top + shade, axis=1),
+                self.bg.take(back + shade, axis=1))
+
+
+class MapMemory(object):
+    """
+    What the player remembers of one level: planes of glyph ids, indexed
+    [y, x], for the terrain, object and mob last seen at each position (0
+    where nothing is known), and which positions are in sight right now.
+    """
+
+    def __init__(self, width=MAP_WIDTH, height=MAP_HEIGHT):
+        self.width = width
+        self.height = height
+        shape = (height, width)
+        self.terrain = numpy.zeros(shape, dtype=numpy.uint16)
+        self.objects = numpy.zeros(shape, dtype=numpy.uint16)
+        self.mobs = numpy.zeros(shape, dtype=numpy.uint16)
+        self.visible = numpy.zeros(shape, dtype=bool)
+
+    def in_map(self, pos):
+        x, y = pos
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def is_visible(self, pos):
+        return self.in_map(pos) and bool(self.visible[pos[1], pos[0]])
+
+    def coordinates(self, level, indices):
+        """
+        Returns x and y arrays for the level indices that lie inside the map,
+        and those indices.
+        """
+        if len(indices) <= 16:
+            # numpy's overhead would dominate for a handful of cells
+            kept = [(x, y, i) for x, y, i in
+                    ((*level.pos_at(i), i) for i in indices)
+                    if 0 <= x < self.width and 0 <= y < self.height]
+            return tuple(numpy.array(column, dtype=numpy.intp)
+                         for column in (zip(*kept) if kept else ((), (), ())))
+        indices = numpy.asarray(indices, dtype=numpy.intp)
+        x, y = numpy.divmod(indices - level.offset, level.stride)
+        # cells in the border above column x + 1, see Level.pos_at
+        wrapped = y >= level.height + level.border
+        x[wrapped] += 1
+        y[wrapped] -= level.stride
+        keep = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        return x[keep], y[keep], indices[keep]
+
+    def reveal(self, level, indices):
+        """
+        Remembers the tiles at indices as seen now, with whatever is on them.
+        Returns the x and y arrays of the revealed positions.
+        """
+        x, y, indices = self.coordinates(level, indices)
+        tile_types = numpy.frombuffer(level.tile_type, dtype=numpy.uint8)
+        self.terrain[y, x] = palette.tile_ids().take(tile_types[indices])
+        self.objects[y, x] = 0
+        self.mobs[y, x] = 0
+        self.visible[y, x] = True
+        if len(indices) < len(level.objects) + len(level.mobs):
+            # a few cells, as after a step: look each of them up
+            objects = level.objects
+            mobs = level.mobs
+            for pos in zip(x.tolist(), y.tolist()):
+                obj = objects.get(pos)
+                if obj is not None:
+                    self.objects[pos[1], pos[0]] = palette.get_id(obj.name)
+                mob = mobs.get(pos)
+                if mob is not None:
+                    self.mobs[pos[1], pos[0]] = \
+                        palette.get_id(mob.info['name'])
+        else:
+            visible = self.visible
+            for (obj_x, obj_y), obj in level.objects.items():
+                if visible[obj_y, obj_x]:
+                    self.objects[obj_y, obj_x] = palette.get_id(obj.name)
+            for (mob_x, mob_y), mob in level.mobs.items():
+                if visible[mob_y, mob_x]:
+                    self.mobs[mob_y, mob_x] = \
+                        palette.get_id(mob.info['name'])
+        return x, y
+
+    def hide(self, level, indices):
+        """
+        Marks the tiles at indices as out of sight. Returns the x and y arrays
+        of the hidden positions.
+        """
+        x, y, indices = self.coordinates(level, indices)
+        self.visible[y, x] = False
+        return x, y
+
+    def set_object(self, pos, obj):
+        x, y = pos
+        self.objects[y, x] = palette.get_id(obj.name) if obj else 0
+
+    def set_mob(self, pos, mob):
+        x, y = pos
+        self.mobs[y, x] = palette.get_id(mob.info['name']) if mob else 0
+
+    def recall(self, level, pos):
+        """Returns a TileMemory for pos, or None if it was never seen."""
+        if not self.in_map(pos):
+            return None
+        x, y = pos
+        terrain = self.terrain[y, x]
+        if not terrain:
+            return None
+        names = palette.names
+        visible = bool(self.visible[y, x])
+        return TileMemory(names[terrain], names[self.objects[y, x]],
+                          names[self.mobs[y, x]], visible,
+                          level.get_mob(pos) if visible else None,
+                          level.get_object(pos) if visible else None)
+
+    def cut(self, plane, x, y, width, height):
+        """Returns the window of plane at x, y, with zeros off the map."""
+        plane_height, plane_width = plane.shape
+        if x >= 0 and y >= 0 and x + width <= plane_width \
+                and y + height <= plane_height:
+            return plane[y:y + height, x:x + width]
+        window = numpy.zeros((height, width), dtype=plane.dtype)
+        left, top = max(x, 0), max(y, 0)
+        right = min(x + width, plane_width)
+        bottom = min(y + height, plane_height)
+        if left < right and top < bottom:
+            window[top - y:bottom - y, left - x:right - x] = \
+                plane[top:bottom, left:right]
+        return window
+
+
 class States(Enum):
     DEFAULT = 1
     EXAMINE = 2
@@ -98,16 +321,31 @@ class Window(object):
 
 
 class MapWindow(Window):
+    """
+    Window onto the player's map memory. Cells are composed into a buffer
+    from the window's layers when they change, and moving the view shifts
+    the buffer so only the strip scrolled into view is composed again.
+    """
     center_pos = Pos(0, 0)
+    layers = None
+    cursor = None
 
     def __init__(self, *args, **kwargs):
         self.center_pos = Pos(0, 0)
         super().__init__(*args, **kwargs)
+        self.buffer = tcod.ConsoleBuffer(self.width, self.height)
+        # center_pos and cursor the buffer and console were last drawn for
+        self.drawn_center = None
+        self.drawn_cursor = None
+        self.dirty = set()
+        self.dirty_cells = []
+        # cells composed by the last draw, and by all draws so far
+        self.cells_repainted = 0
+        self.total_cells_repainted = 0
+        self.frames = 0
 
     def draw_cursor(self, map_pos):
-        x, y = self.get_window_pos(map_pos)
-        tcod.console_set_char_background(self.console, x, y,
-                                         tcod.light_grey)
+        self.cursor = map_pos
 
     def draw_cursor_at_center(self):
         self.draw_cursor(self.center_pos)
@@ -126,68 +364,192 @@ class MapWindow(Window):
         return world_pos + self.center_pos - \
             Pos(self.width, self.height) // 2
 
-    def redraw_level(self, memory, vision):
-        self.clear()
-        map_offset = self.get_map_pos(Pos(0, 0))
-        for x in range(0, self.width):
-            for y in range(0, self.height):
-                window_pos = Pos(x, y)
-                map_pos = window_pos + map_offset
-                self.draw_tile(map_pos, memory, vision, window_pos=window_pos)
-
-    def draw_tile(self, map_pos, memory, vision, window_pos=None):
-        memory = memory.get(map_pos, None)
-        if memory:
-            if window_pos is None:
-                window_pos = self.get_window_pos(map_pos)
+    def mark_dirty(self, map_pos):
+        self.dirty.add(map_pos)
+
+    def mark_dirty_cells(self, x, y):
+        """Marks the map positions given as x and y arrays dirty."""
+        self.dirty_cells.append((x, y))
 
-            tile_drawable = drawables[memory.tile_name]
-            mob_drawable = drawables[memory.mob.info['name']] if memory.mob \
-                else None
-            object_drawable = drawables[memory.item.name] if memory.item \
-                else None
+    def mark_all_dirty(self):
+        self.drawn_center = None
 
-            visible = map_pos in vision
+    def redraw_level(self, layers):
+        """Repaints the whole window from layers."""
+        self.layers = layers
+        self.mark_all_dirty()
+        self.draw()
 
-            tile_drawable.draw(self.console, window_pos, not visible)
-            if object_drawable:
-                object_drawable.draw(self.console, window_pos, not visible)
-            if mob_drawable:
-                mob_drawable.draw(self.console, window_pos, not visible)
+    def draw(self):
+        """Brings the console up to date with the layers and the view."""
+        if self.layers is None:
+            return
+        repainted = 0
+        if self.drawn_center is None:
+            repainted = self.compose_rect(0, 0, self.width, self.height)
+        else:
+            dx, dy = self.center_pos - self.drawn_center
+            if abs(dx) >= self.width or abs(dy) >= self.height:
+                repainted = self.compose_rect(0, 0, self.width, self.height)
+            elif dx or dy:
+                repainted = self.scroll(dx, dy)
+            repainted += self.compose_dirty()
+        self.dirty.clear()
+        del self.dirty_cells[:]
+        self.cells_repainted = repainted
+        self.total_cells_repainted += repainted
+        self.frames += 1
+
+        if repainted or self.center_pos != self.drawn_center \
+                or self.cursor != self.drawn_cursor:
+            self.buffer.blit(self.console)
+            if self.cursor is not None:
+                x, y = self.get_window_pos(self.cursor)
+                tcod.console_set_char_background(self.console, x, y,
+                                                 tcod.light_grey)
+        self.drawn_center = self.center_pos
+        self.drawn_cursor = self.cursor
+
+    def scroll(self, dx, dy):
+        """
+        Shifts the buffer for a view moved by dx, dy and composes the strips
+        that came into view. Returns the number of cells composed.
+        """
+        width, height = self.width, self.height
+        planes = self.buffer.planes
+        planes[:, max(-dy, 0):height - max(dy, 0),
+               max(-dx, 0):width - max(dx, 0)] = \
+            planes[:, max(dy, 0):height - max(-dy, 0),
+                   max(dx, 0):width - max(-dx, 0)]
+
+        repainted = 0
+        if dy > 0:
+            repainted += self.compose_rect(0, height - dy, width, dy)
+        elif dy < 0:
+            repainted += self.compose_rect(0, 0, width, -dy)
+        # rows composed above are left out of the column strips
+        top, bottom = max(-dy, 0), height - max(dy, 0)
+        if dx > 0:
+            repainted += self.compose_rect(width - dx, top, dx, bottom - top)
+        elif dx < 0:
+            repainted += self.compose_rect(0, top, -dx, bottom - top)
+        return repainted
+
+    def compose_rect(self, x, y, width, height):
+        """Composes a rectangle of the window. Returns its size in cells."""
+        layers = self.layers
+        map_x, map_y = self.get_map_pos(Pos(x, y))
+        chars, fg, bg = palette.compose(
+            *(layers.cut(plane, map_x, map_y, width, height)
+              for plane in (layers.terrain, layers.objects, layers.mobs,
+                            layers.visible)))
+        window = numpy.s_[y:y + height, x:x + width]
+        buffer = self.buffer
+        buffer.char[window] = chars
+        buffer.fore[(slice(None),) + window] = fg
+        buffer.back[(slice(None),) + window] = bg
+        return width * height
+
+    def compose_dirty(self):
+        """Composes the dirty cells in view. Returns how many there were."""
+        cells = self.dirty_cells
+        if self.dirty:
+            cells = cells + [numpy.array(list(self.dirty)).T]
+        if not cells:
+            return 0
+        layers = self.layers
+        map_x = numpy.concatenate([x for x, y in cells])
+        map_y = numpy.concatenate([y for x, y in cells])
+        offset_x, offset_y = self.get_map_pos(Pos(0, 0))
+        x, y = map_x - offset_x, map_y - offset_y
+        layer_height, layer_width = layers.terrain.shape
+        keep = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height) \
+            & (map_x >= 0) & (map_x < layer_width) \
+            & (map_y >= 0) & (map_y < layer_height)
+        x, y, map_x, map_y = x[keep], y[keep], map_x[keep], map_y[keep]
+        chars, fg, bg = palette.compose(
+            layers.terrain[map_y, map_x], layers.objects[map_y, map_x],
+            layers.mobs[map_y, map_x], layers.visible[map_y, map_x])
+        buffer = self.buffer
+        buffer.char[y, x] = chars
+        buffer.fore[:, y, x] = fg
+        buffer.back[:, y, x] = bg
+        return len(x)
 
 
 class MessagesWindow(Window):
+    """
+    Shows the latest messages, wrapped to the window. Every message is also
+    kept in history. Drawing waits for the next render.
+    """
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.message_lines = []
+        self.message_lines = deque(maxlen=self.height)
+        self.history = []
+        self.dirty = False
 
     def message(self, message, color=tcod.white):
-        self.message_lines.extend((m, color)
-                                  for m in wrap(message, self.width))
-        while len(self.message_lines) > self.height:
-            self.message_lines.pop(0)
-        self.draw_messages()
+        self.history.append((message, color))
+        self.message_lines.extend((line, color)
+                                  for line in wrap_message(message,
+                                                           self.width))
+        self.dirty = True
 
-    def draw_messages(self):
+    def draw(self):
+        if not self.dirty:
+            return
+        self.dirty = False
         self.clear()
-        y = 0
-        for (line, color) in self.message_lines:
+        for y, (line, color) in enumerate(self.message_lines):
             tcod.console_set_default_foreground(self.console, color)
             tcod.console_print(self.console, 0, y, line)
-            y += 1
 
 
 class StatusBar(Window):
+    """
+    Shows the player's visible stats. Status updates only mark the bar
+    stale; it is drawn at render time, and only when the shown text or
+    colors changed.
+    """
 
-    def __init(self, *args, **kwargs):
+    def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.player = None
+        self.stale = False
+        # (name, text, critical) for each stat on the console now
+        self.statuses = None
+        self.redraws = 0
+
+    def update_player(self, player):
+        self.player = player
+        self.stale = True
+
+    def draw(self):
+        if not self.stale:
+            return
+        self.stale = False
+        body = self.player.body
+        statuses = []
+        for st in sorted(body.visible):
+            value = body.gs(st)
+            if isinstance(value, float):
+                value = round(value, 2)
+            statuses.append((st, str(value), body.is_critical(st)))
+        if statuses == self.statuses:
+            return
+        self.statuses = statuses
+        self.redraws += 1
+        self.update({name: (text, tcod.light_grey,
+                            tcod.red if critical else tcod.light_grey)
+                     for name, text, critical in statuses},
+                    background_color=tcod.dark_grey)
 
     def update(self, values, background_color=None):
         if background_color is not None:
             tcod.console_set_default_background(self.console, background_color)
             tcod.console_rect(self.console, 0, 0, self.width,
-                              self.height, False, tcod.BKGND_SET)
+                              self.height, True, tcod.BKGND_SET)
         x = 0
         list_of_statuses = [(k, v) for k, v in values.items()]
         list_of_statuses.sort(key=lambda pair: pair[0])
@@ -223,9 +585,14 @@ class ExamineWindow(Window):
             if DEBUG:
                 tcod.console_print(self.console, 3, 3, str(memory.mob.pos))
                 tcod.console_print(self.console, 3, 4, str(memory.mob.target))
-        elif memory.item:
-            drawables[memory.item.name].draw(self.console, Pos(1, 1))
-            tcod.console_print(self.console, 3, 1, memory.item.name)
+        elif memory.mob_name:
+            drawables[memory.mob_name].draw(self.console, Pos(1, 1))
+            tcod.console_print(self.console, 3, 1,
+                               get_article(memory.mob_name) + ' ' +
+                               memory.mob_name + '.')
+        elif memory.item_name:
+            drawables[memory.item_name].draw(self.console, Pos(1, 1))
+            tcod.console_print(self.console, 3, 1, memory.item_name)
         else:
             drawables[memory.tile_name].draw(self.console, Pos(1, 1))
             tcod.console_print(self.console, 3, 1, memory.tile_name)
@@ -234,6 +601,7 @@ class ExamineWindow(Window):
 class UI(object):
     """Singleton that handles rendering and input."""
     state = States.DEFAULT
+    world = None
 
     def __init__(self):
         self.map_window = MapWindow(
@@ -246,24 +614,25 @@ class UI(object):
             SCREEN_WIDTH // 4, SCREEN_HEIGHT // 4)
         self.status_bar = StatusBar(
             0, SCREEN_HEIGHT - 1, SCREEN_WIDTH, 1)
-        events.events.add_callback(events.EventType.MOVE,
-                                   self.handle_move)
-        events.events.add_callback(events.EventType.BIRTH,
-                                   self.handle_birth)
-        events.events.add_callback(events.EventType.TILE_REVEALED,
-                                   self.handle_revealed)
-        events.events.add_callback(events.EventType.TILE_HIDDEN,
-                                   self.handle_hidden)
-        events.events.add_callback(events.EventType.MESSAGE,
-                                   self.handle_message)
-        events.events.add_callback(events.EventType.PLAYER_STATUS_UPDATE,
-                                   self.handle_player_status_update)
-        events.events.add_callback(events.EventType.REMOVAL,
-                                   self.handle_removal)
-        events.events.add_callback(events.EventType.GAME_OVER,
-                                   self.handle_game_over)
-        self.memory = {}
-        self.vision = set()
+        self.subscriptions = [
+            events.events.add_callback(event_type, callback)
+            for event_type, callback in (
+                (events.EventType.MOVE, self.handle_move),
+                (events.EventType.BIRTH, self.handle_birth),
+                (events.EventType.TILE_REVEALED, self.handle_revealed),
+                (events.EventType.TILE_HIDDEN, self.handle_hidden),
+                (events.EventType.TILES_REVEALED, self.handle_tiles_revealed),
+                (events.EventType.TILES_HIDDEN, self.handle_tiles_hidden),
+                (events.EventType.MESSAGE, self.handle_message),
+                (events.EventType.PLAYER_STATUS_UPDATE,
+                 self.handle_player_status_update),
+                (events.EventType.REMOVAL, self.handle_removal),
+                (events.EventType.GAME_OVER, self.handle_game_over))]
+        self.memories = WeakKeyDictionary()
+
+    def close(self):
+        for subscription in self.subscriptions:
+            subscription.close()
 
     def handle_input(self, game):
         """Returns true if an action was taken."""
@@ -302,138 +671,149 @@ class UI(object):
                     index = menu("Inventory",
                                  [item.name for item in inventory], 24)
                     if index is not None and index != 'escape':
-                        item = inventory[index]
-                        turn_used = game.interact_with_object(item)
-                        if turn_used and item.consumed_on_use:
-                            inventory.remove(item)
-                        return turn_used
+                        return game.use_item(inventory[index])
                 else:
                     self.messages_window.message("You have no items.")
             elif char == 'g' or char == ',':
-                obj = game.player_level.get_object(game.world.player.pos)
-                if obj is not None and obj.pickup:
-                    # try to pick it up
-                    inventory = game.world.player.body.inventory
-                    game.player_level.pop_object(game.world.player.pos)
-                    inventory.append(obj)
-                    self.messages_window.message("You pick up the " + obj.name
-                                                 + '.')
-                    if len(inventory) > MAX_INVENTORY_SIZE:
-                        drop = inventory.pop(0)
-                        self.messages_window.message(
-                            "You drop your " + drop.name + '.', tcod.purple)
-                        game.player_level.objects[game.world.player.pos] = drop
-                        drop.pos = game.world.player.pos
-                        events.events.send(
-                            events.Event(events.EventType.BIRTH, drop))
-                else:
-                    self.messages_window.message("There are no items here.")
+                game.pick_up()
         elif self.state == States.EXAMINE:
             if char in DIRECTION_KEYS:
                 self.map_window.move(DIRECTION_KEYS[char])
-                self.map_window.redraw_level(self.memory, self.vision)
                 self.map_window.draw_cursor_at_center()
                 self.examine_pos(self.map_window.center_pos)
             elif key.vk == tcod.KEY_ESCAPE:
                 self.state = States.DEFAULT
                 self.map_window.center(game.world.player.pos)
-                self.map_window.redraw_level(self.memory, self.vision)
+                self.map_window.draw_cursor(None)
                 self.examine_window.clear()
 
+    @property
+    def player_level(self):
+        return self.world.levels[self.world.player.dlevel]
+
+    def get_memory(self, level):
+        """Returns the player's MapMemory of level, creating it if needed."""
+        memory = self.memories.get(level)
+        if memory is None:
+            memory = self.memories[level] = MapMemory(level.width,
+                                                      level.height)
+        return memory
+
+    def recall(self, pos):
+        level = self.player_level
+        return self.get_memory(level).recall(level, pos)
+
     def examine_pos(self, pos):
-        memory = self.memory.get(pos, None)
-        self.examine_window.examine(memory)
+        self.examine_window.examine(self.recall(pos))
 
     def move_examine(self, direction):
         self.map_window.move(direction)
-        self.map_window.redraw_level(self.memory, self.vision)
-        memory = self.memory.get(self.center_pos, None)
-        seen = self.center_pos in self.vision
+        memory = self.recall(self.map_window.center_pos)
         if memory:
-            start = "You see " if seen else "You remember "
+            start = "You see " if memory.visible else "You remember "
             if memory.mob:
                 description = get_short_mob_description(memory.mob)
-                self.message(start + description + '.', tcod.light_grey)
+                self.messages_window.message(start + description,
+                                             tcod.light_grey)
             else:
-                self.message(start + memory.tile_name + '.', tcod.light_grey)
+                self.messages_window.message(
+                    start + memory.tile_name + '.', tcod.light_grey)
         else:
-            self.message("You cannot see that location.", tcod.light_grey)
+            self.messages_window.message("You cannot see that location.",
+                                         tcod.light_grey)
 
     def render(self):
         tcod.console_clear(0)
-        self.map_window.blit()
-        self.messages_window.blit()
-        self.status_bar.blit()
-        self.examine_window.blit()
+        for window in (self.map_window, self.messages_window,
+                       self.status_bar, self.examine_window):
+            window.draw()
+            window.blit()
         tcod.console_flush()
 
     def handle_birth(self, event):
         # new item on level
-        memory = self.memory.get(event.info.pos, None)
-        if memory and event.info.pos in self.vision:
-            memory.item = event.info
-            self.draw_tile(event.info.pos)
+        self.update_object(event.info.pos)
 
     def handle_player_status_update(self, event):
-        player = event.info
-        self.status_bar.update({
-        })
-        ns = {}
-        for st in player.body.visible:
-            value = player.body.gs(st)
-            if isinstance(value, float):
-                value = round(value, 2)
-            if player.body.is_critical(st):
-                ns[st] = (str(value), tcod.light_grey, tcod.red)
-            else:
-                ns[st] = (str(value), tcod.light_grey, tcod.light_grey)
-        self.status_bar.update(ns, background_color=tcod.dark_grey)
+        self.status_bar.update_player(event.info)
 
     def handle_removal(self, event):
         # item removed on level
-        memory = self.memory.get(event.info.pos, None)
-        if memory and event.info.pos in self.vision:
-            memory.item = None
-            self.draw_tile(event.info.pos)
+        self.update_object(event.info.pos)
+
+    def update_object(self, pos):
+        if self.world is None:
+            return
+        level = self.player_level
+        memory = self.get_memory(level)
+        if memory.is_visible(pos):
+            memory.set_object(pos, level.get_object(pos))
+            self.draw_tile(memory, pos)
 
     def handle_game_over(self, event):
         self.state = States.GAME_OVER
         self.messages_window.message("(Press escape to quit.)")
 
     def handle_move(self, event):
-        # remove mob from previous memory position if we saw him leave
-        memory = self.memory.get(event.info.prev_pos, None)
-        if memory and event.info.prev_pos in self.vision:
-            memory.mob = None
-            self.draw_tile(event.info.prev_pos)
-
-        # add mob to new memory position if we saw him enter
-        memory = self.memory.get(event.info.mob.pos, None)
-        if memory and event.info.mob.pos in self.vision:
-            memory.mob = event.info.mob
-            self.draw_tile(event.info.mob.pos)
-
-        # recenter/redraw everything if it was the player who moved
-        if event.info.mob.info["name"] == 'player' \
-                and self.state == States.DEFAULT:
-            self.map_window.center(event.info.mob.pos)
-            self.map_window.redraw_level(self.memory, self.vision)
-            if memory and memory.item:
+        if self.world is None:
+            return
+        mob = event.info.mob
+        level = self.world.levels[mob.dlevel]
+        memory = self.get_memory(level)
+
+        # forget the mob at its previous position if we saw it leave; with
+        # queued events another mob may have taken its place since
+        prev_pos = event.info.prev_pos
+        if prev_pos is not None and memory.is_visible(prev_pos):
+            occupant = level.get_mob(prev_pos)
+            memory.set_mob(prev_pos, occupant if occupant is not mob else None)
+            self.draw_tile(memory, prev_pos)
+
+        # and the new one if we saw it enter
+        if memory.is_visible(mob.pos):
+            memory.set_mob(mob.pos, mob)
+            self.draw_tile(memory, mob.pos)
+
+        # recenter everything if it was the player who moved
+        if mob.info["name"] == 'player' and self.state == States.DEFAULT:
+            if self.map_window.layers is not memory:
+                self.map_window.layers = memory
+                self.map_window.mark_all_dirty()
+            self.map_window.center(mob.pos)
+            item = level.get_object(mob.pos)
+            if item:
                 self.messages_window.message(
-                    "You see a " + memory.item.name + '.')
+                    "You see a " + item.name + '.')
+
+    def draw_tile(self, memory, pos):
+        if memory is self.map_window.layers:
+            self.map_window.mark_dirty(pos)
 
-    def draw_tile(self, pos):
-        self.map_window.draw_tile(pos, self.memory, self.vision)
+    def draw_tiles(self, memory, x, y):
+        if memory is self.map_window.layers:
+            self.map_window.mark_dirty_cells(x, y)
 
     def handle_revealed(self, event):
-        info = event.info
-        self.vision.add(info.pos)
-        self.memory[info.pos] = TileMemory(info.tile.name, info.mob, info.item)
-        self.map_window.draw_tile(info.pos, self.memory, self.vision)
+        level = self.player_level
+        pos = event.info.pos
+        memory = self.get_memory(level)
+        self.draw_tiles(memory, *memory.reveal(level, [level.index(*pos)]))
 
     def handle_hidden(self, event):
-        self.vision.remove(event.info.pos)
-        self.draw_tile(event.info.pos)
+        level = self.player_level
+        pos = event.info.pos
+        memory = self.get_memory(level)
+        self.draw_tiles(memory, *memory.hide(level, [level.index(*pos)]))
+
+    def handle_tiles_revealed(self, event):
+        level = event.info.level
+        memory = self.get_memory(level)
+        self.draw_tiles(memory, *memory.reveal(level, event.info.indices))
+
+    def handle_tiles_hidden(self, event):
+        level = event.info.level
+        memory = self.get_memory(level)
+        self.draw_tiles(memory, *memory.hide(level, event.info.indices))
 
     def handle_message(self, event):
         message, color = event.info
@@ -599,6 +979,12 @@ def create_drawable_from_json(info):
                     getattr(tcod, bg_color) if bg_color is not None else None)
 
 
+@lru_cache(maxsize=512)
+def wrap_message(message, width):
+    """Returns the lines of message wrapped to width, cached for repeats."""
+    return tuple(wrap(message, width))
+
+
 def draw_cell(con, pos, char, fg, bg=None):
     x, y = pos
     if bg:
@@ -655,3 +1041,5 @@ for info in world.data["mobs"].values():
     drawables[info['name']] = create_drawable_from_json(info)
 for name, info in world.data["objects"].items():
     drawables[name] = create_drawable_from_json(info)
+
+palette = Palette()
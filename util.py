@@ -1,45 +1,67 @@
-class Pos(object):
-    def __init__(self, x_or_tuple, y=None):
-        if isinstance(x_or_tuple, Pos):
-            self.x, self.y = x_or_tuple
-        elif isinstance(x_or_tuple, tuple):
-            self.x, self.y = x_or_tuple
+from operator import itemgetter
+
+# positions with 0 <= x, y < INTERN_SIZE are created once and shared
+INTERN_SIZE = 256
+
+_interned = [None] * (INTERN_SIZE * INTERN_SIZE)
+
+
+class Pos(tuple):
+    """
+    An immutable (x, y) pair. Hashes and compares equal like the plain tuple
+    (x, y), so Pos and tuple keys can be mixed in sets and dicts.
+    """
+    __slots__ = ()
+
+    def __new__(cls, x_or_tuple, y=None):
+        if y is None:
+            if type(x_or_tuple) is Pos:
+                return x_or_tuple
+            x, y = x_or_tuple
         else:
-            self.x = x_or_tuple
-            self.y = y
+            x = x_or_tuple
+        if 0 <= x < INTERN_SIZE and 0 <= y < INTERN_SIZE:
+            i = x * INTERN_SIZE + y
+            try:
+                pos = _interned[i]
+            except TypeError:
+                # not integer coordinates
+                return tuple.__new__(cls, (x, y))
+            if pos is None:
+                pos = _interned[i] = tuple.__new__(cls, (x, y))
+            return pos
+        return tuple.__new__(cls, (x, y))
 
-    def __eq__(self, pos):
-        return self[:] == pos[:]
+    x = property(itemgetter(0))
+    y = property(itemgetter(1))
 
     def __add__(self, pos):
-        return Pos(self.x + pos.x, self.y + pos.y)
+        return Pos(self[0] + pos[0], self[1] + pos[1])
+
+    __radd__ = __add__
 
     def __sub__(self, pos):
-        return Pos(self.x - pos.x, self.y - pos.y)
+        return Pos(self[0] - pos[0], self[1] - pos[1])
+
+    def __rsub__(self, pos):
+        return Pos(pos[0] - self[0], pos[1] - self[1])
 
     def __neg__(self):
-        return Pos(-self.x, -self.y)
+        return Pos(-self[0], -self[1])
 
     def __mul__(self, num):
-        return Pos(self.x * num, self.y * num)
+        return Pos(self[0] * num, self[1] * num)
+
+    __rmul__ = __mul__
 
     def __floordiv__(self, num):
-        return Pos(self.x // num, self.y // num)
+        return Pos(self[0] // num, self[1] // num)
 
     def __repr__(self):
-        return "Pos({}, {})".format(self.x, self.y)
-
-    def __len__(self):
-        return 2
-
-    def __getitem__(self, i):
-        return (self.x, self.y)[i]
-
-    def __hash__(self):
-        return hash((self.x, self.y))
+        return "Pos({}, {})".format(self[0], self[1])
 
     def __abs__(self):
-        return abs(self.x) + abs(self.y)
+        return abs(self[0]) + abs(self[1])
 
     def distance(self, other):
-        return abs(self - other)
+        return abs(self[0] - other[0]) + abs(self[1] - other[1])
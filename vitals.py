@@ -1,10 +1,16 @@
-from events import events, Event, EventType
+import events
+from events import Event, EventType
 from events import message as ev_message
-from random import random, choice
 from collections import namedtuple
+from math import ceil, floor, log, sqrt
+import rng
 from world import Interactions
 import tcod
 
+# the body rolls on its own stream
+random, choice, gauss = rng.body.random, rng.body.choice, rng.body.gauss
+geometric, binomial = rng.body.geometric, rng.body.binomial
+
 blood_sugar_spike = namedtuple('blood_sugar_spike',
                                ['current_blood_sugar',
                                 'spike_blood_sugar',
@@ -85,9 +91,9 @@ class Body(object):
     def hc(self, condition_name):
         return condition_name in self.conditions
 
-    def sc(self, condition_name, condition_value, duration={}):
+    def sc(self, condition_name, condition_value, duration={}, time=None):
         condition_value.configure(self,
-                                  self.turn_number,
+                                  self.turn_number if time is None else time,
                                   duration)
         condition_value.on_start()
         self.conditions[condition_name] = condition_value
@@ -138,6 +144,25 @@ class Body(object):
 
     def on_tick(self):
         ''' Called every action in game '''
+        self.advance(1)
+
+    def advance(self, n_turns):
+        ''' Called with the number of turns an action took. Stretches in
+        which nothing but drift and random events happen are fast-forwarded
+        in closed form, everything else is stepped turn by turn '''
+        while n_turns > 0 and self.alive:
+            turns = min(n_turns, self.steady_turns())
+            if turns > 1:
+                self.fast_forward(turns)
+            else:
+                # single turns are stepped, so that they roll exactly
+                turns = 1
+                self.step()
+            n_turns -= turns
+        events.events.send(Event(EventType.PLAYER_STATUS_UPDATE, self.player))
+
+    def step(self):
+        ''' Advances the body by a single turn '''
         if not self.hs('sleeping'):
             self.handle_fatigue()
         self.handle_nutrition()
@@ -154,7 +179,60 @@ class Body(object):
                            if not v.is_over(self.turn_number - v.start_time)}
 
         self.turn_number += 1
-        events.send(Event(EventType.PLAYER_STATUS_UPDATE, self.player))
+
+    def fatigue_rate(self):
+        ''' Expected growth of fatigue per turn '''
+        rate = 1.0 if self.hs('sleeping') else self.const('FATIGUE_RATE')
+        for condition in self.conditions.values():
+            rate *= condition.fatigue_rate()
+        return rate
+
+    def steady_turns(self):
+        ''' Number of turns from now that fast_forward can cover: up to the
+        end of a sugar spike, an expected faint or a condition change '''
+        turns = [float('inf')]
+        if self.hs('blood_sugar_spike'):
+            turns.append(self.gs('blood_sugar_spike').start_turn +
+                         self.const('SUGAR_SPIKE_DURATION') + 1 -
+                         self.turn_number)
+        rate = self.fatigue_rate()
+        if not self.hs('sleeping') and rate > 1:
+            headroom = self.const('MAX_FATIGUE') / self.gs('fatigue')
+            turns.append(floor(log(headroom) / log(rate)) + 1
+                         if headroom >= 1 else 0)
+        for condition in self.conditions.values():
+            condition_turns = condition.steady_turns(
+                self.turn_number - condition.start_time)
+            if condition_turns is not None:
+                turns.append(condition_turns)
+        return min(turns)
+
+    def fast_forward(self, turns):
+        ''' Advances the body by turns turns in closed form. Only valid within
+        steady_turns; random events are sampled in aggregate and flavour
+        messages are rolled once for the whole stretch '''
+        first = self.turn_number
+        self.turn_number = first + turns - 1
+
+        if not self.hs('sleeping'):
+            self.ss('fatigue', self.gs('fatigue') *
+                    self.const('FATIGUE_RATE') ** turns)
+            if random() < self.const('FATIGUE_MESSAGE_PROB'):
+                self.fatigue_message()
+
+        nutrition = self.gs('nutrition')
+        self.ss('nutrition', nutrition - turns)
+        starving = turns - min(max(floor(nutrition), 0), turns)
+        prob = self.const('HUNGER_MESSAGE_PROB')
+        if random() < (1 - (1 - prob) ** starving if starving else prob):
+            self.hunger_message()
+
+        self.drift_blood_sugar(turns)
+
+        for condition in list(self.conditions.values()):
+            condition.advance(first - condition.start_time, turns)
+
+        self.turn_number += 1
 
     def sleep(self):
         print("original fatigue: {}".format(self.gs('fatigue')))
@@ -231,7 +309,7 @@ class Body(object):
                              'to discourage players from taking every pill '
                              'they come across. You took the wrong pill. '
                              'So rocks fall and you die.', tcod.red)
-                events.send(Event(EventType.GAME_OVER, None))
+                events.events.send(Event(EventType.GAME_OVER, None))
 
         time = int(action_time ** (1 + k * (self.gs('fatigue') /
                                             self.const('MAX_FATIGUE'))))
@@ -266,7 +344,7 @@ class Body(object):
                         spike(self.const('LOW_CARB_SPIKE')),
                         self.turn_number))
 
-        events.send(Event(EventType.PLAYER_STATUS_UPDATE, self.player))
+        events.events.send(Event(EventType.PLAYER_STATUS_UPDATE, self.player))
 
     def handle_fatigue(self):
         if self.gs('fatigue') > self.const('MAX_FATIGUE'):
@@ -287,54 +365,72 @@ class Body(object):
         else:
             self.ss('fatigue', self.gs('fatigue') * self.const('FATIGUE_RATE'))
             if random() < self.const('FATIGUE_MESSAGE_PROB'):
-                if self.gs('fatigue') > self.const('CRITICAL_FATIGUE'):
-                    self.message('You feel like you are about to pass out')
-                elif self.gs('fatigue') > self.const('HEAVY_FATIGUE'):
-                    self.message('You feel incredibly tired')
-                elif self.gs('fatigue') > self.const('MEDIUM_FATIGUE'):
-                    self.message('You feel tired')
-                elif self.gs('fatigue') > self.const('LIGHT_FATIGUE'):
-                    self.message('You feel sleepy')
+                self.fatigue_message()
+
+    def fatigue_message(self):
+        if self.gs('fatigue') > self.const('CRITICAL_FATIGUE'):
+            self.message('You feel like you are about to pass out')
+        elif self.gs('fatigue') > self.const('HEAVY_FATIGUE'):
+            self.message('You feel incredibly tired')
+        elif self.gs('fatigue') > self.const('MEDIUM_FATIGUE'):
+            self.message('You feel tired')
+        elif self.gs('fatigue') > self.const('LIGHT_FATIGUE'):
+            self.message('You feel sleepy')
 
     def handle_nutrition(self):
         self.ss('nutrition', self.gs('nutrition') - 1)
         if random() < self.const('HUNGER_MESSAGE_PROB'):
-            ratio = self.gs('nutrition') / self.const('MAX_NUTRITION')
-            if ratio < self.const('STARVATION'):
-                self.message("You starve to death.", tcod.red)
-                self.die()
-            elif ratio < self.const('CRITICAL_HUNGER'):
-                self.message("You are starving to death")
-            elif ratio < self.const('HEAVY_HUNGER'):
-                self.message("Your belly aches with hunger cramps")
-            elif ratio < self.const('MEDIUM_HUNGER'):
-                self.message("You feel very hungry")
-            elif ratio < self.const('LIGHT_HUNGER'):
-                self.message("You feel hungry")
+            self.hunger_message()
+
+    def hunger_message(self):
+        ratio = self.gs('nutrition') / self.const('MAX_NUTRITION')
+        if ratio < self.const('STARVATION'):
+            self.message("You starve to death.", tcod.red)
+            self.die()
+        elif ratio < self.const('CRITICAL_HUNGER'):
+            self.message("You are starving to death")
+        elif ratio < self.const('HEAVY_HUNGER'):
+            self.message("Your belly aches with hunger cramps")
+        elif ratio < self.const('MEDIUM_HUNGER'):
+            self.message("You feel very hungry")
+        elif ratio < self.const('LIGHT_HUNGER'):
+            self.message("You feel hungry")
 
     def die(self):
         self.alive = False
-        events.send(Event(EventType.GAME_OVER, None))
+        events.events.send(Event(EventType.GAME_OVER, None))
 
-    def handle_blood_sugar(self):
-        #print('current blood sugar: {}'.format(self.gs('blood_sugar')))
-        noise = (random() - 0.5)
+    def blood_sugar_target(self):
+        ''' Returns the blood sugar the body drifts to and the mean drift
+        per turn '''
         if 'blood_sugar_spike' not in self.stats:
             nutrition_ratio = self.gs('nutrition') / \
                 self.const('MAX_NUTRITION')
             target = self.const('FASTING_BLOOD_SUGAR') * \
                 min(self.const('LOW_BLOOD_SUGAR_OFFSET') + nutrition_ratio, 1.0)
-            delta = noise + 1
             #print('target blood sugar: {}'.format(target))
+            return target, 1
+        return self.gs('blood_sugar_spike').spike_blood_sugar, 3
 
-        else:
+    def blood_sugar_symptoms(self):
+        return [('blurry_vision', BlurryVision(), {'duration': 20}),
+                ('tachycardia', Tachycardia(), {'duration': 5}),
+                ('anxiety', Anxiety(), {'duration': 30}),
+                ('headache', Headache(), {'duration': 25}),
+                ('shaking', Shaking(), {'duration': 30}),
+                ('dizziness', Dizziness(), {'duration': 30})]
+
+    def handle_blood_sugar(self):
+        #print('current blood sugar: {}'.format(self.gs('blood_sugar')))
+        noise = (random() - 0.5)
+        if 'blood_sugar_spike' in self.stats:
             start_turn = self.gs('blood_sugar_spike').start_turn
             if self.turn_number - start_turn > \
                     self.const('SUGAR_SPIKE_DURATION'):
                 del self.stats['blood_sugar_spike']
                 return
-            target = self.gs('blood_sugar_spike').spike_blood_sugar
-            delta = noise + 3
+        target, drift = self.blood_sugar_target()
+        delta = noise + drift
 
         if self.gs('blood_sugar') < target:
             self.ss('blood_sugar', self.gs('blood_sugar') + delta)
@@ -343,18 +439,52 @@ class Body(object):
 
         if self.gs('blood_sugar') < self.const('LOW_BLOOD_SUGAR') and \
                 random() < self.const('BLOOD_SUGAR_SYMPTOM_PROB'):
-            symptoms = [('blurry_vision', BlurryVision(), {'duration': 20}),
-                        ('tachycardia', Tachycardia(), {'duration': 5}),
-                        ('anxiety', Anxiety(), {'duration': 30}),
-                        ('headache', Headache(), {'duration': 25}),
-                        ('shaking', Shaking(), {'duration': 30}),
-                        ('dizziness', Dizziness(), {'duration': 30})]
-            name, symptom, details = choice(symptoms)
+            name, symptom, details = choice(self.blood_sugar_symptoms())
             self.sc(name, symptom, details)
 
+    def drift_blood_sugar(self, turns):
+        ''' Closed form of turns calls to handle_blood_sugar, ending at the
+        current turn '''
+        target, drift = self.blood_sugar_target()
+        blood_sugar = self.gs('blood_sugar')
+        low = self.const('LOW_BLOOD_SUGAR')
+        rising = blood_sugar < target
+        approach = min(turns, int(abs(target - blood_sugar) / drift))
+        if approach < turns:
+            # reached the target and oscillates around it since
+            self.ss('blood_sugar', target + (2 * random() - 1) * drift)
+        else:
+            # the sum of the uniform noises is about normal
+            moved = approach * drift + gauss(0, sqrt(approach / 12))
+            self.ss('blood_sugar', blood_sugar + (moved if rising else -moved))
+
+        # turns spent below LOW_BLOOD_SUGAR, at the start of the stretch when
+        # rising and at its end when falling
+        if rising:
+            below = min(max(ceil((low - blood_sugar) / drift) - 1, 0),
+                        approach)
+        else:
+            below = approach - min(max(floor((blood_sugar - low) / drift), 0),
+                                   approach)
+        # the oscillation around the target spans twice the drift
+        share = min(max((low - target + drift) / (2 * drift), 0), 1)
+        below += int(round((turns - approach) * share))
+        last = self.turn_number
+        end = last - turns + below if rising else last
+
+        # only the latest onset of each symptom can still be going on
+        symptoms = self.blood_sugar_symptoms()
+        prob = self.const('BLOOD_SUGAR_SYMPTOM_PROB') / len(symptoms)
+        for name, symptom, details in symptoms:
+            gap = geometric(prob) - 1
+            if gap < below and last - (end - gap) <= details['duration']:
+                self.sc(name, symptom, details, time=end - gap)
+
 
 class Condition(object):
 
+    calm = None
+
     def configure(self, body, time, details):
         self.body = body
         self.start_time = time
@@ -377,6 +507,41 @@ class Condition(object):
         return self.over or (time > self.details['duration']
                              if 'duration' in self.details else False)
 
+    def steady_turns(self, time):
+        ''' Number of turns from time on that advance can cover, None if
+        there is no limit '''
+        if self.over:
+            return 0
+        if 'duration' in self.details:
+            return self.details['duration'] + 1 - time
+        return None
+
+    def advance(self, time, turns):
+        ''' Called instead of on_progression for turns turns from time on.
+        Conditions that only print flavour messages roll them for the last
+        turn alone '''
+        self.on_progression(time + turns - 1)
+
+    def fatigue_rate(self):
+        ''' Expected growth of fatigue per turn caused by the condition '''
+        return 1.0
+
+    def wait(self):
+        ''' Turns up to the next event of probability prob, sampled ahead so
+        that a fast-forward can end on it '''
+        if self.calm is None:
+            self.calm = geometric(self.prob)
+        return self.calm
+
+    def waited(self, turns):
+        ''' Returns True if the event waited for happens on the last of
+        turns '''
+        self.calm -= turns
+        if self.calm:
+            return False
+        self.calm = None
+        return True
+
 
 class BlurryVision(Condition):
 
@@ -520,20 +685,39 @@ class Cough(Condition):
         if 'severe' in self.details:
             self.prob = 0.2
             self.fatigue_prob = 0.02
+            self.fatigue_factor = 1.08
         else:
             self.prob = 0.1
             self.fatigue_prob = 0.01
+            self.fatigue_factor = 1.02
+
+    def cough(self):
+        if 'severe' in self.details:
+            self.body.message("You cough violently")
+        else:
+            self.body.message("You cough")
 
     def on_progression(self, time):
         if random() < self.prob and not self.body.hs('sleeping'):
-            if 'severe' in self.details:
-                self.body.message("You cough violently")
-                if random() < self.fatigue_prob:
-                    self.body.ss('fatigue', self.body.gs('fatigue') * 1.08)
-            else:
-                self.body.message("You cough")
-                if random() < self.fatigue_prob:
-                    self.body.ss('fatigue', self.body.gs('fatigue') * 1.02)
+            self.cough()
+            if random() < self.fatigue_prob:
+                self.body.ss('fatigue',
+                             self.body.gs('fatigue') * self.fatigue_factor)
+
+    def advance(self, time, turns):
+        if self.body.hs('sleeping'):
+            return
+        coughs = binomial(turns, self.prob)
+        if coughs:
+            self.cough()
+            self.body.ss('fatigue', self.body.gs('fatigue') *
+                         self.fatigue_factor ** binomial(coughs,
+                                                         self.fatigue_prob))
+
+    def fatigue_rate(self):
+        if self.body.hs('sleeping'):
+            return 1.0
+        return self.fatigue_factor ** (self.prob * self.fatigue_prob)
 
     def on_interact(self, obj, time):
         if obj.interaction == Interactions.EAT:
@@ -556,14 +740,30 @@ class Fever(Condition):
             self.body.message("You feel ill")
             self.prob = 0.02
 
+    def malaise(self):
+        if random() < 0.5:
+            self.body.message("You have a strong feeling of malaise")
+        else:
+            self.body.message("Your body is burning up")
+
     def on_progression(self, time):
         if random() < self.prob and not self.body.hs('sleeping'):
-            if random() < 0.5:
-                self.body.message("You have a strong feeling of malaise")
-            else:
-                self.body.message("Your body is burning up")
+            self.malaise()
             self.body.ss('fatigue', self.body.gs('fatigue') * 1.01)
 
+    def advance(self, time, turns):
+        if self.body.hs('sleeping'):
+            return
+        bouts = binomial(turns, self.prob)
+        if bouts:
+            self.malaise()
+            self.body.ss('fatigue', self.body.gs('fatigue') * 1.01 ** bouts)
+
+    def fatigue_rate(self):
+        if self.body.hs('sleeping'):
+            return 1.0
+        return 1.01 ** self.prob
+
     def on_interact(self, obj, time):
         return True
 
@@ -658,16 +858,33 @@ class Vomiting(Condition):
     def on_start(self):
         self.prob = 0.05
 
+    def vomit(self):
+        if self.body.gs('nutrition') / self.body.const('MAX_NUTRITION') > 0.5:
+            self.body.ss('nutrition', max(self.body.gs('nutrition') - 200,
+                                          self.body.const('MAX_NUTRITION') / 2))
+            self.body.message("You vomit and stain the floor")
+            if 'bloody' in self.body.stats:
+                self.body.message("You notice blood in the vomit")
+        else:
+            self.body.message("You retch but nothing comes out")
+
     def on_progression(self, time):
+        self.calm = None
         if random() < self.prob:
-            if self.body.gs('nutrition') / self.body.const('MAX_NUTRITION') > 0.5:
-                self.body.ss('nutrition', max(self.body.gs('nutrition') - 200,
-                                              self.body.const('MAX_NUTRITION') / 2))
-                self.body.message("You vomit and stain the floor")
-                if 'bloody' in self.body.stats:
-                    self.body.message("You notice blood in the vomit")
-            else:
-                self.body.message("You retch but nothing comes out")
+            self.vomit()
+
+    def steady_turns(self, time):
+        # vomiting moves the blood sugar target, so fast-forwards end on it
+        # while there is anything to throw up
+        if self.body.gs('nutrition') / self.body.const('MAX_NUTRITION') > 0.5:
+            return self.wait()
+        return None
+
+    def advance(self, time, turns):
+        if self.calm is None:
+            self.on_progression(time + turns - 1)
+        elif self.waited(turns):
+            self.vomit()
 
     def on_interact(self, obj, time):
         return True
@@ -696,7 +913,7 @@ class Pneumonia(Condition):
             self.over = True
             self.body.message(
                 "You have found the cure for your pneumonia!", tcod.green)
-            events.send(Event(EventType.GAME_OVER, None))
+            events.events.send(Event(EventType.GAME_OVER, None))
         return True
 
     def on_completion(self):
@@ -755,6 +972,26 @@ class SleepingSickness(Condition):
                 else:
                     self.body.ss('fatigue', self.body.gs('fatigue') * 1.1)
 
+    def steady_turns(self, time):
+        return 200 - time if time < 200 else None
+
+    def advance(self, time, turns):
+        if time < 200:
+            self.on_progression(time + turns - 1)
+        elif not self.body.hc('sleeping'):
+            self.prob = 0.5
+            self.body.sc('ss_shaking', Shaking(), {})
+            spells = binomial(turns, self.prob)
+            fits = binomial(spells, 0.5)
+            if spells > fits:
+                self.body.message('You feel confused')
+            self.body.ss('fatigue', self.body.gs('fatigue') * 1.1 ** fits)
+
+    def fatigue_rate(self):
+        if self.body.turn_number - self.start_time < 200:
+            return 1.0
+        return 1.1 ** 0.25
+
     def on_interact(self, obj, time):
         if obj.interaction == Interactions.CURE_SLEEPING_SICKNESS_1 \
                 and time <= 200 \
@@ -763,7 +1000,7 @@ class SleepingSickness(Condition):
             self.body.message(
                 "You have found the cure for your sleeping sickness!",
                 tcod.green)
-            events.send(Event(EventType.GAME_OVER, None))
+            events.events.send(Event(EventType.GAME_OVER, None))
         return True
 
     def on_completion(self):
@@ -792,7 +1029,7 @@ class TB(Condition):
             self.over = True
             self.body.message("You have found the cure for your tuberculosis!",
                               tcod.green)
-            events.send(Event(EventType.GAME_OVER, None))
+            events.events.send(Event(EventType.GAME_OVER, None))
         return True
 
     def on_completion(self):
@@ -820,7 +1057,7 @@ class Pertussis(Condition):
             self.over = True
             self.body.message("You have found the cure for your pertussis!",
                               tcod.green)
-            events.send(Event(EventType.GAME_OVER, None))
+            events.events.send(Event(EventType.GAME_OVER, None))
         return True
 
     def on_completion(self):
@@ -860,9 +1097,17 @@ class Asthma(Condition):
         self.prob = 0.005
 
     def on_progression(self, time):
+        self.calm = None
         if random() < self.prob and not self.body.hs('sleeping'):
             self.body.sc("asthma_attack", AsthmaAttack(), {'duration': 30})
 
+    def steady_turns(self, time):
+        return None if self.body.hs('sleeping') else self.wait()
+
+    def advance(self, time, turns):
+        if not self.body.hs('sleeping') and self.waited(turns):
+            self.body.sc("asthma_attack", AsthmaAttack(), {'duration': 30})
+
     def on_interact(self, obj, time):
         return True
 
@@ -882,6 +1127,14 @@ class AsthmaAttack(Condition):
             self.body.message("You wheeze. You need an inhaler!")
         self.body.ss('fatigue', self.body.gs('fatigue') * 1.05)
 
+    def advance(self, time, turns):
+        if time + turns - 1 > 5 and random() < self.prob:
+            self.body.message("You wheeze. You need an inhaler!")
+        self.body.ss('fatigue', self.body.gs('fatigue') * 1.05 ** turns)
+
+    def fatigue_rate(self):
+        return 1.05
+
     def on_interact(self, obj, time):
         if obj.interaction == Interactions.INHALER:
             self.over = True
@@ -1,9 +1,11 @@
+from array import array
+from collections import namedtuple
 import json
 import glob
 import os
 from enum import Enum
 import math
-import random
+import rng
 import constants
 import events
 import fov
@@ -43,6 +45,76 @@ class Tile(object):
         self.room_id = room_id
 
 
+TileType = namedtuple('TileType', ['name', 'blocked', 'opaque'])
+
+# table of every kind of tile, indexed by the ids stored in Level.tile_type
+tile_types = []
+tile_type_ids = {}
+
+
+def get_tile_type_id(name, blocked=False, opaque=False):
+    """Returns the id of the given tile type, registering it if it is new."""
+    tile_type = TileType(name, blocked, opaque)
+    type_id = tile_type_ids.get(tile_type)
+    if type_id is None:
+        if len(tile_types) > 255:
+            raise ValueError("Too many tile types")
+        type_id = tile_type_ids[tile_type] = len(tile_types)
+        tile_types.append(tile_type)
+    return type_id
+
+
+HOSPITAL_WALL = get_tile_type_id('hospital wall', blocked=True, opaque=True)
+TILE_FLOOR = get_tile_type_id('tile floor')
+
+
+FrozenTile = namedtuple('FrozenTile',
+                        ['name', 'blocked', 'opaque', 'explored', 'room_id'])
+
+# shared, immutable tile returned for every position outside a level
+OUT_OF_BOUNDS_TILE = FrozenTile('hospital wall', blocked=True, opaque=True,
+                                explored=False, room_id=0)
+
+
+class TileView(object):
+    """
+    A tile of a Level, read from and written to the level's arrays.
+    """
+    __slots__ = ('level', 'index')
+
+    def __init__(self, level, index):
+        self.level = level
+        self.index = index
+
+    @property
+    def name(self):
+        return tile_types[self.level.tile_type[self.index]].name
+
+    @property
+    def blocked(self):
+        return bool(self.level.tile_blocked[self.index])
+
+    @property
+    def opaque(self):
+        return bool(self.level.tile_opaque[self.index])
+
+    @property
+    def explored(self):
+        return bool(self.level.explored[self.index])
+
+    @explored.setter
+    def explored(self, value):
+        self.level.explored[self.index] = bool(value)
+
+    @property
+    def room_id(self):
+        return self.level.room_id[self.index]
+
+    @room_id.setter
+    def room_id(self, value):
+        self.level.room_id[self.index] = value
+
+
 class TileInfo(object):
 
     def __init__(self, pos, tile, mob=None, item=None):
@@ -52,6 +124,20 @@ class TileInfo(object):
         self.item = item
 
 
+class TilesInfo(object):
+    """
+    A batch of tiles of a level, given as indices into the level's arrays.
+    """
+
+    def __init__(self, level, indices):
+        self.level = level
+        self.indices = indices
+
+    def positions(self):
+        pos_at = self.level.pos_at
+        return [pos_at(i) for i in self.indices]
+
+
 class Interactions(Enum):
     NONE = 0
     OPEN_DOOR = 1
@@ -92,18 +178,75 @@ class Object(object):
         events.events.send(events.Event(events.EventType.BIRTH, self))
 
 
+class CellDict(dict):
+    """
+    Dict keyed by position that tells its level whenever a cell changes, so
+    the level can keep its blocked/opaque maps up to date.
+    """
+
+    def __init__(self, level):
+        super().__init__()
+        self.level = level
+
+    def __setitem__(self, pos, value):
+        super().__setitem__(pos, value)
+        self.level.update_cell(pos)
+
+    def __delitem__(self, pos):
+        super().__delitem__(pos)
+        self.level.update_cell(pos)
+
+    def pop(self, pos, *default):
+        value = super().pop(pos, *default)
+        self.level.update_cell(pos)
+        return value
+
+    def clear(self):
+        positions = list(self)
+        super().clear()
+        for pos in positions:
+            self.level.update_cell(pos)
+
+
 class Level(object):
 
-    def __init__(self, width, height):
+    def __init__(self, width, height, border=constants.FOV_RADIUS + 1):
+        """
+        Tiles are stored column by column in parallel arrays:
+        tile_type: ids into tile_types
+        tile_blocked, tile_opaque: copied from the tile type for fast reads
+        explored: whether the player has seen the tile
+        room_id: index into rooms
+        blocked_map, opaque_map: tiles combined with the mobs and objects on
+            them, kept up to date as tiles, mobs and objects change
+        terrain_blocked_map: like blocked_map, but ignoring mobs.
+            terrain_version goes up whenever it changes.
+        path_finder: path.PathFinder searching the level, made on first use
+
+        The arrays are padded with border cells of wall on every side, so
+        FOV and path searches can read positions up to border tiles outside
+        the map without bounds checks.
+        """
         self.width = width
         self.height = height
-        self.tiles = [[Tile('hospital wall', blocked=True, opaque=True)
-                       for y in range(height)]
-                      for x in range(width)]
+        self.border = border
+        self.stride = height + 2 * border
+        self.offset = border * self.stride + border
+        size = (width + 2 * border) * self.stride
+        self.tile_type = bytearray([HOSPITAL_WALL]) * size
+        self.tile_blocked = bytearray([True]) * size
+        self.tile_opaque = bytearray([True]) * size
+        self.explored = bytearray(size)
+        self.room_id = array('H', [0]) * size
+        self.blocked_map = bytearray([True]) * size
+        self.terrain_blocked_map = bytearray([True]) * size
+        self.terrain_version = 0
+        self.opaque_map = bytearray([True]) * size
         self.up_stairs_pos = self.down_stairs_pos = None
-        self.mobs = {}
+        self.mobs = CellDict(self)
         self.rooms = ['']
-        self.objects = {}
+        self.objects = CellDict(self)
+        self.path_finder = None
 
     def move_mob(self, from_pos, to_pos):
         if from_pos in self.mobs:
@@ -126,24 +269,84 @@ class Level(object):
         return self.objects.get(pos, None)
 
     def is_blocked(self, pos):
-        return self[pos].blocked or pos in self.mobs or \
-            (pos in self.objects and not self.objects[pos].is_passable)
+        """Positions beyond the padded border are blocked."""
+        x, y = pos
+        border = self.border
+        if -border <= x < self.width + border and \
+                -border <= y < self.height + border:
+            return self.blocked_map[x * self.stride + y + self.offset]
+        return True
 
     def is_opaque(self, pos):
-        return self[pos].opaque \
-            or pos in self.objects and self.objects[pos].opaque
+        """Positions beyond the padded border are opaque."""
+        x, y = pos
+        border = self.border
+        if -border <= x < self.width + border and \
+                -border <= y < self.height + border:
+            return self.opaque_map[x * self.stride + y + self.offset]
+        return True
+
+    def update_cell(self, pos):
+        """Recomputes the blocked and opaque maps at pos."""
+        x, y = pos
+        if x < 0 or x >= self.width or y < 0 or y >= self.height:
+            return
+        i = x * self.stride + y + self.offset
+        obj = self.objects.get(pos)
+        terrain_blocked = self.tile_blocked[i] or \
+            (obj is not None and not obj.is_passable)
+        if terrain_blocked != self.terrain_blocked_map[i]:
+            self.terrain_blocked_map[i] = terrain_blocked
+            self.terrain_version += 1
+        self.blocked_map[i] = terrain_blocked or pos in self.mobs
+        self.opaque_map[i] = self.tile_opaque[i] or \
+            (obj is not None and obj.opaque)
+
+    def index(self, x, y):
+        return x * self.stride + y + self.offset
+
+    def pos_at(self, index):
+        x, y = divmod(index - self.offset, self.stride)
+        if y >= self.height + self.border:
+            # the cell is in the border above column x + 1
+            x, y = x + 1, y - self.stride
+        return Pos(x, y)
+
+    def in_border(self, x, y):
+        """Returns whether x, y is inside the map or its padded border."""
+        return -self.border <= x < self.width + self.border and \
+            -self.border <= y < self.height + self.border
+
+    def set_tile(self, x, y, type_id, room_id=0, explored=False):
+        if x < 0 or x >= self.width or y < 0 or y >= self.height:
+            raise IndexError("Out of map bounds")
+        i = x * self.stride + y + self.offset
+        tile_type = tile_types[type_id]
+        self.tile_type[i] = type_id
+        self.tile_blocked[i] = tile_type.blocked
+        self.tile_opaque[i] = tile_type.opaque
+        self.explored[i] = explored
+        self.room_id[i] = room_id
+        self.update_cell((x, y))
+
+    def get_tile_type(self, x, y):
+        """Positions beyond the padded border are wall."""
+        border = self.border
+        if -border <= x < self.width + border and \
+                -border <= y < self.height + border:
+            return self.tile_type[x * self.stride + y + self.offset]
+        return HOSPITAL_WALL
 
     def __getitem__(self, key):
         x, y = key
         if x < 0 or x >= self.width or y < 0 or y >= self.height:
-            return Tile('hospital wall', blocked=True, opaque=True)
-        return self.tiles[x][y]
+            return OUT_OF_BOUNDS_TILE
+        return TileView(self, x * self.stride + y + self.offset)
 
     def __setitem__(self, key, value):
         x, y = key
-        if x < 0 or x >= self.width or y < 0 or y >= self.height:
-            raise IndexError("Out of map bounds")
-        self.tiles[x][y] = value
+        type_id = get_tile_type_id(value.name, value.blocked, value.opaque)
+        self.set_tile(x, y, type_id, value.room_id, value.explored)
 
     def __contains__(self, xy):
         x, y = xy
@@ -159,17 +362,17 @@ class World(object):
         self.levels = levels
         self.player = mob.Player(levels[0].up_stairs_pos, 0, player_info)
         self.levels[0].mobs[levels[0].up_stairs_pos] = self.player
-        events.events.add_callback(
-            events.EventType.MOVE, self.handle_move_event, priority=2)
+        self.subscription = events.events.add_callback(
+            events.EventType.MOVE, self.handle_move_event, priority=2,
+            immediate=True)
 
     def handle_move_event(self, event):
         prev_pos = event.info.prev_pos
         mob = event.info.mob
         self.levels[mob.dlevel].move_mob(prev_pos, mob.pos)
 
-    def __del__(self):
-        events.events.remove_callback(
-            events.EventType.MOVE, self.handle_move_event)
+    def close(self):
+        self.subscription.close()
 
 
 def generate_world():
@@ -180,9 +383,9 @@ def generate_world():
 def populate_level(num, level):
     # generate a few groups of mobs
     for i in range(10):
-        faction = random.choice(list(factions.keys()))
+        faction = rng.generation.choice(list(factions.keys()))
         groups = factions[faction]['groups']
-        group = random.choice(groups)
+        group = rng.generation.choice(groups)
 
         # spawn leader at pos, spawn rest of mobs within fov
         leader_info = mobinfo[group[0]]
@@ -192,7 +395,7 @@ def populate_level(num, level):
                                      fov.calculate_fov(leader_pos, 5, level)))
         for mob_type in group[1:]:
             info = mobinfo[mob_type]
-            pos = random.choice(tiles_in_sight)
+            pos = rng.generation.choice(tiles_in_sight)
             tiles_in_sight.remove(pos)
             level.mobs[pos] = mob.Mob(pos, num, info, leader=leader)
 
@@ -230,27 +433,25 @@ def mul(vec, scalar):
 def floors_in_or_by_rect(level, rect):
     for x in range(rect.left - 1, rect.right + 2):
         for y in range(rect.top - 1, rect.bottom + 2):
-            if level[x, y].name != 'hospital wall':
+            if level.get_tile_type(x, y) != HOSPITAL_WALL:
                 return True
     return False
 
 
 def reveal_tile(level, pos):
-    events.events.handle_event(
-        events.Event(
-            events.EventType.TILE_REVEALED,
-            TileInfo(pos,
-                     level[pos],
-                     level.get_mob(pos),
-                     level.get_object(pos))))
+    # a batch of one, so that whoever tracks what the player has seen
+    # hears about it the same way as an FOV update
+    events.events.send(
+        events.Event(events.EventType.TILES_REVEALED,
+                     TilesInfo(level, [level.index(*pos)])))
 
 
 def dig(level, x, y, room_id=0):
-    level[x, y] = Tile('tile floor', room_id=room_id)
+    level.set_tile(x, y, TILE_FLOOR, room_id=room_id)
 
 
 def undig(level, x, y):
-    level[x, y] = Tile('hospital wall', blocked=True, opaque=True)
+    level.set_tile(x, y, HOSPITAL_WALL)
 
 
 class Rect(object):
@@ -270,9 +471,9 @@ def rect_in_level(level, rect):
 def try_to_dig_room(level, entrance, direction, dim1=None, dim2=None,
                     name=None):
     if dim1 is None:
-        dim1 = random.randint(2, 5)
+        dim1 = rng.generation.randint(2, 5)
     if dim2 is None:
-        dim2 = random.randint(2, 5)
+        dim2 = rng.generation.randint(2, 5)
     perp1 = rotated90(direction)
     perp2 = rotated270(direction)
     corner1 = add(add(entrance, direction), mul(perp1, dim2 // 2))
@@ -333,8 +534,8 @@ def flood_fill(level, x, y):
 def get_random_passable_position(level):
     pos = Pos(-1, -1)
     while level.is_blocked(pos):
-        x = random.randint(1, level.width - 1)
-        y = random.randint(1, level.height - 1)
+        x = rng.generation.randint(1, level.width - 1)
+        y = rng.generation.randint(1, level.height - 1)
         pos = Pos(x, y)
     return pos
 
@@ -389,18 +590,18 @@ def try_to_dig_hospital_room(level, entrance, direction):
 
         # populate the room with items
         for i in range(3):
-            x = random.randint(rect.left, rect.right)
-            y = random.randint(rect.top, rect.bottom)
+            x = rng.generation.randint(rect.left, rect.right)
+            y = rng.generation.randint(rect.top, rect.bottom)
             pos = Pos(x, y)
             items = ("apple", "banana", "peas", "hospital mush", "peanuts",
                      "almonds", "pregnancy test", "cabinet", "inhaler")
             weights = (30, 30, 40, 30, 50, 45, 0.1, 150, 40)
             if not level.get_object(pos):
-                name = random.choices(items, weights=weights)[0]
+                name = rng.generation.choices(items, weights=weights)[0]
                 item = create_object(pos, name)
                 if name == 'cabinet':
-                    for j in range(random.randint(0, 3)):
-                        name2 = random.choice(items)
+                    for j in range(rng.generation.randint(0, 3)):
+                        name2 = rng.generation.choice(items)
                         if name2 != 'cabinet':
                             item.contents.append(
                                 create_object(pos, name2))
@@ -417,11 +618,11 @@ def generate_hospital():
     direction = Pos(1, 0)
     walls = []
     for i in range(12):
-        direction = random.choice((
+        direction = rng.generation.choice((
             rotated90(direction), rotated270(direction)))
         right = rotated90(direction)
         left = rotated270(direction)
-        for num in range(random.randint(10, 15)):
+        for num in range(rng.generation.randint(10, 15)):
             pos += direction
             pos2 = pos + right
             dig(level, pos.x, pos.y)
@@ -445,12 +646,12 @@ def generate_hospital():
 
     for name in important:
         pos = Pos(
-            random.randint(0, width - 1),
-            random.randint(0, height - 1))
+            rng.generation.randint(0, width - 1),
+            rng.generation.randint(0, height - 1))
         while level.is_blocked(pos) or level.get_object(pos):
             pos = Pos(
-                random.randint(0, width - 1),
-                random.randint(0, height - 1))
+                rng.generation.randint(0, width - 1),
+                rng.generation.randint(0, height - 1))
         level.objects[pos] = create_object(pos, name)
 
     # up stairs